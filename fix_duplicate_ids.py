@@ -3,9 +3,15 @@
 修复materials.json中重复的ID问题
 """
 import json
+import os
+import sys
 import uuid
 from collections import defaultdict
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.knowledge.local_kb import LocalKnowledgeBase
+
 def generate_unique_id():
     """生成12位的唯一ID"""
     return str(uuid.uuid4()).replace('-', '')[:12]
@@ -13,6 +19,12 @@ def generate_unique_id():
 def fix_duplicate_ids(file_path):
     """修复JSON文件中的重复ID"""
 
+    # 知识库的修改先追加在 materials.jsonl 日志中，先合并回快照再读取；
+    # 否则改写后的快照上还会回放旧日志
+    if not LocalKnowledgeBase(os.path.dirname(file_path)).compact():
+        print(f"合并知识库日志失败，未修改文件: {file_path}")
+        return
+
     # 读取原始文件
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
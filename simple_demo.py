@@ -68,8 +68,20 @@ class SimpleKnowledgeBase:
         self.essays_file = os.path.join(knowledge_path, "essays.json")
 
         os.makedirs(knowledge_path, exist_ok=True)
+        self._compact_logs()
         self._init_data_files()
 
+    def _compact_logs(self):
+        """主系统的知识库把修改先追加到 .jsonl 日志，这里直接读写快照，先把日志合并回快照"""
+        if not any(os.path.exists(os.path.splitext(path)[0] + ".jsonl")
+                   for path in (self.materials_file, self.essays_file)):
+            return
+        try:
+            from src.knowledge.local_kb import LocalKnowledgeBase
+            LocalKnowledgeBase(self.knowledge_path).compact()
+        except ImportError:
+            print("⚠️ 知识库存在未合并的日志，演示读取的快照可能不是最新数据")
+
     def _init_data_files(self):
         if not os.path.exists(self.materials_file):
             with open(self.materials_file, 'w', encoding='utf-8') as f:
@@ -4,10 +4,12 @@ FastAPI 应用程序
 """
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any, List
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Iterator
 from pydantic import BaseModel
 import sys
 import os
+import json
 
 # 添加项目根目录到 Python 路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -79,6 +81,13 @@ async def startup_event():
         logger.error(f"RAG 系统初始化失败: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时释放异步连接并合并知识库日志"""
+    if rag_system is not None:
+        await rag_system.aclose()
+
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -108,6 +117,57 @@ async def health_check():
         }
 
 
+def _build_rag_request(request: EssayPromptRequest) -> RAGRequest:
+    """由接口请求构建 RAG 请求"""
+    prompt = EssayPrompt(
+        title=request.title,
+        description=request.description,
+        essay_type=EssayType(request.essay_type),
+        difficulty_level=DifficultyLevel(request.difficulty_level),
+        keywords=request.keywords,
+        requirements=request.requirements,
+        word_count=request.word_count
+    )
+
+    return RAGRequest(
+        prompt=prompt,
+        user_requirements=request.user_requirements
+    )
+
+
+def _format_response(response: RAGResponse) -> Dict[str, Any]:
+    """格式化 RAG 响应"""
+    return {
+        "success": True,
+        "guidance": {
+            "theme_analysis": response.guidance.theme_analysis,
+            "structure_suggestion": response.guidance.structure_suggestion,
+            "writing_tips": response.guidance.writing_tips,
+            "key_points": response.guidance.key_points,
+            "reference_materials": [
+                {
+                    "title": material.title,
+                    "content": material.content,
+                    "category": material.category
+                }
+                for material in response.guidance.reference_materials
+            ],
+            "sample_essays": [
+                {
+                    "title": essay.title,
+                    "content": essay.content,
+                    "type": essay.essay_type.value,
+                    "highlights": essay.highlights
+                }
+                for essay in response.guidance.sample_essays
+            ]
+        },
+        "confidence_score": response.confidence_score,
+        "retrieval_info": response.retrieval_info,
+        "generation_info": response.generation_info
+    }
+
+
 @app.post("/generate-guidance")
 async def generate_guidance(request: EssayPromptRequest) -> Dict[str, Any]:
     """生成作文指导"""
@@ -115,58 +175,44 @@ async def generate_guidance(request: EssayPromptRequest) -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail="RAG 系统未初始化")
 
     try:
-        # 构建作文题目
-        prompt = EssayPrompt(
-            title=request.title,
-            description=request.description,
-            essay_type=EssayType(request.essay_type),
-            difficulty_level=DifficultyLevel(request.difficulty_level),
-            keywords=request.keywords,
-            requirements=request.requirements,
-            word_count=request.word_count
-        )
+        response = await rag_system.aprocess_request(_build_rag_request(request))
+        return _format_response(response)
+    except Exception as e:
+        logger.error(f"生成指导失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # 构建 RAG 请求
-        rag_request = RAGRequest(
-            prompt=prompt,
-            user_requirements=request.user_requirements
-        )
 
-        # 处理请求
-        response = rag_system.process_request(rag_request)
+@app.post("/generate-guidance/stream")
+async def generate_guidance_stream(request: EssayPromptRequest) -> StreamingResponse:
+    """流式生成作文指导（SSE）
 
-        return {
-            "success": True,
-            "guidance": {
-                "theme_analysis": response.guidance.theme_analysis,
-                "structure_suggestion": response.guidance.structure_suggestion,
-                "writing_tips": response.guidance.writing_tips,
-                "key_points": response.guidance.key_points,
-                "reference_materials": [
-                    {
-                        "title": material.title,
-                        "content": material.content,
-                        "category": material.category
-                    }
-                    for material in response.guidance.reference_materials
-                ],
-                "sample_essays": [
-                    {
-                        "title": essay.title,
-                        "content": essay.content,
-                        "type": essay.essay_type.value,
-                        "highlights": essay.highlights
-                    }
-                    for essay in response.guidance.sample_essays
-                ]
-            },
-            "confidence_score": response.confidence_score,
-            "retrieval_info": response.retrieval_info,
-            "generation_info": response.generation_info
-        }
+    先推送若干 token 事件（模型增量输出），最后推送 guidance 事件（完整结果）。
+    """
+    if rag_system is None:
+        raise HTTPException(status_code=500, detail="RAG 系统未初始化")
+
+    try:
+        rag_request = _build_rag_request(request)
     except Exception as e:
-        logger.error(f"生成指导失败: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def event_stream() -> Iterator[str]:
+        try:
+            for event in rag_system.process_request_stream(rag_request):
+                if event["type"] == "token":
+                    name, data = "token", {"content": event["content"]}
+                else:
+                    name, data = "guidance", _format_response(event["response"])
+                yield f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"流式生成指导失败: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.post("/add-material")
@@ -7,8 +7,8 @@ from .models import (
     SampleEssay, WritingGuidance, RAGRequest, RAGResponse, DocumentChunk
 )
 from .utils import (
-    setup_logger, generate_id, clean_text, segment_chinese_text,
-    extract_keywords, calculate_similarity, chunk_text,
+    setup_logger, log_enabled, generate_id, clean_text, segment_chinese_text, cut_words,
+    extract_keywords, calculate_similarity, jaccard_similarity, chunk_text,
     load_json_file, save_json_file, read_text_file, write_text_file,
     validate_essay_prompt, format_guidance_output
 )
@@ -20,8 +20,8 @@ __all__ = [
     'EssayType', 'DifficultyLevel', 'EssayPrompt', 'WritingMaterial',
     'SampleEssay', 'WritingGuidance', 'RAGRequest', 'RAGResponse', 'DocumentChunk',
     # 工具
-    'setup_logger', 'generate_id', 'clean_text', 'segment_chinese_text',
-    'extract_keywords', 'calculate_similarity', 'chunk_text',
+    'setup_logger', 'log_enabled', 'generate_id', 'clean_text', 'segment_chinese_text', 'cut_words',
+    'extract_keywords', 'calculate_similarity', 'jaccard_similarity', 'chunk_text',
     'load_json_file', 'save_json_file', 'read_text_file', 'write_text_file',
     'validate_essay_prompt', 'format_guidance_output'
 ]
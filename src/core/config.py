@@ -21,29 +21,48 @@ class Settings(BaseSettings):
 
     # LLM 配置
     llm_provider: str = Field("doubao", env="LLM_PROVIDER")  # openai, doubao
+    llm_max_tokens: int = Field(1500, env="LLM_MAX_TOKENS")  # 单次生成的最大输出 token 数
+    # 异步生成时并发请求的合并窗口（毫秒，0 表示不合并）和每批最多的不同请求数
+    llm_batch_wait_ms: int = Field(20, env="LLM_BATCH_WAIT_MS")
+    llm_batch_max_size: int = Field(8, env="LLM_BATCH_MAX_SIZE")
 
     # OpenAI 配置
     openai_api_key: str = Field("", env="OPENAI_API_KEY")  # 允许为空，用于测试
     openai_base_url: str = Field("https://api.openai.com/v1", env="OPENAI_BASE_URL")
+    openai_model: str = Field("gpt-4o-mini", env="OPENAI_MODEL")  # 需支持 json_schema 结构化输出
 
     # 火山引擎豆包 配置
     doubao_api_key: str = Field("ecaff6b2-54e0-413c-8b16-d030a781ffbf", env="DOUBAO_API_KEY")
     doubao_endpoint: str = Field("https://ark.cn-beijing.volces.com/api/v3", env="DOUBAO_ENDPOINT")  # 例如:
     doubao_model: str = Field("doubao-seed-2-0-mini-260215", env="DOUBAO_MODEL")  # 模型名称
 
+    # LLM 响应缓存配置（为空时使用进程内缓存）
+    llm_cache_redis_url: str = Field("", env="LLM_CACHE_REDIS_URL")  # 例如: redis://localhost:6379/0
+
     # 嵌入模型配置
     embedding_model: str = Field(
         "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
         env="EMBEDDING_MODEL"
     )
     embedding_device: str = Field("cpu", env="EMBEDDING_DEVICE")
+    # 按文本内容把嵌入向量缓存到向量数据库目录，重启后重新索引时跳过未变化的文档
+    embedding_cache: bool = Field(True, env="EMBEDDING_CACHE")
 
     # 向量数据库配置
     vector_db_type: str = Field("chroma", env="VECTOR_DB_TYPE")
     vector_db_path: str = Field("./data/vectordb", env="VECTOR_DB_PATH")
+    # 内存向量存储的向量格式：none（float32）或 int8（占用约 1/4，相似度有微小误差）
+    vector_quantization: str = Field("none", env="VECTOR_QUANTIZATION")
+    # 内存向量存储的检索方式：flat（精确）、hnsw（faiss 近似最近邻，适合大规模知识库）
+    # 或 auto（文档块较少时精确打分，达到 1000 个后使用 hnsw）
+    vector_index: str = Field("auto", env="VECTOR_INDEX")
 
     # 知识库配置
     knowledge_base_path: str = Field("./data/knowledge", env="KNOWLEDGE_BASE_PATH")
+    # 知识库检索后端：local（内置相似度打分）或 whoosh（BM25 倒排索引，需安装 whoosh）
+    knowledge_base_backend: str = Field("local", env="KNOWLEDGE_BASE_BACKEND")
+    # 知识库检索的近似查询缓存（使用 embedding_model 编码查询，语料较大时收益明显）
+    knowledge_semantic_cache: bool = Field(False, env="KNOWLEDGE_SEMANTIC_CACHE")
     sample_essays_path: str = Field("./data/essays", env="SAMPLE_ESSAYS_PATH")
 
     # API 服务配置
@@ -2,6 +2,7 @@
 数据模型定义
 定义系统中使用的数据结构
 """
+import uuid
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from pydantic import BaseModel, Field
@@ -98,7 +99,8 @@ class RAGResponse(BaseModel):
 
 class DocumentChunk(BaseModel):
     """文档块模型"""
-    id: Optional[str] = None
+    # 未指定时生成随机ID，写入向量数据库时不会与其他批次的文档块冲突
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, description="文档块ID")
     content: str = Field(..., description="文档内容")
     metadata: Dict[str, Any] = Field(default={}, description="元数据")
     embedding: Optional[List[float]] = Field(None, description="向量嵌入")
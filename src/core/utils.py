@@ -3,12 +3,26 @@
 提供系统通用的工具函数
 """
 import os
-import json
+import functools
 import hashlib
-import jieba
-from typing import List, Dict, Any, Optional
+import mmap
+import orjson
+from typing import AbstractSet, List, Dict, Any, Optional, Tuple
 from loguru import logger
 
+# jieba_fast 是 jieba 的 C 扩展实现，接口相同、分词结果一致
+try:
+    import jieba_fast as jieba
+    import jieba_fast.analyse
+    JIEBA_FAST_AVAILABLE = True
+except ImportError:
+    import jieba
+    import jieba.analyse
+    JIEBA_FAST_AVAILABLE = False
+
+# 分词结果缓存的条目数：题目、素材标题和正文在检索时会被反复分词
+SEGMENT_CACHE_SIZE = 4096
+
 
 def setup_logger(log_file: str = "./logs/app.log", log_level: str = "INFO"):
     """设置日志配置"""
@@ -32,6 +46,11 @@ def setup_logger(log_file: str = "./logs/app.log", log_level: str = "INFO"):
     )
 
 
+def log_enabled(level: str) -> bool:
+    """当前是否有日志处理器会输出该级别的日志，用于跳过只为记录日志而做的循环和格式化"""
+    return logger._core.min_level <= logger.level(level).no
+
+
 def generate_id(content: str) -> str:
     """根据内容生成唯一ID"""
     return hashlib.md5(content.encode('utf-8')).hexdigest()[:12]
@@ -74,7 +93,13 @@ def clean_text(text: str) -> str:
 # # 可能输出：['我', '爱', '自然语言', '处理']
 def segment_chinese_text(text: str) -> List[str]:
     """中文分词"""
-    return list(jieba.cut(text))
+    return list(cut_words(text))
+
+
+@functools.lru_cache(maxsize=SEGMENT_CACHE_SIZE)
+def cut_words(text: str) -> Tuple[str, ...]:
+    """带缓存的中文分词，返回不可变的词元组，同一文本只分词一次"""
+    return tuple(jieba.cut(text))
 
 
 # 原理简介
@@ -96,8 +121,6 @@ def segment_chinese_text(text: str) -> List[str]:
 # # 输出类似：['人工智能', '机器学习', '深度学习']
 def extract_keywords(text: str, top_k: int = 10) -> List[str]:
     """提取关键词"""
-    import jieba.analyse
-
     # 使用 TF-IDF 提取关键词
     keywords = jieba.analyse.extract_tags(text, topK=top_k, withWeight=False)
     return keywords
@@ -108,13 +131,17 @@ def calculate_similarity(text1: str, text2: str) -> float:
     if not text1 or not text2:
         return 0.0
 
-    words1 = set(segment_chinese_text(text1))
-    words2 = set(segment_chinese_text(text2))
+    words1 = set(cut_words(text1))
+    words2 = set(cut_words(text2))
+
+    return jaccard_similarity(words1, words2)
+
 
+def jaccard_similarity(words1: AbstractSet[str], words2: AbstractSet[str]) -> float:
+    """计算两个词集合的 Jaccard 相似度（可直接传入预先分好词的集合）"""
     if not words1 or not words2:
         return 0.0
 
-    # 计算 Jaccard 相似度
     intersection = words1 & words2
     union = words1 | words2
 
@@ -157,6 +184,46 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]
     return chunks
 
 
+# 写文件使用的缓冲区大小，序列化结果一次写出
+_WRITE_BUFFER_SIZE = 1 << 20
+
+
+# 不小于该大小的JSON文件通过 mmap 解析，更小的文件直接读入（映射的开销反而更大）
+MMAP_MIN_BYTES = 64 << 10
+
+
+def read_file_bytes(file_path: str) -> bytes:
+    """按文件大小一次读入全部内容（不经过Python层缓冲）"""
+    with open(file_path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            # 大小未知（如管道、虚拟文件）时直接读到结尾
+            return f.readall()
+        data = f.read(size)
+        # 短读时补读剩余部分
+        if len(data) < size:
+            data += f.readall()
+        return data
+
+
+def prefetch_file(file_path: str):
+    """提示内核在后台预读整个文件（posix_fadvise WILLNEED），调用立即返回
+
+    冷启动时先对随后要 mmap 访问的大文件发出预读，磁盘读取与其他初始化工作重叠；
+    不支持该调用的平台上什么也不做。
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
 def load_json_file(file_path: str) -> Optional[Dict[str, Any]]:
     """加载JSON文件"""
     if not os.path.exists(file_path):
@@ -164,8 +231,17 @@ def load_json_file(file_path: str) -> Optional[Dict[str, Any]]:
         return None
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(file_path, 'rb', buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < MMAP_MIN_BYTES:
+                return orjson.loads(f.readall())
+            # 大文件映射到内存后直接解析，省去一次整文件复制
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # 解析器顺序扫描整个文件，让内核加大预读
+                if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
     except Exception as e:
         logger.error(f"加载JSON文件失败 {file_path}: {e}")
         return None
@@ -173,13 +249,22 @@ def load_json_file(file_path: str) -> Optional[Dict[str, Any]]:
 
 def save_json_file(data: Dict[str, Any], file_path: str) -> bool:
     """保存JSON文件"""
+    tmp_path = file_path + '.tmp'
     try:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # 先完整写入临时文件并落盘，再原子替换，写入中途失败不会损坏原文件
+        with open(tmp_path, 'wb', buffering=_WRITE_BUFFER_SIZE) as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
         return True
     except Exception as e:
         logger.error(f"保存JSON文件失败 {file_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
         return False
 
 
@@ -190,8 +275,11 @@ def read_text_file(file_path: str) -> Optional[str]:
         return None
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        text = read_file_bytes(file_path).decode('utf-8')
+        # 与文本模式读取一致，统一换行符
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
     except Exception as e:
         logger.error(f"读取文本文件失败 {file_path}: {e}")
         return None
@@ -201,8 +289,8 @@ def write_text_file(content: str, file_path: str) -> bool:
     """写入文本文件"""
     try:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        with open(file_path, 'wb', buffering=_WRITE_BUFFER_SIZE) as f:
+            f.write(content.encode('utf-8'))
         return True
     except Exception as e:
         logger.error(f"写入文本文件失败 {file_path}: {e}")
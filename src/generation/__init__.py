@@ -2,7 +2,9 @@
 生成模块
 """
 from .llm_generator import LLMGenerator
+from .batch import BatchProcessor
 
 __all__ = [
-    'LLMGenerator'
+    'LLMGenerator',
+    'BatchProcessor'
 ]
@@ -0,0 +1,192 @@
+"""
+批量生成
+离线为大量作文题目生成写作指导：有批处理接口时走批处理接口，否则使用限流的异步并发池
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+import orjson
+from loguru import logger
+
+from ..core.config import settings
+from ..core.models import EssayPrompt, WritingGuidance
+from .llm_generator import LLMGenerator, OPENAI_RESPONSE_FORMAT, STOP_SEQUENCES
+
+try:
+    from aiolimiter import AsyncLimiter
+    AIOLIMITER_AVAILABLE = True
+except ImportError:
+    AIOLIMITER_AVAILABLE = False
+
+try:
+    import openai
+    OPENAI_SDK_AVAILABLE = True
+except ImportError:
+    OPENAI_SDK_AVAILABLE = False
+
+# OpenAI 批处理任务的终止状态
+_BATCH_FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+class _TokenBucket:
+    """简单的异步令牌桶（aiolimiter 未安装时使用）"""
+
+    def __init__(self, max_rate: float, time_period: float = 60):
+        self.capacity = max_rate
+        self.rate = max_rate / time_period
+        self._tokens = max_rate
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return self
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class BatchProcessor:
+    """批量写作指导生成器"""
+
+    def __init__(
+        self,
+        generator: LLMGenerator,
+        max_concurrency: int = 10,
+        rate_limit: int = 100,
+        use_batch_api: bool = False,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        poll_interval: float = 30
+    ):
+        """
+        Args:
+            generator: 用于生成的 LLMGenerator
+            max_concurrency: 并发池的最大并发请求数
+            rate_limit: 每分钟最多发起的请求数
+            use_batch_api: 提供商支持时使用批处理接口（OpenAI Batch API，费用减半但异步完成）
+            on_progress: 进度回调 on_progress(已完成数, 总数)
+            poll_interval: 批处理任务的轮询间隔（秒）
+        """
+        self.generator = generator
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+        self.use_batch_api = use_batch_api
+        self.on_progress = on_progress
+        self.poll_interval = poll_interval
+
+    async def run_batch(self, prompts: List[EssayPrompt]) -> List[WritingGuidance]:
+        """批量生成，结果顺序与输入一致"""
+        if not prompts:
+            return []
+
+        if self.use_batch_api and self._batch_api_supported():
+            try:
+                return await asyncio.to_thread(self._run_openai_batch, prompts)
+            except Exception as e:
+                logger.error(f"OpenAI 批处理失败，改用并发池: {e}")
+
+        return await self._run_pool(prompts)
+
+    async def _run_pool(self, prompts: List[EssayPrompt]) -> List[WritingGuidance]:
+        """有界并发 + 令牌桶限流"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = AsyncLimiter(self.rate_limit, 60) if AIOLIMITER_AVAILABLE else _TokenBucket(self.rate_limit, 60)
+        total = len(prompts)
+        done = 0
+
+        async def worker(prompt: EssayPrompt) -> WritingGuidance:
+            nonlocal done
+            async with semaphore:
+                async with limiter:
+                    guidance = await self.generator.agenerate_guidance(prompt)
+            done += 1
+            self._report_progress(done, total)
+            return guidance
+
+        return list(await asyncio.gather(*(worker(p) for p in prompts)))
+
+    def _batch_api_supported(self) -> bool:
+        if self.generator.provider != "openai" or self.generator.llm is None:
+            return False
+        if not OPENAI_SDK_AVAILABLE:
+            logger.warning("openai SDK 未安装，无法使用批处理接口")
+            return False
+        return True
+
+    def _run_openai_batch(self, prompts: List[EssayPrompt]) -> List[WritingGuidance]:
+        """通过 OpenAI Batch API 提交 JSONL 任务并轮询结果"""
+        client = openai.OpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
+        system_prompt = self.generator._build_system_prompt()
+
+        lines = []
+        for i, prompt in enumerate(prompts):
+            user_prompt = self.generator._build_user_prompt(prompt, [], [], "")
+            lines.append(orjson.dumps({
+                "custom_id": f"prompt-{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.generator.llm.model_name,
+                    "messages": self.generator._build_chat_messages(system_prompt, user_prompt),
+                    "temperature": self.generator.temperature,
+                    "max_tokens": self.generator.max_tokens,
+                    "stop": STOP_SEQUENCES,
+                    "response_format": OPENAI_RESPONSE_FORMAT,
+                    "prompt_cache_key": self.generator._prompt_cache_key(prompt, [], [])
+                }
+            }))
+
+        batch_file = client.files.create(file=("guidance_batch.jsonl", b"\n".join(lines)), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        logger.info(f"已提交 OpenAI 批处理任务: {batch.id}（{len(prompts)} 个题目）")
+
+        while batch.status not in _BATCH_FINAL_STATES:
+            time.sleep(self.poll_interval)
+            batch = client.batches.retrieve(batch.id)
+            if batch.request_counts is not None:
+                self._report_progress(batch.request_counts.completed, len(prompts))
+
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"批处理任务未完成: {batch.status}")
+
+        responses: Dict[str, str] = {}
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            body = (record.get("response") or {}).get("body") or {}
+            choices = body.get("choices") or []
+            if choices:
+                responses[record["custom_id"]] = choices[0]["message"]["content"]
+
+        results = []
+        for i, prompt in enumerate(prompts):
+            response_text = responses.get(f"prompt-{i}")
+            if response_text:
+                results.append(self.generator._parse_llm_response(response_text, [], []))
+            else:
+                logger.warning(f"批处理结果缺失: {prompt.title}，使用模拟生成")
+                results.append(self.generator._generate_mock_guidance(prompt, [], []))
+
+        self._report_progress(len(prompts), len(prompts))
+        return results
+
+    def _report_progress(self, done: int, total: int):
+        if self.on_progress is None:
+            return
+        try:
+            self.on_progress(done, total)
+        except Exception as e:
+            logger.error(f"进度回调失败: {e}")
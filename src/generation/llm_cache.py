@@ -0,0 +1,125 @@
+"""
+LLM 响应精确缓存
+对确定性调用（temperature≈0）按请求内容哈希缓存响应文本，支持内存与 Redis 后端
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from ..core.config import settings
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# 温度不高于该值时视为确定性调用，才启用精确缓存
+DETERMINISTIC_TEMPERATURE = 0.05
+
+
+class InMemoryLRU:
+    """进程内 LRU 缓存后端"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.time() >= expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        with self._lock:
+            expires_at = time.time() + ttl if ttl else None
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class RedisBackend:
+    """Redis 缓存后端，多个工作进程可共享命中"""
+
+    def __init__(self, url: str, prefix: str = "llm_cache:"):
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        self.client.set(self.prefix + key, value.encode("utf-8"), ex=ttl)
+
+
+class LLMCache:
+    """LLM 响应精确缓存"""
+
+    def __init__(self, backend: Any = None):
+        self.backend = backend if backend is not None else InMemoryLRU()
+
+    @classmethod
+    def from_settings(cls) -> "LLMCache":
+        """根据配置创建缓存，配置了 Redis 地址时使用 Redis 后端"""
+        if settings.llm_cache_redis_url:
+            if REDIS_AVAILABLE:
+                try:
+                    return cls(RedisBackend(settings.llm_cache_redis_url))
+                except Exception as e:
+                    logger.error(f"Redis 缓存初始化失败: {e}")
+            else:
+                logger.warning("redis 未安装，LLM缓存使用内存后端")
+        return cls()
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None
+    ) -> str:
+        """由模型、消息、温度、最大长度和停止序列生成缓存键
+
+        max_tokens 和 stop 会截断输出，参数不同的调用不能共用同一条缓存响应
+        """
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "stop": list(stop) if stop else None
+            },
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.error(f"读取LLM缓存失败: {e}")
+            return None
+
+    def set(self, key: str, value: str, ttl: Optional[int] = 14400):
+        try:
+            self.backend.set(key, value, ttl=ttl)
+        except Exception as e:
+            logger.error(f"写入LLM缓存失败: {e}")
@@ -3,13 +3,25 @@ LLM 生成器
 支持多种大语言模型API：OpenAI、火山引擎豆包
 """
 import os
-import json
+import re
+import time
+import hashlib
+import asyncio
+import threading
+import weakref
+import orjson
 import requests
-from typing import List, Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Dict, Any, Optional, Iterator
 from loguru import logger
 
 from ..core.models import EssayPrompt, WritingMaterial, SampleEssay, WritingGuidance
 from ..core.config import settings
+from .semantic_cache import SemanticCache
+from .llm_cache import LLMCache, DETERMINISTIC_TEMPERATURE
+from .prompt_builder import build_user_prompt
+from .request_batcher import RequestBatcher
 
 try:
     from langchain_openai import ChatOpenAI
@@ -19,49 +31,546 @@ except ImportError:
     LANGCHAIN_AVAILABLE = False
     logger.warning("langchain 相关库未安装，OpenAI功能不可用")
 
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+    logger.warning("httpx 未安装，异步生成将退化为线程池中的同步调用")
+
+try:
+    import json5
+    JSON5_AVAILABLE = True
+except ImportError:
+    JSON5_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# markdown 代码块中的JSON
+_JSON_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+
+# 流式输出时每攒够多少个增量片段推送一次
+STREAM_FLUSH_TOKENS = 8
+
+# 系统提示和固定的生成要求每次调用都逐字节相同，放在消息列表最前面构成稳定前缀，
+# 使提供商的自动提示缓存能够命中；检索到的素材等动态内容放在最后一条消息中
+SYSTEM_PROMPT = """你是一位经验丰富的语文老师和写作指导专家，专门为学生提供作文写作指导。
+
+你的任务是根据给定的作文题目，**充分利用并具体指导如何使用提供的写作素材和范文**，生成详细的写作指导。
+
+**重要要求**：
+1. **必须具体说明如何运用每个提供的素材** - 不能只是列出素材标题，要说明在文章的哪个部分、如何使用
+2. **必须分析范文的优秀写法** - 指出范文的结构特点、表达技巧，并建议学生如何借鉴
+3. **要建立素材与写作技巧的具体联系** - 说明某个素材适合用来论证哪个观点、表达哪种情感
+4. **提供可操作的具体建议** - 避免空泛的指导，要给出学生能直接运用的方法
+
+请按照以下JSON格式返回结果（字段名使用缩写）：
+
+```json
+{
+  "ta": "主题分析：作文题目的核心主题和写作要求，结合素材说明写作方向",
+  "ss": ["开头：如何开头，运用哪个素材或借鉴哪篇范文", "主体：分段安排及各段运用的素材", "结尾：如何升华主题"],
+  "wt": ["结合素材的写作技巧", "从范文中学到的表达方法", "针对题目特点的技巧"],
+  "kp": ["结合素材的重点内容", "从范文中总结的要点", "特殊注意事项"],
+  "mu": ["【素材名称】: 用在哪个位置、怎么用", "【范文借鉴】: 借鉴什么、怎么用"],
+  "ce": ["运用素材的句子或段落示例", "范文中值得学习的表达"]
+}
+```
+
+字段含义：ta=主题分析，ss=结构建议，wt=写作技巧，kp=要点提示，mu=素材和范文使用建议，ce=具体示例。
+
+请确保你的指导：
+- **素材运用具体化**：明确说明每个素材的使用方法和位置
+- **范文借鉴实用化**：分析范文的优点并转化为可操作的建议
+- **技巧说明详细化**：不只说"要生动"，要说"怎样生动"
+- **示例说明具体化**：提供具体的表达示例
+- 适合目标难度等级的学生
+- **简洁**：ta 不超过150字，每个列表项不超过25个汉字
+
+请严格按照上述JSON格式返回，不要添加其他内容。"""
+
+# 输出JSON的缩写字段名 -> 完整字段名（完整字段名同样可被解析）
+_KEY_MAP = {
+    "ta": "theme_analysis",
+    "ss": "structure_suggestions",
+    "wt": "writing_techniques",
+    "kp": "key_points",
+    "mu": "material_usage",
+    "ce": "concrete_examples"
+}
+
+# OpenAI 结构化输出：按固定 JSON Schema 约束输出，响应一定是合法JSON
+_GUIDANCE_SCHEMA = {
+    "name": "writing_guidance",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "ta": {"type": "string"},
+            "ss": {"type": "array", "items": {"type": "string"}},
+            "wt": {"type": "array", "items": {"type": "string"}},
+            "kp": {"type": "array", "items": {"type": "string"}},
+            "mu": {"type": "array", "items": {"type": "string"}},
+            "ce": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": list(_KEY_MAP),
+        "additionalProperties": False
+    }
+}
+OPENAI_RESPONSE_FORMAT = {"type": "json_schema", "json_schema": _GUIDANCE_SCHEMA}
+
+# 生成停止序列：连续空行说明JSON已输出完毕
+# （不使用 ``` 作为停止序列，模型常以 ```json 开头输出，会被截断成空响应）
+STOP_SEQUENCES = ["\n\n\n"]
+
+# 文本解析：章节标题关键词 -> 章节名（按顺序匹配，关键词均为小写）
+_HEADER_MAP = {
+    "主题分析": "theme_analysis",
+    "theme_analysis": "theme_analysis",
+    "结构建议": "structure_suggestion",
+    "structure": "structure_suggestion",
+    "写作技巧": "writing_tips",
+    "writing_tips": "writing_tips",
+    "要点提示": "key_points",
+    "key_points": "key_points"
+}
+
+# 列表项前缀：-、•、* 或 "1."、"2、" 等编号
+_BULLET_RE = re.compile(r'^(?:[-•*]\s*|\d+[.、)]\s*)+')
+
+# 模拟生成的写作指导模板（按作文类型）
+_GUIDANCE_TEMPLATES = {
+    "narrative": {
+        "theme_analysis": "记叙文要求通过叙述事件来表达主题思想，注意情节的完整性和人物的生动性。",
+        "structure_suggestion": (
+            "开头：简要交代时间、地点、人物、事件",
+            "发展：详细叙述事件的经过，突出重点",
+            "高潮：事件的关键转折点",
+            "结尾：总结事件意义，点明主题"
+        ),
+        "writing_tips": (
+            "运用生动的描写手法，让读者有身临其境的感觉",
+            "合理安排叙述顺序，可采用倒叙、插叙等手法",
+            "注意详略得当，重点部分要详写",
+            "融入真情实感，使文章感人"
+        ),
+        "key_points": (
+            "确保事件的真实性和完整性",
+            "人物形象要鲜明立体",
+            "语言要生动形象，富有表现力",
+            "主题要明确，通过事件自然体现"
+        )
+    },
+    "argumentative": {
+        "theme_analysis": "议论文要求明确提出观点，并运用事实和道理进行论证，逻辑性要强。",
+        "structure_suggestion": (
+            "引论：提出问题，明确论点",
+            "本论：分层论证，举例说明",
+            "结论：总结论证，强调观点"
+        ),
+        "writing_tips": (
+            "论点要明确、正确、深刻",
+            "论据要典型、充分、有说服力",
+            "论证要严密、合理、有逻辑",
+            "语言要准确、鲜明、生动"
+        ),
+        "key_points": (
+            "开门见山，直接提出论点",
+            "选择有代表性的事例和名言",
+            "注意正反对比论证",
+            "结尾要有力，升华主题"
+        )
+    },
+    "expository": {
+        "theme_analysis": "说明文要求客观准确地说明事物的特征、原理或方法，语言要准确简洁。",
+        "structure_suggestion": (
+            "开头：概括介绍说明对象",
+            "主体：分条目或分方面说明",
+            "结尾：总结要点，强调意义"
+        ),
+        "writing_tips": (
+            "运用多种说明方法，如举例、对比、分类等",
+            "语言要准确、简洁、通俗易懂",
+            "结构要清晰，层次要分明",
+            "可适当使用图表、数据等辅助说明"
+        ),
+        "key_points": (
+            "抓住事物的本质特征",
+            "说明要科学准确",
+            "条理清楚，逻辑性强",
+            "语言平实，通俗易懂"
+        )
+    },
+    "general": {
+        "theme_analysis": "根据题目要求确定写作主题和表达目的，选择合适的写作方法。",
+        "structure_suggestion": (
+            "开头：引入主题，概括观点",
+            "主体：分层次展开内容",
+            "结尾：总结全文，深化主题"
+        ),
+        "writing_tips": (
+            "仔细审题，把握写作要求",
+            "选择合适的文体和表达方式",
+            "注意语言的准确性和生动性",
+            "结构要完整，逻辑要清晰"
+        ),
+        "key_points": (
+            "紧扣题目，不跑题",
+            "内容要充实具体",
+            "表达要清楚流畅",
+            "书写要工整美观"
+        )
+    }
+}
+
+# 素材分类，用于模拟生成时给出对应的使用建议
+_GROWTH_CATEGORIES = frozenset({"成长", "励志"})
+_EMOTION_CATEGORIES = frozenset({"情感", "友谊", "亲情"})
+_SOCIAL_CATEGORIES = frozenset({"科技", "社会", "环保"})
+
+STATIC_INSTRUCTIONS = """## 请生成指导
+
+下一条消息会给出作文题目信息、相关写作素材和参考范文，请基于这些信息为这个作文题目生成详细的写作指导。
+
+**重要要求**：
+1. **必须具体说明如何运用每个素材** - 在mu中写明在文章哪个部分运用《素材名》的哪个观点/事例
+2. **必须分析范文的借鉴价值** - 在mu中写明学习《范文名》的哪种写法、用在哪个部分
+3. **提供具体的表达示例** - 在ce中给出具体的句子示例
+4. **确保指导的可操作性** - 学生看了指导后能知道具体怎么做
+
+严格按照系统提示中的JSON格式返回结果，包含 ta、ss、wt、kp、mu、ce 六个字段。
+
+请确保返回的是有效的JSON格式，且每个字段都有实质性的、具体的内容。"""
+
+
+class CircuitBreaker:
+    """熔断器
+
+    连续 fail_max 次上游失败后进入熔断（open），reset_timeout 秒内直接拒绝调用；
+    到期后放行一次试探调用（half_open），成功则恢复（closed），失败则重新熔断。
+    试探调用没有结论就结束（被取消等）时调用 release，下一次调用重新试探；
+    试探调用超过 reset_timeout 仍未返回结论时，也放行新的试探，熔断不会一直卡在半开状态。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, fail_max: int = 5, reset_timeout: float = 30, name: str = "LLM API"):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        """是否允许发起调用；允许的调用之后必须调用 record_success、record_failure 或 release"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+                self._trial_started_at = now
+                return True
+            if self._state == self.HALF_OPEN and now - self._trial_started_at >= self.reset_timeout:
+                logger.warning(f"⚡ {self.name}试探调用超时未返回，重新试探")
+                self._trial_started_at = now
+                return True
+            # 熔断中，或半开状态下已有试探调用在进行
+            logger.debug(f"{self.name}熔断中，跳过调用")
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.fail_max:
+                self._opened_at = time.monotonic()
+                if self._state != self.OPEN:
+                    self._transition(self.OPEN)
+
+    def release(self):
+        """允许的调用没有得出成功或失败的结论就结束（被取消、本地异常等）
+
+        关闭状态下不计数；半开状态下退回熔断并立即允许下一次试探。
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def _transition(self, state: str):
+        """切换状态并记录日志（调用方需持有锁）"""
+        if state == self.OPEN:
+            logger.warning(f"⚡ {self.name}连续失败 {self._failures} 次，熔断 {self.reset_timeout} 秒")
+        elif state == self.HALF_OPEN:
+            logger.info(f"⚡ {self.name}熔断到期，放行一次试探调用")
+        else:
+            logger.info(f"⚡ {self.name}已恢复，关闭熔断")
+        self._state = state
+
 
 class DoubaoClient:
     """火山引擎豆包API客户端"""
 
-    def __init__(self, api_key: str, endpoint: str, model: str):
+    def __init__(self, api_key: str, endpoint: str, model: str, cache: Optional[LLMCache] = None):
         self.api_key = api_key
         self.endpoint = endpoint.rstrip('/')
         self.model = model
+        self.cache = cache
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {api_key}"
         }
+        # 同步请求复用连接（省去每次调用的 TCP/TLS 握手），限流和网关错误在传输层退避重试，
+        # 重试仍失败才计入熔断
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset({"POST"})
+        )
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # 上游持续故障时快速失败，由调用方走模拟生成，避免每个请求都等满超时
+        self.breaker = CircuitBreaker(fail_max=5, reset_timeout=30, name="豆包API")
+        # 异步客户端与事件循环绑定，每个事件循环一个；循环结束前由 aclose 关闭
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
 
-    def chat_completion(self, messages: List[Dict[str, str]], temperature: float = 0.7) -> str:
+    def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1500,
+        stop: Optional[List[str]] = None
+    ) -> str:
         """调用豆包聊天接口"""
+        allowed = settled = False
         try:
-            url = f"{self.endpoint}/chat/completions"
-
-            data = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": 4000,
-                "stream": False
-            }
+            cache_key, cached = self._lookup_cache(messages, temperature, max_tokens, stop)
+            if cached is not None:
+                return cached
+            if not self.breaker.allow():
+                return ""
+            allowed = True
 
-            response = requests.post(url, headers=self.headers, json=data, timeout=60)
+            response = self.session.post(
+                self._chat_url(),
+                json=self._build_payload(messages, temperature, max_tokens, stop),
+                timeout=60
+            )
             response.raise_for_status()
+            self.breaker.record_success()
+            settled = True
 
-            result = response.json()
+            return self._extract_content(response.json(), cache_key)
 
-            if "choices" in result and len(result["choices"]) > 0:
-                return result["choices"][0]["message"]["content"]
-            else:
-                logger.error(f"豆包API响应格式错误: {result}")
+        except requests.exceptions.RequestException as e:
+            self._record_http_error(getattr(e.response, "status_code", None))
+            settled = True
+            logger.error(f"豆包API调用失败: {e}")
+            return ""
+        except Exception as e:
+            logger.error(f"豆包API处理错误: {e}")
+            return ""
+        finally:
+            # 没有得出结论的调用也要交还熔断器，否则半开状态会一直拒绝调用
+            if allowed and not settled:
+                self.breaker.release()
+
+    async def achat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1500,
+        stop: Optional[List[str]] = None
+    ) -> str:
+        """异步调用豆包聊天接口，复用连接池以便并发请求"""
+        if not HTTPX_AVAILABLE:
+            return await asyncio.to_thread(self.chat_completion, messages, temperature, max_tokens, stop)
+
+        allowed = settled = False
+        try:
+            cache_key, cached = self._lookup_cache(messages, temperature, max_tokens, stop)
+            if cached is not None:
+                return cached
+            if not self.breaker.allow():
                 return ""
+            allowed = True
 
-        except requests.exceptions.RequestException as e:
+            client = self._get_async_client()
+            response = await client.post(
+                self._chat_url(),
+                json=self._build_payload(messages, temperature, max_tokens, stop)
+            )
+            response.raise_for_status()
+            self.breaker.record_success()
+            settled = True
+
+            return self._extract_content(response.json(), cache_key)
+
+        except httpx.HTTPError as e:
+            status_code = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            self._record_http_error(status_code)
+            settled = True
             logger.error(f"豆包API调用失败: {e}")
             return ""
         except Exception as e:
             logger.error(f"豆包API处理错误: {e}")
             return ""
+        finally:
+            # 被取消（客户端断开、wait_for 超时）或本地异常时交还熔断器，否则半开状态会一直拒绝调用
+            if allowed and not settled:
+                self.breaker.release()
+
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1500,
+        stop: Optional[List[str]] = None
+    ) -> Iterator[str]:
+        """流式调用豆包聊天接口，逐段产出增量文本"""
+        if not self.breaker.allow():
+            return
+
+        settled = False
+        try:
+            payload = self._build_payload(messages, temperature, max_tokens, stop)
+            payload["stream"] = True
+
+            with self.session.post(
+                self._chat_url(),
+                json=payload,
+                timeout=60,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                self.breaker.record_success()
+                settled = True
+
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+
+                    chunk = orjson.loads(data)
+                    for choice in chunk.get("choices", []):
+                        delta = choice.get("delta", {}).get("content")
+                        if delta:
+                            yield delta
+
+        except requests.exceptions.RequestException as e:
+            if not settled:
+                self._record_http_error(getattr(e.response, "status_code", None))
+                settled = True
+            logger.error(f"豆包流式API调用失败: {e}")
+        except Exception as e:
+            logger.error(f"豆包流式API处理错误: {e}")
+        finally:
+            # 未得到结论（如调用方提前停止迭代）时不计为失败，交还熔断器，避免半开状态卡住
+            if not settled:
+                self.breaker.release()
+
+    def _record_http_error(self, status_code: Optional[int]):
+        """连接错误、超时、429 和 5xx 计入熔断；其余 4xx 是请求本身的问题，不计入"""
+        if status_code is None or status_code == 429 or status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _chat_url(self) -> str:
+        return f"{self.endpoint}/chat/completions"
+
+    def _build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]]
+    ) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": False
+        }
+        if stop:
+            payload["stop"] = stop
+        return payload
+
+    def _lookup_cache(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]]
+    ):
+        """确定性调用先查精确缓存，返回 (缓存键, 缓存内容)"""
+        if self.cache is None or temperature > DETERMINISTIC_TEMPERATURE:
+            return None, None
+
+        cache_key = LLMCache.make_key(self.model, messages, temperature, max_tokens, stop)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.info("♻️ 命中LLM精确缓存，跳过豆包API调用")
+        return cache_key, cached
+
+    def _extract_content(self, result: Dict[str, Any], cache_key: Optional[str]) -> str:
+        """从接口响应中提取文本，并写入精确缓存"""
+        if "choices" in result and len(result["choices"]) > 0:
+            content = result["choices"][0]["message"]["content"]
+            if cache_key and content:
+                self.cache.set(cache_key, content, ttl=14400)
+            return content
+        else:
+            logger.error(f"豆包API响应格式错误: {result}")
+            return ""
+
+    def _get_async_client(self) -> "httpx.AsyncClient":
+        """获取绑定当前事件循环的异步客户端"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                headers=self.headers,
+                timeout=60,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose(self):
+        """关闭当前事件循环的异步客户端及其连接池（事件循环结束前调用）"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
 
 
 class LLMGenerator:
@@ -69,9 +578,25 @@ class LLMGenerator:
 
     def __init__(self, temperature: float = 0.7):
         self.temperature = temperature
+        self.max_tokens = settings.llm_max_tokens
         self.provider = settings.llm_provider
         self.llm = None
         self.doubao_client = None
+        self.llm_cache = LLMCache.from_settings()
+        self.cache = SemanticCache(
+            model=settings.embedding_model,
+            threshold=0.92,
+            ttl=3600,
+            max_entries=2048
+        )
+        # 并发的异步生成请求按时间窗口合并，相同提示只调用一次上游
+        self.batcher = None
+        if settings.llm_batch_wait_ms > 0:
+            self.batcher = RequestBatcher(
+                self._acall_provider,
+                max_batch=settings.llm_batch_max_size,
+                max_wait=settings.llm_batch_wait_ms / 1000
+            )
         self._initialize_llm()
 
     def _initialize_llm(self):
@@ -96,7 +621,8 @@ class LLMGenerator:
             self.doubao_client = DoubaoClient(
                 api_key=settings.doubao_api_key,
                 endpoint=settings.doubao_endpoint,
-                model=settings.doubao_model
+                model=settings.doubao_model,
+                cache=self.llm_cache
             )
             logger.info(f"豆包LLM初始化成功: {settings.doubao_model}")
         except Exception as e:
@@ -110,12 +636,14 @@ class LLMGenerator:
 
         try:
             self.llm = ChatOpenAI(
-                model_name="gpt-3.5-turbo",
+                model_name=settings.openai_model,
                 temperature=self.temperature,
+                max_tokens=self.max_tokens,
                 openai_api_key=settings.openai_api_key,
-                openai_api_base=settings.openai_base_url
+                openai_api_base=settings.openai_base_url,
+                model_kwargs={"response_format": OPENAI_RESPONSE_FORMAT}
             )
-            logger.info("OpenAI LLM初始化成功")
+            logger.info(f"OpenAI LLM初始化成功: {settings.openai_model}")
         except Exception as e:
             logger.error(f"OpenAI LLM初始化失败: {e}")
 
@@ -128,107 +656,213 @@ class LLMGenerator:
     ) -> WritingGuidance:
         """生成写作指导"""
         try:
-            if self.provider == "doubao" and self.doubao_client:
-                return self._generate_with_doubao(prompt, materials, essays, context)
-            elif self.provider == "openai" and self.llm:
-                return self._generate_with_openai(prompt, materials, essays, context)
-            else:
+            if not self._is_llm_available():
                 logger.warning("LLM不可用，使用模拟生成")
                 return self._generate_mock_guidance(prompt, materials, essays)
+
+            # 相同或近似题目直接复用缓存结果，跳过LLM调用；
+            # 缓存键在后台编码，同时在当前线程构建提示
+            cache_key = self.cache.build_key(prompt, materials, essays, context)
+            self.cache.prefetch(cache_key)
+            system_prompt = self._build_system_prompt()
+            user_prompt = self._build_user_prompt(prompt, materials, essays, context)
+
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("♻️ 命中语义缓存，跳过LLM调用")
+                return cached.model_copy(deep=True)
+
+            guidance = self._generate_with_provider(prompt, materials, essays, system_prompt, user_prompt)
+            if guidance is None:
+                return self._generate_mock_guidance(prompt, materials, essays)
+
+            # 只缓存真实的LLM结果，模拟生成不入缓存
+            self.cache.put(cache_key, guidance.model_copy(deep=True))
+            return guidance
         except Exception as e:
             logger.error(f"生成指导失败: {e}")
             return self._generate_mock_guidance(prompt, materials, essays)
 
-    def _generate_with_doubao(
+    async def agenerate_guidance(
         self,
         prompt: EssayPrompt,
-        materials: List[WritingMaterial],
-        essays: List[SampleEssay],
-        context: str
+        materials: List[WritingMaterial] = None,
+        essays: List[SampleEssay] = None,
+        context: str = ""
     ) -> WritingGuidance:
-        """使用豆包模型生成指导"""
-        logger.info("=" * 80)
-        logger.info("🚀 开始调用豆包LLM生成写作指导")
+        """异步生成写作指导，可配合 asyncio.gather 并发处理多个题目"""
+        try:
+            if not self._is_llm_available():
+                logger.warning("LLM不可用，使用模拟生成")
+                return self._generate_mock_guidance(prompt, materials, essays)
 
-        # 记录输入信息
-        logger.info(f"📝 作文题目: {prompt.title}")
-        logger.info(f"📖 题目描述: {prompt.description or '无'}")
-        logger.info(f"🎯 作文类型: {prompt.essay_type}")
-        logger.info(f"📊 难度等级: {prompt.difficulty_level}")
-        logger.info(f"📋 写作要求: {prompt.requirements}")
-        logger.info(f"🔑 关键词: {prompt.keywords}")
+            cache_key = self.cache.build_key(prompt, materials, essays, context)
+            self.cache.prefetch(cache_key)
+            system_prompt = self._build_system_prompt()
+            user_prompt = self._build_user_prompt(prompt, materials, essays, context)
 
-        # 记录检索到的材料信息
-        if materials:
-            logger.info(f"📚 检索到 {len(materials)} 个相关写作素材:")
-            for i, material in enumerate(materials[:3], 1):  # 只显示前3个
-                logger.info(f"  {i}. 【{material.category}】{material.title}")
-                logger.info(f"     内容摘要: {material.content[:]}...")
-        else:
-            logger.info("📚 未检索到相关写作素材")
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("♻️ 命中语义缓存，跳过LLM调用")
+                return cached.model_copy(deep=True)
 
-        # 记录检索到的范文信息
-        if essays:
-            logger.info(f"📑 检索到 {len(essays)} 篇相关范文:")
-            for i, essay in enumerate(essays[:3], 1):  # 只显示前3个
-                logger.info(f"  {i}. 【{essay.essay_type}】{essay.title}")
-                logger.info(f"     内容摘要: {essay.content[:]}...")
-        else:
-            logger.info("📑 未检索到相关范文")
+            response_text = await self._acall_llm(
+                system_prompt, user_prompt, self._prompt_cache_key(prompt, materials, essays)
+            )
+            if not response_text:
+                logger.warning("⚠️ LLM返回空响应，使用模拟生成")
+                return self._generate_mock_guidance(prompt, materials, essays)
 
-        # 构建系统提示
-        system_prompt = self._build_system_prompt()
-        logger.info(f"🎭 系统提示长度: {len(system_prompt)} 字符")
+            guidance = self._parse_llm_response(response_text, materials, essays)
+            self.cache.put(cache_key, guidance.model_copy(deep=True))
+            return guidance
+        except Exception as e:
+            logger.error(f"生成指导失败: {e}")
+            return self._generate_mock_guidance(prompt, materials, essays)
 
-        # 构建用户提示
-        user_prompt = self._build_user_prompt(prompt, materials, essays, context)
-        logger.info(f"👤 用户提示长度: {len(user_prompt)} 字符")
-        logger.info(f"👤 用户提示内容预览:")
-        logger.info(f"     {user_prompt[:]}...")
+    def generate_batch(self, prompts: List[EssayPrompt]) -> List[WritingGuidance]:
+        """并发生成多个题目的写作指导
 
-        # 调用豆包API
-        logger.info("🔄 正在调用豆包API...")
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        内部使用 asyncio.run，需在没有运行中事件循环的线程里调用；
+        已处于异步上下文时请直接 gather agenerate_guidance。
+        """
+        async def _gather():
+            try:
+                return await asyncio.gather(*(self.agenerate_guidance(p) for p in prompts))
+            finally:
+                # asyncio.run 结束后事件循环即关闭，绑定在上面的客户端要在此之前关闭
+                await self.aclose()
 
-        response_text = self.doubao_client.chat_completion(messages, self.temperature)
+        return list(asyncio.run(_gather()))
 
-        # 记录API响应
-        if response_text:
-            logger.info("✅ 豆包API调用成功")
-            logger.info(f"📤 API响应长度: {len(response_text)} 字符")
-            logger.info(f"📤 API响应内容预览:")
-            logger.info(f"     {response_text[:]}...")
+    def generate_guidance_stream(
+        self,
+        prompt: EssayPrompt,
+        materials: List[WritingMaterial] = None,
+        essays: List[SampleEssay] = None,
+        context: str = ""
+    ) -> Iterator[Dict[str, Any]]:
+        """流式生成写作指导
+
+        依次产出 {"type": "token", "content": 文本片段}，
+        最后产出 {"type": "guidance", "guidance": WritingGuidance}。
+        """
+        if not self._is_llm_available():
+            logger.warning("LLM不可用，使用模拟生成")
+            yield {"type": "guidance", "guidance": self._generate_mock_guidance(prompt, materials, essays)}
+            return
+
+        cache_key = self.cache.build_key(prompt, materials, essays, context)
+        self.cache.prefetch(cache_key)
+        system_prompt = self._build_system_prompt()
+        user_prompt = self._build_user_prompt(prompt, materials, essays, context)
+
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.info("♻️ 命中语义缓存，跳过LLM调用")
+            yield {"type": "guidance", "guidance": cached.model_copy(deep=True)}
+            return
+
+        messages = self._build_messages(system_prompt, user_prompt)
+        if self.provider == "doubao":
+            deltas = self.doubao_client.stream_chat_completion(
+                messages, self.temperature, self.max_tokens, STOP_SEQUENCES
+            )
         else:
-            logger.warning("⚠️ 豆包API返回空响应，使用模拟生成")
-            return self._generate_mock_guidance(prompt, materials, essays)
+            stream = self.llm.stream(messages, **self._openai_call_kwargs(self._prompt_cache_key(prompt, materials, essays)))
+            deltas = (chunk.content for chunk in stream if chunk.content)
+
+        # 攒够若干片段再推送，减少前端刷新和网络帧数
+        response_parts = []
+        pending = []
+        try:
+            for delta in deltas:
+                response_parts.append(delta)
+                pending.append(delta)
+                if len(pending) >= STREAM_FLUSH_TOKENS:
+                    yield {"type": "token", "content": "".join(pending)}
+                    pending = []
+        except Exception as e:
+            logger.error(f"流式生成失败: {e}")
+
+        if pending:
+            yield {"type": "token", "content": "".join(pending)}
+
+        response_text = "".join(response_parts)
+        if not response_text:
+            logger.warning("⚠️ LLM流式响应为空，使用模拟生成")
+            yield {"type": "guidance", "guidance": self._generate_mock_guidance(prompt, materials, essays)}
+            return
 
-        # 解析响应
-        logger.info("🔍 开始解析LLM响应...")
         guidance = self._parse_llm_response(response_text, materials, essays)
+        self.cache.put(cache_key, guidance.model_copy(deep=True))
+        yield {"type": "guidance", "guidance": guidance}
+
+    async def aclose(self):
+        """释放当前事件循环上的异步连接（如豆包的 httpx 客户端）"""
+        if self.doubao_client is not None:
+            await self.doubao_client.aclose()
+
+    async def _acall_llm(self, system_prompt: str, user_prompt: str, prompt_cache_key: Optional[str] = None) -> str:
+        """异步调用当前提供商，返回响应文本（启用请求合并时经由合并器发出）"""
+        if self.batcher is None:
+            return await self._acall_provider(system_prompt, user_prompt, prompt_cache_key)
+        return await self.batcher.submit(
+            (system_prompt, user_prompt, prompt_cache_key), system_prompt, user_prompt, prompt_cache_key
+        )
 
-        # 记录解析结果
-        logger.info("✅ LLM响应解析完成")
-        logger.info(f"🎯 主题分析长度: {len(guidance.theme_analysis)} 字符")
-        logger.info(f"📝 结构建议数量: {len(guidance.structure_suggestion)} 条")
-        logger.info(f"✏️ 写作技巧数量: {len(guidance.writing_tips)} 条")
-        logger.info(f"🔑 关键要点数量: {len(guidance.key_points)} 条")
-        logger.info("=" * 80)
+    async def _acall_provider(self, system_prompt: str, user_prompt: str, prompt_cache_key: Optional[str] = None) -> str:
+        """异步调用当前提供商"""
+        messages = self._build_messages(system_prompt, user_prompt)
+        if self.provider == "doubao":
+            return await self.doubao_client.achat_completion(
+                messages, self.temperature, self.max_tokens, STOP_SEQUENCES
+            )
 
-        return guidance
+        cache_key = self._openai_cache_key(messages)
+        if cache_key:
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                logger.info("♻️ 命中LLM精确缓存，跳过OpenAI API调用")
+                return cached
+
+        response_text = (await self.llm.ainvoke(messages, **self._openai_call_kwargs(prompt_cache_key))).content
+        if cache_key and response_text:
+            self.llm_cache.set(cache_key, response_text, ttl=14400)
+        return response_text
+
+    @staticmethod
+    def _openai_call_kwargs(prompt_cache_key: Optional[str]) -> Dict[str, Any]:
+        """OpenAI 调用的额外参数（prompt_cache_key 通过 extra_body 传递，兼容不认识该字段的旧版 SDK）"""
+        kwargs: Dict[str, Any] = {"stop": STOP_SEQUENCES}
+        if prompt_cache_key:
+            kwargs["extra_body"] = {"prompt_cache_key": prompt_cache_key}
+        return kwargs
+
+    def _openai_cache_key(self, messages: List[Any]) -> Optional[str]:
+        """确定性调用时返回 OpenAI 请求的精确缓存键"""
+        if self.temperature > DETERMINISTIC_TEMPERATURE:
+            return None
+        return LLMCache.make_key(
+            self.llm.model_name,
+            [{"role": m.type, "content": m.content} for m in messages],
+            self.temperature,
+            self.max_tokens,
+            STOP_SEQUENCES
+        )
 
-    def _generate_with_openai(
+    def _generate_with_provider(
         self,
         prompt: EssayPrompt,
         materials: List[WritingMaterial],
         essays: List[SampleEssay],
-        context: str
-    ) -> WritingGuidance:
-        """使用 OpenAI 生成指导"""
+        system_prompt: str,
+        user_prompt: str
+    ) -> Optional[WritingGuidance]:
+        """使用当前提供商的模型生成指导，API返回空响应时返回 None"""
+        provider_name = self._provider_display_name()
         logger.info("=" * 80)
-        logger.info("🚀 开始调用OpenAI LLM生成写作指导")
+        logger.info(f"🚀 开始调用{provider_name} LLM生成写作指导")
 
         # 记录输入信息
         logger.info(f"📝 作文题目: {prompt.title}")
@@ -238,12 +872,12 @@ class LLMGenerator:
         logger.info(f"📋 写作要求: {prompt.requirements}")
         logger.info(f"🔑 关键词: {prompt.keywords}")
 
-        # 记录检索到的材料信息
+        # 记录检索到的材料信息（内容摘要仅在 DEBUG 级别时才截取和格式化）
         if materials:
             logger.info(f"📚 检索到 {len(materials)} 个相关写作素材:")
             for i, material in enumerate(materials[:3], 1):  # 只显示前3个
                 logger.info(f"  {i}. 【{material.category}】{material.title}")
-                logger.info(f"     内容摘要: {material.content[:100]}...")
+                logger.opt(lazy=True).debug("     内容摘要: {}...", lambda m=material: m.content[:100])
         else:
             logger.info("📚 未检索到相关写作素材")
 
@@ -252,38 +886,30 @@ class LLMGenerator:
             logger.info(f"📑 检索到 {len(essays)} 篇相关范文:")
             for i, essay in enumerate(essays[:3], 1):  # 只显示前3个
                 logger.info(f"  {i}. 【{essay.essay_type}】{essay.title}")
-                logger.info(f"     内容摘要: {essay.content[:100]}...")
+                logger.opt(lazy=True).debug("     内容摘要: {}...", lambda e=essay: e.content[:100])
         else:
             logger.info("📑 未检索到相关范文")
 
-        # 构建系统提示
-        system_prompt = self._build_system_prompt()
+        # 记录提示信息
         logger.info(f"🎭 系统提示长度: {len(system_prompt)} 字符")
-
-        # 构建用户提示
-        user_prompt = self._build_user_prompt(prompt, materials, essays, context)
         logger.info(f"👤 用户提示长度: {len(user_prompt)} 字符")
-        logger.info(f"👤 用户提示内容预览:")
-        logger.info(f"     {user_prompt[:200]}...")
-
-        # 调用 OpenAI API
-        logger.info("🔄 正在调用OpenAI API...")
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
+        logger.opt(lazy=True).debug("👤 用户提示内容预览:\n     {}...", lambda: user_prompt[:200])
 
-        response = self.llm(messages)
+        # 调用模型
+        logger.info(f"🔄 正在调用{provider_name} API...")
+        response_text = self._call_llm(system_prompt, user_prompt, self._prompt_cache_key(prompt, materials, essays))
 
         # 记录API响应
-        logger.info("✅ OpenAI API调用成功")
-        logger.info(f"📤 API响应长度: {len(response.content)} 字符")
-        logger.info(f"📤 API响应内容预览:")
-        logger.info(f"     {response.content[:300]}...")
+        if not response_text:
+            logger.warning(f"⚠️ {provider_name}API返回空响应，使用模拟生成")
+            return None
+        logger.info(f"✅ {provider_name}API调用成功")
+        logger.info(f"📤 API响应长度: {len(response_text)} 字符")
+        logger.opt(lazy=True).debug("📤 API响应内容预览:\n     {}...", lambda: response_text[:300])
 
         # 解析响应
         logger.info("🔍 开始解析LLM响应...")
-        guidance = self._parse_llm_response(response.content, materials, essays)
+        guidance = self._parse_llm_response(response_text, materials, essays)
 
         # 记录解析结果
         logger.info("✅ LLM响应解析完成")
@@ -295,58 +921,73 @@ class LLMGenerator:
 
         return guidance
 
-    def _build_system_prompt(self) -> str:
-        """构建系统提示"""
-        return """你是一位经验丰富的语文老师和写作指导专家，专门为学生提供作文写作指导。
-
-你的任务是根据给定的作文题目，**充分利用并具体指导如何使用提供的写作素材和范文**，生成详细的写作指导。
-
-**重要要求**：
-1. **必须具体说明如何运用每个提供的素材** - 不能只是列出素材标题，要说明在文章的哪个部分、如何使用
-2. **必须分析范文的优秀写法** - 指出范文的结构特点、表达技巧，并建议学生如何借鉴
-3. **要建立素材与写作技巧的具体联系** - 说明某个素材适合用来论证哪个观点、表达哪种情感
-4. **提供可操作的具体建议** - 避免空泛的指导，要给出学生能直接运用的方法
-
-请按照以下JSON格式返回结果：
+    def _call_llm(self, system_prompt: str, user_prompt: str, prompt_cache_key: Optional[str] = None) -> str:
+        """调用当前提供商，返回响应文本"""
+        messages = self._build_messages(system_prompt, user_prompt)
+        if self.provider == "doubao":
+            return self.doubao_client.chat_completion(
+                messages, self.temperature, self.max_tokens, STOP_SEQUENCES
+            )
 
-```json
-{
-  "theme_analysis": "深入分析作文题目的核心主题和写作要求，结合提供的素材分析写作方向",
-  "structure_suggestions": [
-    "开头：具体建议如何开头，可以运用哪个素材或借鉴哪个范文的开头方式",
-    "主体：分段建议，明确指出在每段中如何运用具体素材",
-    "结尾：结尾建议，说明如何升华主题"
-  ],
-  "writing_techniques": [
-    "具体的写作技巧，结合提供的素材举例说明",
-    "从范文中学到的表达方法，并说明如何运用",
-    "针对题目特点的专门技巧"
-  ],
-  "key_points": [
-    "重点内容，结合具体素材说明",
-    "从范文中总结的关键要点",
-    "针对题目的特殊注意事项"
-  ],
-  "material_usage": [
-    "【素材名称】: 具体说明这个素材在文章的哪个位置、如何使用、能解决什么问题",
-    "【范文借鉴】: 具体说明从范文中学到什么、如何应用到自己的写作中"
-  ],
-  "concrete_examples": [
-    "提供具体的段落或句子示例，展示如何运用素材",
-    "给出范文中值得学习的具体表达方式"
-  ]
-}
-```
+        cache_key = self._openai_cache_key(messages)
+        if cache_key:
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                logger.info("♻️ 命中LLM精确缓存，跳过OpenAI API调用")
+                return cached
+
+        response_text = self.llm.invoke(messages, **self._openai_call_kwargs(prompt_cache_key)).content
+        if cache_key and response_text:
+            self.llm_cache.set(cache_key, response_text, ttl=14400)
+        return response_text
+
+    def _build_messages(self, system_prompt: str, user_prompt: str) -> List[Any]:
+        """按当前提供商的格式构建消息列表"""
+        messages = self._build_chat_messages(system_prompt, user_prompt)
+        if self.provider == "doubao":
+            return messages
+        message_types = {"system": SystemMessage, "user": HumanMessage}
+        return [message_types[m["role"]](content=m["content"]) for m in messages]
+
+    @staticmethod
+    def _build_chat_messages(system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+        """构建 OpenAI 格式的消息列表：系统提示、固定生成要求在前，动态内容在最后"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": STATIC_INSTRUCTIONS},
+            {"role": "user", "content": user_prompt}
+        ]
 
-请确保你的指导：
-- **素材运用具体化**：明确说明每个素材的使用方法和位置
-- **范文借鉴实用化**：分析范文的优点并转化为可操作的建议
-- **技巧说明详细化**：不只说"要生动"，要说"怎样生动"
-- **示例说明具体化**：提供具体的表达示例
-- 适合目标难度等级的学生
-- 条理清晰，易于理解和执行
+    @staticmethod
+    def _prompt_cache_key(
+        prompt: EssayPrompt,
+        materials: Optional[List[WritingMaterial]],
+        essays: Optional[List[SampleEssay]]
+    ) -> str:
+        """OpenAI 提示缓存的路由键
+
+        由作文类型和检索结果集合的版本标签组成：检索到相同素材/范文的请求
+        落到同一缓存分片上，提高前缀缓存命中率。
+        """
+        ids = sorted(m.id or m.title for m in (materials or [])[:5])
+        ids += sorted(e.id or e.title for e in (essays or [])[:3])
+        version = hashlib.md5("|".join(ids).encode("utf-8")).hexdigest()[:8]
+        return f"{prompt.essay_type.value}:v{version}"
+
+    def _is_llm_available(self) -> bool:
+        """当前提供商的客户端是否已初始化"""
+        if self.provider == "doubao":
+            return self.doubao_client is not None
+        if self.provider == "openai":
+            return self.llm is not None
+        return False
+
+    def _provider_display_name(self) -> str:
+        return "豆包" if self.provider == "doubao" else "OpenAI"
 
-请严格按照上述JSON格式返回，不要添加其他内容。"""
+    def _build_system_prompt(self) -> str:
+        """构建系统提示"""
+        return SYSTEM_PROMPT
 
     def _build_user_prompt(
         self,
@@ -355,91 +996,8 @@ class LLMGenerator:
         essays: List[SampleEssay],
         context: str
     ) -> str:
-        """构建用户提示"""
-        user_prompt_parts = []
-
-        # 添加作文题目信息
-        user_prompt_parts.append("## 作文题目信息")
-        user_prompt_parts.append(f"**题目**: {prompt.title}")
-        if prompt.description:
-            user_prompt_parts.append(f"**描述**: {prompt.description}")
-        user_prompt_parts.append(f"**类型**: {prompt.essay_type.value}")
-        user_prompt_parts.append(f"**难度等级**: {prompt.difficulty_level.value}")
-
-        if prompt.keywords:
-            user_prompt_parts.append(f"**关键词**: {', '.join(prompt.keywords)}")
-
-        if prompt.requirements:
-            user_prompt_parts.append("**写作要求**:")
-            for req in prompt.requirements:
-                user_prompt_parts.append(f"- {req}")
-
-        if prompt.word_count:
-            user_prompt_parts.append(f"**字数要求**: {prompt.word_count}字")
-
-        # 添加相关素材
-        if materials:
-            user_prompt_parts.append("\n## 相关写作素材（请务必具体指导如何运用）")
-            for i, material in enumerate(materials[:5], 1):  # 增加到5个素材
-                user_prompt_parts.append(f"### 素材{i}: {material.title}")
-                user_prompt_parts.append(f"**分类**: {material.category}")
-                user_prompt_parts.append(f"**难度**: {material.difficulty_level.value if hasattr(material, 'difficulty_level') else '中等'}")
-                # 提供更多内容
-                content = material.content[:500] if len(material.content) > 500 else material.content
-                user_prompt_parts.append(f"**内容**: {content}")
-                if hasattr(material, 'themes') and material.themes:
-                    user_prompt_parts.append(f"**适用主题**: {', '.join(material.themes)}")
-                user_prompt_parts.append("") # 空行分隔
-
-        # 添加范文参考
-        if essays:
-            user_prompt_parts.append("\n## 参考范文（请分析优点并指导如何借鉴）")
-            for i, essay in enumerate(essays[:3], 1):  # 保持3篇范文
-                user_prompt_parts.append(f"### 范文{i}: {essay.title}")
-                user_prompt_parts.append(f"**类型**: {essay.essay_type.value}")
-                user_prompt_parts.append(f"**难度**: {essay.difficulty_level.value if hasattr(essay, 'difficulty_level') else '中等'}")
-                
-                if hasattr(essay, 'highlights') and essay.highlights:
-                    user_prompt_parts.append(f"**写作亮点**: {', '.join(essay.highlights)}")
-                
-                if hasattr(essay, 'structure_analysis') and essay.structure_analysis:
-                    user_prompt_parts.append(f"**结构分析**: {essay.structure_analysis}")
-                
-                if hasattr(essay, 'language_features') and essay.language_features:
-                    user_prompt_parts.append(f"**语言特色**: {', '.join(essay.language_features)}")
-                
-                # 提供更多范文内容
-                content = essay.content[:800] if len(essay.content) > 800 else essay.content
-                user_prompt_parts.append(f"**范文内容**: {content}")
-                user_prompt_parts.append("") # 空行分隔
-
-        # 添加上下文
-        if context:
-            user_prompt_parts.append(f"\n## 补充信息\n{context}")
-
-        # 添加生成要求
-        user_prompt_parts.append("""
-## 请生成指导
-
-请基于以上信息，为这个作文题目生成详细的写作指导。
-
-**重要要求**：
-1. **必须具体说明如何运用每个素材** - 在material_usage中，要写明"在文章的开头可以运用《素材名》中的XXX观点/事例，用来XXX"
-2. **必须分析范文的借鉴价值** - 在material_usage中，要写明"可以学习《范文名》的XXX写法，比如XXX，运用到自己文章的XXX部分"  
-3. **提供具体的表达示例** - 在concrete_examples中，给出具体的句子或段落示例
-4. **确保指导的可操作性** - 学生看了指导后能知道具体怎么做
-
-严格按照系统提示中的JSON格式返回结果，包含以下字段：
-- theme_analysis: 主题分析（结合素材分析写作方向）
-- structure_suggestions: 结构建议列表（具体说明每部分如何运用素材）
-- writing_techniques: 写作技巧列表（结合素材和范文举例说明）
-- key_points: 要点提示列表（结合具体素材说明）
-- material_usage: 素材和范文使用建议列表（具体说明如何运用）
-- concrete_examples: 具体示例列表（提供可参考的表达方式）
-
-请确保返回的是有效的JSON格式，且每个字段都有实质性的、具体的内容。""")
-
-        return "\n".join(user_prompt_parts)
+        """构建用户提示（仅包含题目、素材、范文等动态内容，固定的生成要求见 STATIC_INSTRUCTIONS）"""
+        return build_user_prompt(prompt, materials, essays, context)
 
     def _parse_llm_response(
         self,
@@ -453,6 +1011,8 @@ class LLMGenerator:
             json_data = self._extract_json_from_response(response)
 
             if json_data:
+                json_data = {_KEY_MAP.get(k, k): v for k, v in json_data.items()}
+
                 # 提取素材使用建议
                 material_usage = json_data.get("material_usage", [])
                 concrete_examples = json_data.get("concrete_examples", [])
@@ -497,35 +1057,44 @@ class LLMGenerator:
 
     def _extract_json_from_response(self, response: str) -> Optional[Dict[str, Any]]:
         """从响应中提取JSON数据"""
-        try:
-            # 尝试直接解析整个响应为JSON
-            return json.loads(response.strip())
-        except json.JSONDecodeError:
-            pass
-
-        try:
-            # 尝试从markdown代码块中提取JSON
-            import re
-            json_pattern = r'```json\s*(.*?)\s*```'
-            matches = re.findall(json_pattern, response, re.DOTALL)
-            if matches:
-                return json.loads(matches[0].strip())
-        except json.JSONDecodeError:
-            pass
-
-        try:
-            # 尝试查找花括号包围的内容
-            start_idx = response.find('{')
-            end_idx = response.rfind('}')
-            if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                json_str = response[start_idx:end_idx+1]
-                return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
+        text = response.strip()
+
+        # 依次尝试：整个响应、markdown代码块、首尾花括号之间的内容
+        for candidate in self._iter_json_candidates(text):
+            try:
+                data = orjson.loads(candidate)
+            except orjson.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                return data
+
+        # 输出不规范时才使用较慢的 JSON5 容错解析（尾逗号、单引号等）
+        if JSON5_AVAILABLE:
+            for candidate in self._iter_json_candidates(text):
+                try:
+                    data = json5.loads(candidate)
+                except ValueError:
+                    continue
+                if isinstance(data, dict):
+                    return data
 
         logger.warning("无法从响应中提取有效JSON")
         return None
 
+    @staticmethod
+    def _iter_json_candidates(text: str) -> Iterator[str]:
+        """按代价从低到高产出可能的JSON文本"""
+        yield text
+
+        match = _JSON_BLOCK_RE.search(text)
+        if match:
+            yield match.group(1)
+
+        start_idx = text.find('{')
+        end_idx = text.rfind('}')
+        if start_idx != -1 and end_idx > start_idx:
+            yield text[start_idx:end_idx + 1]
+
     def _parse_text_response(
         self,
         response: str,
@@ -543,25 +1112,16 @@ class LLMGenerator:
             }
 
             current_section = None
-            lines = response.split('\n')
 
-            for line in lines:
+            for line in response.splitlines():
                 line = line.strip()
                 if not line:
                     continue
 
                 # 识别章节
-                if "主题分析" in line or "theme_analysis" in line.lower():
-                    current_section = "theme_analysis"
-                    continue
-                elif "结构建议" in line or "structure" in line.lower():
-                    current_section = "structure_suggestion"
-                    continue
-                elif "写作技巧" in line or "writing_tips" in line.lower():
-                    current_section = "writing_tips"
-                    continue
-                elif "要点提示" in line or "key_points" in line.lower():
-                    current_section = "key_points"
+                header = self._match_section_header(line)
+                if header:
+                    current_section = header
                     continue
 
                 # 添加内容
@@ -570,11 +1130,11 @@ class LLMGenerator:
                         sections["theme_analysis"] += " " + line
                     else:
                         sections["theme_analysis"] = line
-                elif current_section in ["structure_suggestion", "writing_tips", "key_points"]:
-                    if line.startswith(('-', '•', '*', '1.', '2.', '3.')):
-                        cleaned_line = line.lstrip('-•*0123456789. ').strip()
-                        sections[current_section].append(cleaned_line)
-                    elif line and not line.startswith('#'):
+                elif current_section is not None:
+                    bullet = _BULLET_RE.match(line)
+                    if bullet:
+                        sections[current_section].append(line[bullet.end():].strip())
+                    elif not line.startswith('#'):
                         sections[current_section].append(line)
 
             # 如果解析失败，使用原始响应
@@ -593,6 +1153,15 @@ class LLMGenerator:
             logger.error(f"解析文本响应失败: {e}")
             return self._create_fallback_guidance(materials, essays)
 
+    @staticmethod
+    def _match_section_header(line: str) -> Optional[str]:
+        """行中包含章节标题关键词时返回对应章节名"""
+        lowered = line.lower()
+        for keyword, section in _HEADER_MAP.items():
+            if keyword in lowered:
+                return section
+        return None
+
     def _create_fallback_guidance(
         self,
         materials: List[WritingMaterial],
@@ -634,93 +1203,8 @@ class LLMGenerator:
             prompt_type = prompt.essay_type.value if prompt.essay_type else "narrative"
             prompt_level = prompt.difficulty_level.value if prompt.difficulty_level else "middle"
 
-        # 根据作文类型生成不同的指导模板
-        guidance_templates = {
-            "narrative": {
-                "theme_analysis": "记叙文要求通过叙述事件来表达主题思想，注意情节的完整性和人物的生动性。",
-                "structure_suggestion": [
-                    "开头：简要交代时间、地点、人物、事件",
-                    "发展：详细叙述事件的经过，突出重点",
-                    "高潮：事件的关键转折点",
-                    "结尾：总结事件意义，点明主题"
-                ],
-                "writing_tips": [
-                    "运用生动的描写手法，让读者有身临其境的感觉",
-                    "合理安排叙述顺序，可采用倒叙、插叙等手法",
-                    "注意详略得当，重点部分要详写",
-                    "融入真情实感，使文章感人"
-                ],
-                "key_points": [
-                    "确保事件的真实性和完整性",
-                    "人物形象要鲜明立体",
-                    "语言要生动形象，富有表现力",
-                    "主题要明确，通过事件自然体现"
-                ]
-            },
-            "argumentative": {
-                "theme_analysis": "议论文要求明确提出观点，并运用事实和道理进行论证，逻辑性要强。",
-                "structure_suggestion": [
-                    "引论：提出问题，明确论点",
-                    "本论：分层论证，举例说明",
-                    "结论：总结论证，强调观点"
-                ],
-                "writing_tips": [
-                    "论点要明确、正确、深刻",
-                    "论据要典型、充分、有说服力",
-                    "论证要严密、合理、有逻辑",
-                    "语言要准确、鲜明、生动"
-                ],
-                "key_points": [
-                    "开门见山，直接提出论点",
-                    "选择有代表性的事例和名言",
-                    "注意正反对比论证",
-                    "结尾要有力，升华主题"
-                ]
-            },
-            "expository": {
-                "theme_analysis": "说明文要求客观准确地说明事物的特征、原理或方法，语言要准确简洁。",
-                "structure_suggestion": [
-                    "开头：概括介绍说明对象",
-                    "主体：分条目或分方面说明",
-                    "结尾：总结要点，强调意义"
-                ],
-                "writing_tips": [
-                    "运用多种说明方法，如举例、对比、分类等",
-                    "语言要准确、简洁、通俗易懂",
-                    "结构要清晰，层次要分明",
-                    "可适当使用图表、数据等辅助说明"
-                ],
-                "key_points": [
-                    "抓住事物的本质特征",
-                    "说明要科学准确",
-                    "条理清楚，逻辑性强",
-                    "语言平实，通俗易懂"
-                ]
-            },
-            "general": {
-                "theme_analysis": "根据题目要求确定写作主题和表达目的，选择合适的写作方法。",
-                "structure_suggestion": [
-                    "开头：引入主题，概括观点",
-                    "主体：分层次展开内容",
-                    "结尾：总结全文，深化主题"
-                ],
-                "writing_tips": [
-                    "仔细审题，把握写作要求",
-                    "选择合适的文体和表达方式",
-                    "注意语言的准确性和生动性",
-                    "结构要完整，逻辑要清晰"
-                ],
-                "key_points": [
-                    "紧扣题目，不跑题",
-                    "内容要充实具体",
-                    "表达要清楚流畅",
-                    "书写要工整美观"
-                ]
-            }
-        }
-
         # 选择合适的模板
-        template = guidance_templates.get(prompt_type, guidance_templates["general"])
+        template = _GUIDANCE_TEMPLATES.get(prompt_type, _GUIDANCE_TEMPLATES["general"])
 
         # 添加素材相关建议
         material_suggestions = []
@@ -729,11 +1213,11 @@ class LLMGenerator:
             material_suggestions.append(f"可以运用提供的{len(materials)}个相关素材")
             for i, material in enumerate(materials[:3], 1):
                 # 根据素材类型给出具体使用建议
-                if material.category in ["成长", "励志"]:
+                if material.category in _GROWTH_CATEGORIES:
                     usage_detail = f"【{material.title}】：可在文章主体部分作为论证素材，通过具体事例说明{prompt_type}主题，增强文章的说服力和感染力"
-                elif material.category in ["情感", "友谊", "亲情"]:
+                elif material.category in _EMOTION_CATEGORIES:
                     usage_detail = f"【{material.title}】：适合在情感表达部分引用，通过生动的情感描述引起读者共鸣，增强文章的感染力"
-                elif material.category in ["科技", "社会", "环保"]:
+                elif material.category in _SOCIAL_CATEGORIES:
                     usage_detail = f"【{material.title}】：可作为论据支撑观点，在分析问题时引用相关数据或事例，使论证更加有力"
                 else:
                     usage_detail = f"【{material.title}】：建议在文章的{['开头引入', '主体论证', '结尾升华'][i % 3]}部分运用，结合具体内容展开论述"
@@ -763,8 +1247,8 @@ class LLMGenerator:
         return WritingGuidance(
             theme_analysis=template["theme_analysis"],
             structure_suggestion=template["structure_suggestion"],
-            writing_tips=template["writing_tips"] + material_suggestions,
-            key_points=template["key_points"] + essay_suggestions,
+            writing_tips=[*template["writing_tips"], *material_suggestions],
+            key_points=[*template["key_points"], *essay_suggestions],
             related_materials=[mat.title for mat in materials] if materials else [],
             reference_essays=[essay.title for essay in essays] if essays else [],
             material_usage_details=material_usage_details,
@@ -0,0 +1,158 @@
+"""
+用户提示构建
+按请求的"形状"（哪些可选字段存在）缓存专用的构建函数，构建时不再逐字段判断
+"""
+import functools
+import io
+from typing import Callable, List, Tuple
+
+from ..core.models import EssayPrompt, WritingMaterial, SampleEssay
+
+# 用户提示中固定的段落标题
+_PROMPT_HEADER = "## 作文题目信息"
+_MATERIALS_HEADER = "\n## 相关写作素材（请务必具体指导如何运用）"
+_ESSAYS_HEADER = "\n## 参考范文（请分析优点并指导如何借鉴）"
+
+# 提示中最多包含的素材和范文数量
+MAX_PROMPT_MATERIALS = 5
+MAX_PROMPT_ESSAYS = 3
+
+
+def render_material(index: int, material: WritingMaterial) -> str:
+    """渲染单个素材，末尾带空行分隔"""
+    difficulty = material.difficulty_level.value if hasattr(material, 'difficulty_level') else '中等'
+    themes = getattr(material, 'themes', None)
+    themes_line = f"\n**适用主题**: {', '.join(themes)}" if themes else ""
+    return (
+        f"### 素材{index}: {material.title}\n"
+        f"**分类**: {material.category}\n"
+        f"**难度**: {difficulty}\n"
+        f"**内容**: {material.content[:500]}{themes_line}\n"
+    )
+
+
+def render_essay(index: int, essay: SampleEssay) -> str:
+    """渲染单篇范文，末尾带空行分隔"""
+    difficulty = essay.difficulty_level.value if hasattr(essay, 'difficulty_level') else '中等'
+    lines = [
+        f"### 范文{index}: {essay.title}",
+        f"**类型**: {essay.essay_type.value}",
+        f"**难度**: {difficulty}"
+    ]
+    if getattr(essay, 'highlights', None):
+        lines.append(f"**写作亮点**: {', '.join(essay.highlights)}")
+    if getattr(essay, 'structure_analysis', None):
+        lines.append(f"**结构分析**: {essay.structure_analysis}")
+    if getattr(essay, 'language_features', None):
+        lines.append(f"**语言特色**: {', '.join(essay.language_features)}")
+    lines.append(f"**范文内容**: {essay.content[:800]}\n")
+    return "\n".join(lines)
+
+
+# 各段落的写入函数，签名统一为 (write, prompt, materials, essays, context)
+# 每一段后都写入换行分隔，构建完成后去掉最后一个
+
+def _write_title(w, prompt, materials, essays, context):
+    w(f"{_PROMPT_HEADER}\n**题目**: {prompt.title}\n")
+
+
+def _write_description(w, prompt, materials, essays, context):
+    w(f"**描述**: {prompt.description}\n")
+
+
+def _write_type(w, prompt, materials, essays, context):
+    w(f"**类型**: {prompt.essay_type.value}\n**难度等级**: {prompt.difficulty_level.value}\n")
+
+
+def _write_keywords(w, prompt, materials, essays, context):
+    w(f"**关键词**: {', '.join(prompt.keywords)}\n")
+
+
+def _write_requirements(w, prompt, materials, essays, context):
+    w("**写作要求**:\n")
+    for req in prompt.requirements:
+        w(f"- {req}\n")
+
+
+def _write_word_count(w, prompt, materials, essays, context):
+    w(f"**字数要求**: {prompt.word_count}字\n")
+
+
+def _write_materials(w, prompt, materials, essays, context):
+    w(_MATERIALS_HEADER)
+    w("\n")
+    for i, material in enumerate(materials[:MAX_PROMPT_MATERIALS], 1):
+        w(render_material(i, material))
+        w("\n")
+
+
+def _write_essays(w, prompt, materials, essays, context):
+    w(_ESSAYS_HEADER)
+    w("\n")
+    for i, essay in enumerate(essays[:MAX_PROMPT_ESSAYS], 1):
+        w(render_essay(i, essay))
+        w("\n")
+
+
+def _write_context(w, prompt, materials, essays, context):
+    w(f"\n## 补充信息\n{context}\n")
+
+
+# 段落按输出顺序排列，与 prompt_shape 返回的各位一一对应
+_SECTION_WRITERS = (
+    _write_title,
+    _write_description,
+    _write_type,
+    _write_keywords,
+    _write_requirements,
+    _write_word_count,
+    _write_materials,
+    _write_essays,
+    _write_context
+)
+
+
+def prompt_shape(
+    prompt: EssayPrompt,
+    materials: List[WritingMaterial],
+    essays: List[SampleEssay],
+    context: str
+) -> Tuple[bool, ...]:
+    """请求的形状：各段落是否需要输出"""
+    return (
+        True,
+        bool(prompt.description),
+        True,
+        bool(prompt.keywords),
+        bool(prompt.requirements),
+        bool(prompt.word_count),
+        bool(materials),
+        bool(essays),
+        bool(context)
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def compile_builder(shape: Tuple[bool, ...]) -> Callable[..., str]:
+    """为给定形状生成专用构建函数：只包含该形状需要的段落，调用时无需再做判断"""
+    writers = tuple(writer for writer, present in zip(_SECTION_WRITERS, shape) if present)
+
+    def build(prompt, materials, essays, context) -> str:
+        buf = io.StringIO()
+        w = buf.write
+        for writer in writers:
+            writer(w, prompt, materials, essays, context)
+        return buf.getvalue()[:-1]
+
+    return build
+
+
+def build_user_prompt(
+    prompt: EssayPrompt,
+    materials: List[WritingMaterial],
+    essays: List[SampleEssay],
+    context: str
+) -> str:
+    """构建用户提示（题目、素材、范文等动态内容）"""
+    builder = compile_builder(prompt_shape(prompt, materials, essays, context))
+    return builder(prompt, materials, essays, context)
@@ -0,0 +1,82 @@
+"""
+LLM 请求合并
+并发到达的生成请求先攒一个很短的时间窗口再统一发出，窗口内完全相同的请求只调用一次上游
+"""
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+
+class RequestBatcher:
+    """按时间窗口合并异步调用
+
+    submit() 提交的请求在 max_wait 秒内或攒够 max_batch 个不同请求时一起发出；
+    键相同的请求共享同一次调用的结果。批内各请求仍并发调用上游
+    （OpenAI 兼容接口没有单次多提示的聊天接口，自建的 vLLM 等服务会在服务端连续批处理）。
+    """
+
+    def __init__(self, call: Callable[..., Awaitable[Any]], max_batch: int = 8, max_wait: float = 0.02):
+        self.call = call
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[Hashable, Tuple[List[asyncio.Future], tuple]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 事件循环只弱引用任务，这里持有发出中的任务直到完成
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, *args) -> Any:
+        """提交一次调用 call(*args)，返回其结果；key 相同的请求合并为一次调用"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 每次 asyncio.run 都是新的事件循环，旧循环上的状态不再可用
+            self._loop = loop
+            self._pending = {}
+            self._timer = None
+            self._inflight = set()
+
+        future = loop.create_future()
+        entry = self._pending.get(key)
+        if entry is None:
+            self._pending[key] = ([future], args)
+        else:
+            entry[0].append(future)
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        """发出当前窗口内的全部请求"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+
+        waiting = sum(len(futures) for futures, _ in batch.values())
+        if waiting > len(batch):
+            logger.info(f"🔗 合并 {waiting} 个LLM请求为 {len(batch)} 次调用")
+        for futures, args in batch.values():
+            task = self._loop.create_task(self.call(*args))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            task.add_done_callback(functools.partial(self._resolve, futures))
+
+    @staticmethod
+    def _resolve(futures: List[asyncio.Future], task: asyncio.Task):
+        for future in futures:
+            # 等待方已取消时跳过
+            if future.done():
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
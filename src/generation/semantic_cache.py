@@ -0,0 +1,320 @@
+"""
+语义缓存
+按题目信息的向量相似度复用已生成的写作指导，避免对相同或近似题目重复调用LLM
+"""
+import functools
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from ..core.models import EssayPrompt, WritingMaterial, SampleEssay
+from ..retrieval.embedding import EmbeddingModel
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# 标点及其他非文字字符，规范化时统一替换为空格
+_PUNCTUATION_RE = re.compile(r'[\W_]+')
+
+
+class _NumpyIndex:
+    """基于 numpy 矩阵的内积检索（faiss 未安装时使用）"""
+
+    def __init__(self):
+        # 与 self._keys 一一对应的向量矩阵，形状 [N, d]
+        self._keys: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def add(self, key: str, vec: np.ndarray):
+        row = vec[np.newaxis, :]
+        self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+        self._keys.append(key)
+
+    def remove(self, key: str):
+        if key in self._keys:
+            idx = self._keys.index(key)
+            self._keys.pop(idx)
+            self._matrix = np.delete(self._matrix, idx, axis=0) if self._keys else None
+
+    def search(self, vec: np.ndarray) -> Optional[Tuple[str, float]]:
+        """返回内积最大的 (键, 相似度)"""
+        if self._matrix is None:
+            return None
+        sims = self._matrix @ vec
+        best = int(np.argmax(sims))
+        return self._keys[best], float(sims[best])
+
+    def clear(self):
+        self._keys = []
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class _FaissIndex:
+    """基于 faiss 的内积检索，可选 int8 标量量化"""
+
+    def __init__(self, quantize: bool = False):
+        self.quantize = quantize
+        self._index = None
+        self._next_id = 0
+        self._key_to_id: Dict[str, int] = {}
+        self._id_to_key: Dict[int, str] = {}
+
+    def _create_index(self, dim: int):
+        if self.quantize:
+            base = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            # 向量已 L2 归一化，每一维都落在 [-1, 1]，用边界样本训练量化范围即可
+            bounds = np.vstack([-np.ones(dim), np.ones(dim)]).astype(np.float32)
+            base.train(bounds)
+        else:
+            base = faiss.IndexFlatIP(dim)
+        # 包一层 ID 映射，淘汰条目时可按 ID 删除
+        return faiss.IndexIDMap2(base)
+
+    def add(self, key: str, vec: np.ndarray):
+        row = np.array(vec, dtype=np.float32).reshape(1, -1)
+        if self._index is None:
+            self._index = self._create_index(row.shape[1])
+
+        row_id = self._next_id
+        self._next_id += 1
+        self._index.add_with_ids(row, np.array([row_id], dtype=np.int64))
+        self._key_to_id[key] = row_id
+        self._id_to_key[row_id] = key
+
+    def remove(self, key: str):
+        row_id = self._key_to_id.pop(key, None)
+        if row_id is None:
+            return
+        del self._id_to_key[row_id]
+        self._index.remove_ids(np.array([row_id], dtype=np.int64))
+
+    def search(self, vec: np.ndarray) -> Optional[Tuple[str, float]]:
+        """返回内积最大的 (键, 相似度)"""
+        if not self._key_to_id:
+            return None
+        scores, ids = self._index.search(np.array(vec, dtype=np.float32).reshape(1, -1), 1)
+        row_id = int(ids[0, 0])
+        if row_id < 0:
+            return None
+        return self._id_to_key[row_id], float(scores[0, 0])
+
+    def clear(self):
+        self._index = None
+        self._key_to_id.clear()
+        self._id_to_key.clear()
+
+    def __len__(self) -> int:
+        return len(self._key_to_id)
+
+
+class SemanticCache:
+    """语义缓存
+
+    键为规范化后的题目文本，值为生成结果。查找时先做精确匹配，
+    未命中再对键向量做余弦最近邻，相似度不低于阈值即视为命中。
+    嵌入模型不可用（或 model 为 None）时退化为仅精确匹配。
+
+    键的编码可以通过 prefetch 提前提交到后台线程，与调用方构建提示等工作重叠；
+    相同的键只编码一次（LRU 缓存）。
+
+    安装了 faiss 时用 IndexFlatIP 做最近邻检索，quantize=True 时改用 int8 标量量化，
+    向量内存约为 float32 的 1/4；否则使用 numpy 矩阵乘法。
+    """
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        threshold: float = 0.92,
+        ttl: float = 3600,
+        max_entries: int = 2048,
+        quantize: bool = False
+    ):
+        self.model_name = model
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.quantize = quantize
+
+        self._embedding_model: Optional[EmbeddingModel] = None
+        self._semantic_enabled = model is not None
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+
+        # 后台编码线程池及尚未取用的编码任务：key -> Future
+        self._encode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="semantic-cache")
+        self._pending: Dict[str, Future] = {}
+        # 每个实例独立的编码结果缓存，相同规范化键直接复用向量
+        self._encode_cached = functools.lru_cache(maxsize=4096)(self._encode_key)
+
+        # 条目按最近访问顺序排列：key -> (value, created_at)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # L2 归一化键向量的最近邻索引
+        if FAISS_AVAILABLE:
+            self._index = _FaissIndex(quantize)
+        else:
+            if quantize:
+                logger.warning("faiss 未安装，语义缓存不启用 int8 量化")
+            self._index = _NumpyIndex()
+
+    @staticmethod
+    def canonicalize(text: Optional[str]) -> str:
+        """规范化文本：小写、去标点、合并空白"""
+        if not text:
+            return ""
+        return " ".join(_PUNCTUATION_RE.sub(" ", text.lower()).split())
+
+    @classmethod
+    def build_key(
+        cls,
+        prompt: EssayPrompt,
+        materials: Optional[List[WritingMaterial]] = None,
+        essays: Optional[List[SampleEssay]] = None,
+        context: str = ""
+    ) -> str:
+        """由题目、关键词及检索到的素材/范文ID构建规范化缓存键"""
+        keywords = sorted({cls.canonicalize(k) for k in prompt.keywords} - {""})
+        parts = [
+            cls.canonicalize(prompt.title),
+            cls.canonicalize(prompt.description),
+            prompt.essay_type.value,
+            prompt.difficulty_level.value,
+            " ".join(keywords),
+            " ".join(cls.canonicalize(r) for r in prompt.requirements),
+            str(prompt.word_count or ""),
+            cls.canonicalize(context),
+            " ".join(m.id or m.title for m in (materials or [])[:5]),
+            " ".join(e.id or e.title for e in (essays or [])[:3]),
+        ]
+        return " | ".join(parts)
+
+    def prefetch(self, key: str):
+        """在后台线程中提前编码缓存键（首次调用时同时在后台加载嵌入模型）"""
+        if not self._semantic_enabled:
+            return
+        with self._lock:
+            if key not in self._pending:
+                self._pending[key] = self._encode_pool.submit(self._encode_cached, key)
+
+    def get(self, key: str) -> Optional[Any]:
+        """查找缓存，未命中返回 None
+
+        无论是否命中都取走 prefetch 提交的任务，生成失败、不再调用 put 的请求不会留在 _pending 中；
+        任务的结果记在编码缓存里，之后 put 同一个键时直接复用。
+        """
+        try:
+            with self._lock:
+                future = self._pending.pop(key, None)
+                now = time.time()
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if now - entry[1] < self.ttl:
+                        self._entries.move_to_end(key)
+                        return entry[0]
+                    self._remove(key)
+
+                if not self._semantic_enabled or not len(self._index):
+                    return None
+
+            query_vec = future.result() if future is not None else self._encode_cached(key)
+            if query_vec is None:
+                return None
+
+            with self._lock:
+                hit = self._index.search(query_vec)
+                if hit is None or hit[1] < self.threshold:
+                    return None
+
+                hit_key, score = hit
+                value, created_at = self._entries[hit_key]
+                if now - created_at >= self.ttl:
+                    self._remove(hit_key)
+                    return None
+
+                self._entries.move_to_end(hit_key)
+                logger.debug(f"语义缓存命中: 相似度 {score:.3f}")
+                return value
+        except Exception as e:
+            logger.error(f"语义缓存查找失败: {e}")
+            return None
+
+    def put(self, key: str, value: Any):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        try:
+            query_vec = self._encode(key) if self._semantic_enabled else None
+
+            with self._lock:
+                if key in self._entries:
+                    self._remove(key)
+
+                while len(self._entries) >= self.max_entries:
+                    oldest_key = next(iter(self._entries))
+                    self._remove(oldest_key)
+
+                self._entries[key] = (value, time.time())
+                if query_vec is not None:
+                    self._index.add(key, query_vec)
+        except Exception as e:
+            logger.error(f"语义缓存写入失败: {e}")
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            self._index.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        """删除条目及其对应的向量（调用方需持有锁）"""
+        self._entries.pop(key, None)
+        self._index.remove(key)
+
+    def _encode(self, key: str) -> Optional[np.ndarray]:
+        """获取缓存键的向量：优先取 prefetch 提交的后台任务结果"""
+        with self._lock:
+            future = self._pending.pop(key, None)
+        if future is not None:
+            return future.result()
+        return self._encode_cached(key)
+
+    def _encode_key(self, key: str) -> Optional[np.ndarray]:
+        """编码缓存键为 L2 归一化向量（只读，可被多处共享）"""
+        model = self._get_model()
+        if model is None:
+            return None
+
+        vec = np.asarray(model.encode_single(key), dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return None
+        vec /= norm
+        vec.flags.writeable = False
+        return vec
+
+    def _get_model(self) -> Optional[EmbeddingModel]:
+        """延迟加载嵌入模型；仅在真实语义模型可用时启用相似度匹配"""
+        if not self._semantic_enabled:
+            return None
+        with self._model_lock:
+            if self._embedding_model is None:
+                self._embedding_model = EmbeddingModel(self.model_name)
+                if self._embedding_model.model is None:
+                    # 简单向量化方法的词表随输入变化，向量之间不可比，只保留精确匹配
+                    logger.warning("语义缓存的嵌入模型不可用，仅启用精确匹配")
+                    self._semantic_enabled = False
+                    return None
+        return self._embedding_model if self._semantic_enabled else None
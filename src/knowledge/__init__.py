@@ -3,10 +3,13 @@
 """
 from .base import BaseKnowledgeBase
 from .local_kb import LocalKnowledgeBase
+from .whoosh_kb import WhooshKnowledgeBase, WHOOSH_AVAILABLE
 from .loader import KnowledgeLoader
 
 __all__ = [
     'BaseKnowledgeBase',
     'LocalKnowledgeBase',
+    'WhooshKnowledgeBase',
+    'WHOOSH_AVAILABLE',
     'KnowledgeLoader'
 ]
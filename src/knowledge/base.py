@@ -21,6 +21,14 @@ class BaseKnowledgeBase(ABC):
         """添加范文"""
         pass
 
+    def add_materials_bulk(self, materials: List[WritingMaterial]) -> int:
+        """批量添加写作素材，返回实际添加的数量（默认逐条添加，子类可覆盖为一次写入）"""
+        return sum(1 for material in materials if self.add_material(material))
+
+    def add_essays_bulk(self, essays: List[SampleEssay]) -> int:
+        """批量添加范文，返回实际添加的数量（默认逐条添加，子类可覆盖为一次写入）"""
+        return sum(1 for essay in essays if self.add_essay(essay))
+
     @abstractmethod
     def search_materials(self, query: str, top_k: int = 5) -> List[WritingMaterial]:
         """搜索写作素材"""
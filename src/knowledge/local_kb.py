@@ -1,23 +1,464 @@
 """
 本地文件系统知识库实现
-使用本地JSON文件存储知识库数据
+使用本地JSON快照 + JSON Lines 追加日志存储知识库数据
 """
+import functools
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from collections import defaultdict
+from typing import AbstractSet, List, Dict, Any, FrozenSet, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import orjson
 from loguru import logger
 
 from .base import BaseKnowledgeBase
 from ..core.models import WritingMaterial, SampleEssay, EssayType, DifficultyLevel
 from ..core.utils import (
-    load_json_file, save_json_file, generate_id,
-    extract_keywords, calculate_similarity
+    load_json_file, save_json_file, read_file_bytes, generate_id,
+    extract_keywords, segment_chinese_text
 )
 
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+
+# 追加日志的条目数超过 max(该值, 记录数) 时自动压缩
+LOG_COMPACT_MIN_ENTRIES = 256
+# 追加写日志使用的缓冲区大小
+_LOG_BUFFER_SIZE = 1 << 16
+# 检索结果缓存的条目数
+SEARCH_CACHE_SIZE = 512
+# 快照文件超过该大小且安装了 ijson 时流式解析，不把整个文件读入内存
+STREAM_LOAD_MIN_BYTES = 8 << 20
+
+
+class _TermMatrix:
+    """词-记录倒排矩阵：每个词对应包含它的行号数组
+
+    与查询词集合的交集大小用一次 np.bincount 对所有行同时求出，
+    再按 |交集| / (|查询| + |记录| - |交集|) 得到与 jaccard_similarity 完全相同的分数。
+    """
+
+    def __init__(self, term_sets: List[FrozenSet[str]]):
+        self.size = len(term_sets)
+        self.lengths = np.fromiter((len(terms) for terms in term_sets), dtype=np.float64, count=self.size)
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for row, terms in enumerate(term_sets):
+            for term in terms:
+                postings[term].append(row)
+        self.postings = {term: np.asarray(rows, dtype=np.int64) for term, rows in postings.items()}
+
+    def matches_any(self, terms: AbstractSet[str]) -> bool:
+        """是否有任意一行包含给定词集合中的词"""
+        return not self.postings.keys().isdisjoint(terms)
+
+    def overlap(self, terms: AbstractSet[str]) -> np.ndarray:
+        """每一行与给定词集合的交集大小"""
+        hits = [self.postings[term] for term in terms if term in self.postings]
+        if not hits:
+            return np.zeros(self.size)
+        return np.bincount(np.concatenate(hits), minlength=self.size).astype(np.float64)
+
+    def jaccard(self, terms: AbstractSet[str]) -> np.ndarray:
+        """每一行与给定词集合的 Jaccard 相似度"""
+        if not terms:
+            return np.zeros(self.size)
+        overlap = self.overlap(terms)
+        union = len(terms) + self.lengths - overlap
+        return overlap / union
+
+
+def _top_rows(scores: np.ndarray, min_score: float, top_k: int) -> np.ndarray:
+    """分数高于 min_score 的前 top_k 行，按分数降序
+
+    先用 np.partition 在线性时间内找出第 k 大的分数，只对入选的 k 行排序；
+    与第 k 名同分的行按行号先后补足，结果与对全部行做稳定排序后截断一致。
+    """
+    rows = np.flatnonzero(scores > min_score)
+    if top_k <= 0:
+        return rows[:0]
+    if len(rows) > top_k:
+        candidate_scores = scores[rows]
+        kth = np.partition(candidate_scores, len(rows) - top_k)[len(rows) - top_k]
+        above = rows[candidate_scores > kth]
+        ties = rows[candidate_scores == kth][:top_k - len(above)]
+        rows = np.concatenate([above, ties])
+    return rows[np.argsort(-scores[rows], kind="stable")]
+
+
+class _RecordStore:
+    """单个数据集的读写：JSON快照 + 追加写的 JSON Lines 日志
+
+    快照文件（如 materials.json）保存压缩后的完整记录；之后的每次修改只向同名的
+    .jsonl 日志追加一行：新增写入完整记录，更新只写入变化的字段
+    {"id": ..., "_patch": {...}, "_unset": [...]}，删除写入墓碑 {"id": ..., "_deleted": true}。
+    加载时先读快照再按顺序回放日志；日志过长时压缩回快照并清空日志。
+
+    解析结果按两个文件的 (mtime, size) 缓存，文件未变化时直接返回缓存；
+    通过本对象修改后缓存同步更新，其他进程修改文件后下次读取会重新加载。
+
+    与缓存一同维护：
+    - ID 索引：id -> 记录，按ID查找为 O(1)，同时按插入顺序保存全部记录
+    - 每条记录预先计算的分词/关键词集合，以及据此按需构建的词-记录矩阵（_TermMatrix），
+      检索时一次算出全部记录的相似度
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        root_key: str,
+        text_fields: Tuple[str, ...] = ("title", "content"),
+        keyword_field: Optional[str] = None
+    ):
+        self.file_path = file_path
+        self.log_path = os.path.splitext(file_path)[0] + ".jsonl"
+        self.root_key = root_key
+        # 参与倒排索引的文本字段（分词后建索引）和关键词列表字段
+        self.text_fields = text_fields
+        self.keyword_field = keyword_field
+        # 修改操作（读-改-写）需持有该锁，保证并发修改不互相覆盖
+        self.lock = threading.RLock()
+        self._loaded = False
+        self._signature: Optional[tuple] = None
+        # 日志中尚未压缩的条目数
+        self._log_entries = 0
+        # load() 返回的记录列表，记录变化后重新生成
+        self._records: Optional[List[Dict[str, Any]]] = None
+
+        # load() 返回的列表对应的各字段词-记录矩阵，记录变化后按需重建
+        self._term_matrices: Optional[Dict[str, _TermMatrix]] = None
+        # 数据版本号，记录每变化一次（包括从文件重新加载）加一
+        self._version = 0
+
+        self._id_index: Dict[str, Dict[str, Any]] = {}
+        # 每条记录预先计算的特征：字段名 -> 分词集合（关键词字段为关键词集合），
+        # 与记录分开保存，不会被写入文件
+        self._features: Dict[str, Dict[str, FrozenSet[str]]] = {}
+
+    @staticmethod
+    def _stat(path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _file_signature(self) -> tuple:
+        return self._stat(self.file_path), self._stat(self.log_path)
+
+    def load(self) -> List[Dict[str, Any]]:
+        """加载记录列表（返回的列表为缓存本身，不要直接修改）"""
+        with self.lock:
+            signature = self._file_signature()
+            if not self._loaded or signature != self._signature:
+                self._reload(signature)
+
+            if self._records is None:
+                self._records = list(self._id_index.values())
+            return self._records
+
+    def term_matrices(self) -> Tuple[List[Dict[str, Any]], Dict[str, "_TermMatrix"]]:
+        """返回记录列表及与之逐行对应的各字段词-记录矩阵"""
+        with self.lock:
+            records = self.load()
+            if self._term_matrices is None:
+                fields = self.text_fields + ((self.keyword_field,) if self.keyword_field else ())
+                self._term_matrices = {
+                    field: _TermMatrix([self._features[r["id"]][field] for r in records])
+                    for field in fields
+                }
+            return records, self._term_matrices
+
+    def save(self, records: List[Dict[str, Any]]) -> bool:
+        """用给定记录整体重写快照并清空日志"""
+        with self.lock:
+            self._rebuild_indexes(records)
+            return self._write_snapshot()
+
+    def compact(self) -> bool:
+        """把当前记录写回快照并清空日志"""
+        with self.lock:
+            self.load()
+            return self._write_snapshot()
+
+    def signature(self) -> tuple:
+        """当前记录对应的快照和日志文件的 (mtime, size)；任何一方修改文件（包括压缩）后都会变化"""
+        with self.lock:
+            self.load()
+            return self._signature
+
+    def version(self) -> int:
+        """当前数据版本号（会先检查文件是否被外部修改）"""
+        with self.lock:
+            self.load()
+            return self._version
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """按ID查找记录"""
+        with self.lock:
+            self.load()
+            return self._id_index.get(record_id)
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """追加一条记录（ID已存在时返回 False）"""
+        with self.lock:
+            self.load()
+            if record["id"] in self._id_index:
+                return False
+            if not self._append_log(record):
+                return False
+            self._index_record(record)
+            self._after_mutation()
+            return True
+
+    def add_many(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量追加记录，一次写入日志；跳过ID已存在的记录，返回实际添加的记录"""
+        with self.lock:
+            self.load()
+            added: Dict[str, Dict[str, Any]] = {}
+            for record in records:
+                if record["id"] not in self._id_index and record["id"] not in added:
+                    added[record["id"]] = record
+            if not added:
+                return []
+            if not self._append_log(*added.values()):
+                return []
+            for record in added.values():
+                self._index_record(record)
+            self._after_mutation(len(added))
+            return list(added.values())
+
+    def replace(self, record: Dict[str, Any]) -> bool:
+        """用新记录替换同ID的旧记录（不存在时返回 False）"""
+        with self.lock:
+            self.load()
+            old = self._id_index.get(record.get("id"))
+            if old is None:
+                return False
+            patch = self._diff(old, record)
+            if patch is None:
+                return True
+            if not self._append_log(patch):
+                return False
+            # 同ID重新赋值，记录在列表中的位置不变
+            self._index_record(record)
+            self._after_mutation()
+            return True
+
+    def delete(self, record_id: str) -> bool:
+        """删除指定ID的记录（不存在时返回 False）"""
+        with self.lock:
+            self.load()
+            old = self._id_index.get(record_id)
+            if old is None:
+                return False
+            if not self._append_log({"id": record_id, "_deleted": True}):
+                return False
+            self._unindex_record(old)
+            self._after_mutation()
+            return True
+
+    def _reload(self, signature: tuple):
+        """读取快照并回放日志"""
+        snapshot = signature[0]
+        if IJSON_AVAILABLE and snapshot is not None and snapshot[1] >= STREAM_LOAD_MIN_BYTES:
+            try:
+                self._rebuild_indexes(self._stream_snapshot())
+            except Exception as e:
+                logger.error(f"加载JSON文件失败 {self.file_path}: {e}")
+                self._rebuild_indexes([])
+        else:
+            data = load_json_file(self.file_path)
+            # 兼容两种格式：直接数组格式和对象格式
+            if isinstance(data, list):
+                records = data
+            elif isinstance(data, dict):
+                records = data.get(self.root_key, [])
+            else:
+                records = []
+            self._rebuild_indexes(records)
+
+        self._log_entries = 0
+        if signature[1] is not None:
+            for line_no, line in enumerate(read_file_bytes(self.log_path).splitlines(), 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = orjson.loads(line)
+                except ValueError:
+                    # 写入中断可能留下不完整的最后一行
+                    logger.warning(f"跳过损坏的日志行: {self.log_path}:{line_no}")
+                    continue
+                self._apply_log_entry(entry)
+                self._log_entries += 1
+
+        self._signature = signature
+        self._loaded = True
+
+    def _stream_snapshot(self) -> Iterator[Dict[str, Any]]:
+        """用 ijson 逐条解析快照中的记录，同样兼容数组格式和对象格式"""
+        with open(self.file_path, "rb") as f:
+            head = f.read(64).lstrip()
+            f.seek(0)
+            prefix = "item" if head.startswith(b"[") else f"{self.root_key}.item"
+            for record in ijson.items(f, prefix, use_float=True):
+                if isinstance(record, dict):
+                    yield record
+
+    @staticmethod
+    def _diff(old: Dict[str, Any], new: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """新旧记录的差异日志条目 {"id", "_patch": 变化的字段, "_unset": 删除的字段}，无变化时返回 None"""
+        patch = {key: value for key, value in new.items() if key not in old or old[key] != value}
+        unset = [key for key in old if key not in new]
+        if not patch and not unset:
+            return None
+        entry = {"id": new["id"], "_patch": patch}
+        if unset:
+            entry["_unset"] = unset
+        return entry
+
+    def _apply_log_entry(self, entry: Dict[str, Any]):
+        record_id = entry.get("id")
+        if not record_id:
+            return
+        if entry.get("_deleted"):
+            self._unindex_record(entry)
+        elif "_patch" in entry:
+            old = self._id_index.get(record_id)
+            if old is None:
+                return
+            record = {**old, **entry["_patch"]}
+            for key in entry.get("_unset", ()):
+                record.pop(key, None)
+            self._index_record(record)
+        else:
+            # 已存在的ID重新赋值，记录在列表中的位置不变
+            self._index_record(entry)
+
+    def _append_log(self, *entries: Dict[str, Any]) -> bool:
+        try:
+            with open(self.log_path, "ab", buffering=_LOG_BUFFER_SIZE) as f:
+                f.write(b"".join(orjson.dumps(entry) + b"\n" for entry in entries))
+            return True
+        except Exception as e:
+            logger.error(f"写入日志失败: {e}")
+            # 日志可能只写入了一部分，下次读取时从文件重新加载
+            self._loaded = False
+            return False
+
+    def _after_mutation(self, entries: int = 1):
+        self._invalidate_views()
+        self._log_entries += entries
+        self._signature = self._file_signature()
+        if self._log_entries > max(LOG_COMPACT_MIN_ENTRIES, len(self._id_index)):
+            self._write_snapshot()
+
+    def _write_snapshot(self) -> bool:
+        """把内存中的记录写入快照并清空日志（调用方需持有锁）"""
+        records = list(self._id_index.values())
+        if not save_json_file({self.root_key: records}, self.file_path):
+            # 快照写入失败，日志保持不变，下次读取时从文件重新加载
+            self._loaded = False
+            return False
+
+        try:
+            # 先写快照再清空日志：中途失败时日志回放到新快照上结果不变
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+        except OSError as e:
+            logger.error(f"清空日志失败: {e}")
+        self._log_entries = 0
+        self._signature = self._file_signature()
+        self._loaded = True
+        return True
+
+    def _invalidate_views(self):
+        self._records = None
+        self._term_matrices = None
+        self._version += 1
+
+    def _rebuild_indexes(self, records: Iterable[Dict[str, Any]]):
+        self._invalidate_views()
+        self._id_index = {}
+        self._features = {}
+        for record in records:
+            if not record.get("id"):
+                # 旧数据可能缺少ID，按添加时的规则补一个（仅在内存中）
+                record["id"] = generate_id(f"{record.get('title', '')}_{record.get('content', '')[:100]}")
+            if record["id"] in self._id_index:
+                # 与按ID查找的语义一致，重复ID只保留第一条
+                logger.warning(f"忽略重复ID的记录: {record['id']}")
+                continue
+            self._index_record(record)
+
+    def _index_record(self, record: Dict[str, Any]):
+        self._id_index[record["id"]] = record
+        self._features[record["id"]] = self._compute_features(record)
+
+    def _unindex_record(self, record: Dict[str, Any]):
+        self._id_index.pop(record["id"], None)
+        self._features.pop(record["id"], None)
+
+    def _compute_features(self, record: Dict[str, Any]) -> Dict[str, FrozenSet[str]]:
+        """分词结果和关键词集合只在记录载入或修改时计算一次"""
+        features = {}
+        for field in self.text_fields:
+            text = record.get(field)
+            features[field] = frozenset(segment_chinese_text(text)) if text else frozenset()
+        if self.keyword_field:
+            features[self.keyword_field] = frozenset(record.get(self.keyword_field) or ())
+        return features
+
+
+class _SemanticQueryCache:
+    """近似查询复用检索结果
+
+    基于 SemanticCache：查询文本规范化后先精确匹配，再按向量余弦相似度匹配近似查询。
+    值为 {top_k: 记录ID元组}；数据版本变化后整体清空。
+    """
+
+    def __init__(self, model: str, threshold: float = 0.95, max_entries: int = 1024):
+        # 延迟导入，避免 knowledge -> generation -> retrieval -> knowledge 的循环导入
+        from ..generation.semantic_cache import SemanticCache
+
+        self._cache = SemanticCache(model=model, threshold=threshold, ttl=86400, max_entries=max_entries)
+        self._canonicalize = SemanticCache.canonicalize
+        self._version = -1
+        self._lock = threading.Lock()
+
+    def get(self, query: str, top_k: int, version: int) -> Optional[Tuple[str, ...]]:
+        with self._lock:
+            if version > self._version:
+                self._cache.clear()
+                self._version = version
+        ranked = self._cache.get(self._canonicalize(query))
+        return ranked.get(top_k) if ranked else None
+
+    def put(self, query: str, top_k: int, version: int, ids: Tuple[str, ...]):
+        with self._lock:
+            if version != self._version:
+                # 计算期间数据已变化，结果不再写入
+                return
+        key = self._canonicalize(query)
+        ranked = dict(self._cache.get(key) or {})
+        ranked[top_k] = ids
+        self._cache.put(key, ranked)
+
 
 class LocalKnowledgeBase(BaseKnowledgeBase):
     """本地文件系统知识库"""
 
-    def __init__(self, knowledge_path: str):
+    def __init__(self, knowledge_path: str, semantic_cache_model: Optional[str] = None):
+        """
+        Args:
+            knowledge_path: 知识库目录
+            semantic_cache_model: 嵌入模型名称；指定时启用近似查询缓存，
+                与已缓存查询的向量相似度不低于0.95时直接复用其检索结果
+        """
         self.knowledge_path = knowledge_path
         self.materials_file = os.path.join(knowledge_path, "materials.json")
         self.essays_file = os.path.join(knowledge_path, "essays.json")
@@ -25,6 +466,19 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
         # 确保目录存在
         os.makedirs(knowledge_path, exist_ok=True)
 
+        self._materials_store = _RecordStore(self.materials_file, "materials", keyword_field="keywords")
+        self._essays_store = _RecordStore(self.essays_file, "essays")
+
+        # 每个实例独立的检索结果缓存：(查询, top_k, 数据版本) -> 记录ID元组；
+        # 数据变化后版本号递增，旧条目不会再命中，随LRU淘汰
+        self._cached_rank_materials = functools.lru_cache(maxsize=SEARCH_CACHE_SIZE)(self._rank_materials)
+        self._cached_rank_essays = functools.lru_cache(maxsize=SEARCH_CACHE_SIZE)(self._rank_essays)
+        self._materials_query_cache: Optional[_SemanticQueryCache] = None
+        self._essays_query_cache: Optional[_SemanticQueryCache] = None
+        if semantic_cache_model:
+            self._materials_query_cache = _SemanticQueryCache(semantic_cache_model)
+            self._essays_query_cache = _SemanticQueryCache(semantic_cache_model)
+
         # 初始化数据文件
         self._init_data_files()
 
@@ -38,63 +492,41 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
 
     def _load_materials(self) -> List[Dict[str, Any]]:
         """加载素材数据"""
-        data = load_json_file(self.materials_file)
-        if not data:
-            return []
-
-        # 兼容两种格式：直接数组格式和对象格式
-        if isinstance(data, list):
-            # 直接是数组格式
-            return data
-        elif isinstance(data, dict):
-            # 对象格式，包含 materials 键
-            return data.get("materials", [])
-        else:
-            return []
+        return self._materials_store.load()
 
     def _save_materials(self, materials: List[Dict[str, Any]]) -> bool:
         """保存素材数据"""
-        return save_json_file({"materials": materials}, self.materials_file)
+        return self._materials_store.save(materials)
 
     def _load_essays(self) -> List[Dict[str, Any]]:
         """加载范文数据"""
-        data = load_json_file(self.essays_file)
-        if not data:
-            return []
-
-        # 兼容两种格式：直接数组格式和对象格式
-        if isinstance(data, list):
-            # 直接是数组格式
-            return data
-        elif isinstance(data, dict):
-            # 对象格式，包含 essays 键
-            return data.get("essays", [])
-        else:
-            return []
+        return self._essays_store.load()
 
     def _save_essays(self, essays: List[Dict[str, Any]]) -> bool:
         """保存范文数据"""
-        return save_json_file({"essays": essays}, self.essays_file)
+        return self._essays_store.save(essays)
+
+    def compact(self) -> bool:
+        """把追加日志合并回JSON快照（日志过长时修改操作也会自动触发）"""
+        materials_ok = self._materials_store.compact()
+        essays_ok = self._essays_store.compact()
+        return materials_ok and essays_ok
 
     def add_material(self, material: WritingMaterial) -> bool:
         """添加写作素材"""
         try:
-            materials = self._load_materials()
-
-            # 生成ID如果没有
-            if not material.id:
-                material.id = generate_id(f"{material.title}_{material.content[:100]}")
-
-            # 检查是否已存在
-            if any(m.get("id") == material.id for m in materials):
-                logger.warning(f"素材已存在: {material.id}")
-                return False
-
-            # 添加到列表
-            material_dict = material.model_dump()
-            materials.append(material_dict)
-
-            return self._save_materials(materials)
+            with self._materials_store.lock:
+                # 生成ID如果没有
+                if not material.id:
+                    material.id = generate_id(f"{material.title}_{material.content[:100]}")
+
+                # 检查是否已存在
+                if self._materials_store.get(material.id) is not None:
+                    logger.warning(f"素材已存在: {material.id}")
+                    return False
+
+                # 添加到列表
+                return self._materials_store.add(material.model_dump(mode='json', exclude_none=True))
         except Exception as e:
             logger.error(f"添加素材失败: {e}")
             return False
@@ -102,57 +534,65 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
     def add_essay(self, essay: SampleEssay) -> bool:
         """添加范文"""
         try:
-            essays = self._load_essays()
-
-            # 生成ID如果没有
-            if not essay.id:
-                essay.id = generate_id(f"{essay.title}_{essay.content[:100]}")
-
-            # 检查是否已存在
-            if any(e.get("id") == essay.id for e in essays):
-                logger.warning(f"范文已存在: {essay.id}")
-                return False
-
-            # 添加到列表
-            essay_dict = essay.dict()
-            essays.append(essay_dict)
-
-            return self._save_essays(essays)
+            with self._essays_store.lock:
+                # 生成ID如果没有
+                if not essay.id:
+                    essay.id = generate_id(f"{essay.title}_{essay.content[:100]}")
+
+                # 检查是否已存在
+                if self._essays_store.get(essay.id) is not None:
+                    logger.warning(f"范文已存在: {essay.id}")
+                    return False
+
+                # 添加到列表
+                return self._essays_store.add(essay.model_dump(mode='json', exclude_none=True))
         except Exception as e:
             logger.error(f"添加范文失败: {e}")
             return False
 
-    def search_materials(self, query: str, top_k: int = 5) -> List[WritingMaterial]:
-        """搜索写作素材"""
+    def add_materials_bulk(self, materials: List[WritingMaterial]) -> int:
+        """批量添加写作素材，只写入一次，返回实际添加的数量"""
         try:
-            materials = self._load_materials()
-            scored_materials = []
-
-            # 提取查询关键词
-            query_keywords = extract_keywords(query)
-
-            for material_dict in materials:
-                # 计算相似度分数
-                title_score = calculate_similarity(query, material_dict.get("title", ""))
-                content_score = calculate_similarity(query, material_dict.get("content", ""))
-
-                # 关键词匹配分数
-                material_keywords = material_dict.get("keywords", [])
-                keyword_score = len(set(query_keywords) & set(material_keywords)) / max(len(query_keywords), 1)
-
-                # 综合分数
-                total_score = title_score * 0.4 + content_score * 0.4 + keyword_score * 0.2
+            for material in materials:
+                if not material.id:
+                    material.id = generate_id(f"{material.title}_{material.content[:100]}")
+
+            added = self._materials_store.add_many([m.model_dump(mode='json', exclude_none=True) for m in materials])
+            if len(added) < len(materials):
+                logger.warning(f"跳过已存在的素材 {len(materials) - len(added)} 条")
+            return len(added)
+        except Exception as e:
+            logger.error(f"批量添加素材失败: {e}")
+            return 0
 
-                if total_score > 0.1:  # 过滤掉分数太低的结果
-                    scored_materials.append((total_score, material_dict))
+    def add_essays_bulk(self, essays: List[SampleEssay]) -> int:
+        """批量添加范文，只写入一次，返回实际添加的数量"""
+        try:
+            for essay in essays:
+                if not essay.id:
+                    essay.id = generate_id(f"{essay.title}_{essay.content[:100]}")
+
+            added = self._essays_store.add_many([e.model_dump(mode='json', exclude_none=True) for e in essays])
+            if len(added) < len(essays):
+                logger.warning(f"跳过已存在的范文 {len(essays) - len(added)} 条")
+            return len(added)
+        except Exception as e:
+            logger.error(f"批量添加范文失败: {e}")
+            return 0
 
-            # 按分数排序并返回top_k
-            scored_materials.sort(key=lambda x: x[0], reverse=True)
-            top_materials = scored_materials[:top_k]
+    def search_materials(self, query: str, top_k: int = 5) -> List[WritingMaterial]:
+        """搜索写作素材"""
+        try:
+            material_ids = self._search_ids(
+                self._materials_store, self._cached_rank_materials, self._materials_query_cache, query, top_k
+            )
 
             # 转换为WritingMaterial对象
             result = []
-            for score, material_dict in top_materials:
+            for material_id in material_ids:
+                material_dict = self._materials_store.get(material_id)
+                if material_dict is None:
+                    continue
                 try:
                     material = WritingMaterial(**material_dict) #这里的 **material_dict 语法叫做“字典解包”，它的作用是把字典里的每个 key-value 对，作为关键字参数传递给 WritingMaterial 的构造函数。
                     result.append(material)#dict 不是直接“取 value”，而是把 key-value 对映射到参数名和值。
@@ -168,30 +608,16 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
     def search_essays(self, query: str, top_k: int = 3) -> List[SampleEssay]:
         """搜索范文"""
         try:
-            essays = self._load_essays()
-            scored_essays = []
-
-            # 提取查询关键词
-            query_keywords = extract_keywords(query)
-
-            for essay_dict in essays:
-                # 计算相似度分数
-                title_score = calculate_similarity(query, essay_dict.get("title", ""))
-                content_score = calculate_similarity(query, essay_dict.get("content", ""))
-
-                # 综合分数
-                total_score = title_score * 0.5 + content_score * 0.5
-
-                if total_score > 0.1:
-                    scored_essays.append((total_score, essay_dict))
-
-            # 按分数排序并返回top_k
-            scored_essays.sort(key=lambda x: x[0], reverse=True)
-            top_essays = scored_essays[:top_k]
+            essay_ids = self._search_ids(
+                self._essays_store, self._cached_rank_essays, self._essays_query_cache, query, top_k
+            )
 
             # 转换为SampleEssay对象
             result = []
-            for score, essay_dict in top_essays:
+            for essay_id in essay_ids:
+                essay_dict = self._essays_store.get(essay_id)
+                if essay_dict is None:
+                    continue
                 try:
                     essay = SampleEssay(**essay_dict)
                     result.append(essay)
@@ -204,14 +630,80 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
             logger.error(f"搜索范文失败: {e}")
             return []
 
+    @staticmethod
+    def _search_ids(
+        store: _RecordStore,
+        rank,
+        query_cache: Optional[_SemanticQueryCache],
+        query: str,
+        top_k: int
+    ) -> Tuple[str, ...]:
+        """依次查近似查询缓存、精确检索缓存，都未命中时重新打分"""
+        version = store.version()
+        if query_cache is not None:
+            ids = query_cache.get(query, top_k, version)
+            if ids is not None:
+                return ids
+
+        ids = rank(query, top_k, version)
+        if query_cache is not None:
+            query_cache.put(query, top_k, version, ids)
+        return ids
+
+    def _rank_materials(self, query: str, top_k: int, version: int) -> Tuple[str, ...]:
+        """按相似度返回最相关的素材ID（version 只用作检索缓存键的一部分）"""
+        # 查询的分词和关键词只计算一次，素材一侧使用载入时预计算的词-记录矩阵
+        query_tokens = frozenset(segment_chinese_text(query))
+        query_keywords = frozenset(extract_keywords(query))
+
+        materials, matrices = self._materials_store.term_matrices()
+        if not materials:
+            return ()
+
+        # 查询词在标题、内容、关键词中都没有出现时所有分数都为0，跳过打分
+        if not (matrices["title"].matches_any(query_tokens)
+                or matrices["content"].matches_any(query_tokens)
+                or matrices["keywords"].matches_any(query_keywords)):
+            return ()
+
+        # 一次计算所有素材的相似度分数
+        title_scores = matrices["title"].jaccard(query_tokens)
+        content_scores = matrices["content"].jaccard(query_tokens)
+
+        # 关键词匹配分数
+        keyword_scores = matrices["keywords"].overlap(query_keywords) / max(len(query_keywords), 1)
+
+        # 综合分数
+        total_scores = title_scores * 0.4 + content_scores * 0.4 + keyword_scores * 0.2
+
+        # 过滤掉分数太低的结果，取分数最高的top_k（同分保持原顺序）
+        return tuple(materials[row]["id"] for row in _top_rows(total_scores, 0.1, top_k))
+
+    def _rank_essays(self, query: str, top_k: int, version: int) -> Tuple[str, ...]:
+        """按相似度返回最相关的范文ID（version 只用作检索缓存键的一部分）"""
+        query_tokens = frozenset(segment_chinese_text(query))
+
+        essays, matrices = self._essays_store.term_matrices()
+        if not essays:
+            return ()
+
+        if not (matrices["title"].matches_any(query_tokens) or matrices["content"].matches_any(query_tokens)):
+            return ()
+
+        # 一次计算所有范文的相似度分数
+        title_scores = matrices["title"].jaccard(query_tokens)
+        content_scores = matrices["content"].jaccard(query_tokens)
+
+        # 综合分数
+        total_scores = title_scores * 0.5 + content_scores * 0.5
+
+        return tuple(essays[row]["id"] for row in _top_rows(total_scores, 0.1, top_k))
+
     def get_material_by_id(self, material_id: str) -> Optional[WritingMaterial]:
         """根据ID获取素材"""
         try:
-            materials = self._load_materials()
-            for material_dict in materials:
-                if material_dict.get("id") == material_id:
-                    return WritingMaterial(**material_dict)
-            return None
+            material_dict = self._materials_store.get(material_id)
+            return WritingMaterial(**material_dict) if material_dict is not None else None
         except Exception as e:
             logger.error(f"获取素材失败: {e}")
             return None
@@ -219,11 +711,8 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
     def get_essay_by_id(self, essay_id: str) -> Optional[SampleEssay]:
         """根据ID获取范文"""
         try:
-            essays = self._load_essays()
-            for essay_dict in essays:
-                if essay_dict.get("id") == essay_id:
-                    return SampleEssay(**essay_dict)
-            return None
+            essay_dict = self._essays_store.get(essay_id)
+            return SampleEssay(**essay_dict) if essay_dict is not None else None
         except Exception as e:
             logger.error(f"获取范文失败: {e}")
             return None
@@ -271,13 +760,7 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
     def delete_material(self, material_id: str) -> bool:
         """删除素材"""
         try:
-            materials = self._load_materials()
-            original_length = len(materials)
-            materials = [m for m in materials if m.get("id") != material_id]
-
-            if len(materials) < original_length:
-                return self._save_materials(materials)
-            return False
+            return self._materials_store.delete(material_id)
         except Exception as e:
             logger.error(f"删除素材失败: {e}")
             return False
@@ -285,13 +768,7 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
     def delete_essay(self, essay_id: str) -> bool:
         """删除范文"""
         try:
-            essays = self._load_essays()
-            original_length = len(essays)
-            essays = [e for e in essays if e.get("id") != essay_id]
-
-            if len(essays) < original_length:
-                return self._save_essays(essays)
-            return False
+            return self._essays_store.delete(essay_id)
         except Exception as e:
             logger.error(f"删除范文失败: {e}")
             return False
@@ -299,14 +776,7 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
     def update_material(self, material: WritingMaterial) -> bool:
         """更新素材"""
         try:
-            materials = self._load_materials()
-
-            for i, m in enumerate(materials):
-                if m.get("id") == material.id:
-                    materials[i] = material.dict()
-                    return self._save_materials(materials)
-
-            return False
+            return self._materials_store.replace(material.model_dump(mode='json', exclude_none=True))
         except Exception as e:
             logger.error(f"更新素材失败: {e}")
             return False
@@ -314,14 +784,7 @@ class LocalKnowledgeBase(BaseKnowledgeBase):
     def update_essay(self, essay: SampleEssay) -> bool:
         """更新范文"""
         try:
-            essays = self._load_essays()
-
-            for i, e in enumerate(essays):
-                if e.get("id") == essay.id:
-                    essays[i] = essay.dict()
-                    return self._save_essays(essays)
-
-            return False
+            return self._essays_store.replace(essay.model_dump(mode='json', exclude_none=True))
         except Exception as e:
             logger.error(f"更新范文失败: {e}")
             return False
@@ -0,0 +1,289 @@
+"""
+基于 Whoosh 倒排索引的知识库实现
+JSON 文件仍作为数据的持久化存储，检索交给 Whoosh 的 BM25F 打分
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from .local_kb import LocalKnowledgeBase, _RecordStore
+from ..core.models import WritingMaterial, SampleEssay
+
+try:
+    from whoosh import index
+    from whoosh.fields import Schema, ID, TEXT, KEYWORD
+    from whoosh.query import Or, Term
+    from whoosh.writing import CLEAR
+    from jieba.analyse import ChineseAnalyzer
+    WHOOSH_AVAILABLE = True
+except ImportError:
+    WHOOSH_AVAILABLE = False
+
+# 参与全文检索的字段
+_MATERIAL_SEARCH_FIELDS = ("title", "content", "keywords")
+_ESSAY_SEARCH_FIELDS = ("title", "content")
+
+
+def _material_schema() -> "Schema":
+    analyzer = ChineseAnalyzer()
+    return Schema(
+        id=ID(stored=True, unique=True),
+        title=TEXT(analyzer=analyzer, field_boost=2.0),
+        content=TEXT(analyzer=analyzer),
+        keywords=KEYWORD(commas=True, scorable=True),
+        category=ID,
+        difficulty_level=ID
+    )
+
+
+def _essay_schema() -> "Schema":
+    analyzer = ChineseAnalyzer()
+    return Schema(
+        id=ID(stored=True, unique=True),
+        title=TEXT(analyzer=analyzer, field_boost=2.0),
+        content=TEXT(analyzer=analyzer),
+        essay_type=ID,
+        difficulty_level=ID
+    )
+
+
+def _material_document(record: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "id": record["id"],
+        "title": record.get("title") or "",
+        "content": record.get("content") or "",
+        "keywords": ",".join(record.get("keywords") or []),
+        "category": record.get("category") or "",
+        "difficulty_level": str(record.get("difficulty_level") or "")
+    }
+
+
+def _essay_document(record: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "id": record["id"],
+        "title": record.get("title") or "",
+        "content": record.get("content") or "",
+        "essay_type": str(record.get("essay_type") or ""),
+        "difficulty_level": str(record.get("difficulty_level") or "")
+    }
+
+
+class _WhooshIndex:
+    """单个数据集的 Whoosh 索引
+
+    索引旁保存最近一次与 JSON 数据一致时数据文件的签名（_RecordStore.signature()），
+    每次成功写入索引后更新，写入失败时删除；签名对不上说明索引可能过期。
+    """
+
+    def __init__(self, index_dir: str, index_name: str, store: _RecordStore, schema_factory, to_document,
+                 search_fields):
+        self.store = store
+        self.to_document = to_document
+        self.search_fields = search_fields
+        self.synced_path = os.path.join(index_dir, f"{index_name}.synced.json")
+        os.makedirs(index_dir, exist_ok=True)
+        if index.exists_in(index_dir, indexname=index_name):
+            self.ix = index.open_dir(index_dir, indexname=index_name)
+        else:
+            self.ix = index.create_in(index_dir, schema_factory(), indexname=index_name)
+
+    def doc_count(self) -> int:
+        return self.ix.doc_count()
+
+    def is_synced(self) -> bool:
+        """索引是否与数据文件的当前内容一致"""
+        try:
+            with open(self.synced_path, "r", encoding="utf-8") as f:
+                return json.load(f) == json.loads(json.dumps(self.store.signature()))
+        except (OSError, ValueError):
+            return False
+
+    def mark_synced(self):
+        with open(self.synced_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.store.signature(), f)
+        os.replace(self.synced_path + ".tmp", self.synced_path)
+
+    def mark_dirty(self):
+        try:
+            os.remove(self.synced_path)
+        except FileNotFoundError:
+            pass
+
+    def rebuild(self, records: List[Dict[str, Any]]):
+        """清空后重新索引全部记录"""
+        writer = self.ix.writer()
+        try:
+            for record in records:
+                writer.add_document(**self.to_document(record))
+            writer.commit(mergetype=CLEAR)
+        except Exception:
+            writer.cancel()
+            raise
+        self.mark_synced()
+
+    def upsert(self, records: List[Dict[str, Any]]):
+        writer = self.ix.writer()
+        try:
+            for record in records:
+                writer.update_document(**self.to_document(record))
+            writer.commit()
+        except Exception:
+            writer.cancel()
+            self.mark_dirty()
+            raise
+        self.mark_synced()
+
+    def delete(self, record_id: str):
+        writer = self.ix.writer()
+        try:
+            writer.delete_by_term("id", record_id)
+            writer.commit()
+        except Exception:
+            writer.cancel()
+            self.mark_dirty()
+            raise
+        self.mark_synced()
+
+    def search(self, query: str, top_k: int) -> List[str]:
+        """按 BM25F 返回最相关的记录ID"""
+        terms = []
+        for field in self.search_fields:
+            # 用各字段自己的分析器切分查询，不解析查询语法，避免用户输入中的特殊字符出错
+            for token in set(self.ix.schema[field].process_text(query, mode="query")):
+                terms.append(Term(field, token))
+        if not terms:
+            return []
+
+        with self.ix.searcher() as searcher:
+            return [hit["id"] for hit in searcher.search(Or(terms), limit=top_k)]
+
+
+class WhooshKnowledgeBase(LocalKnowledgeBase):
+    """Whoosh 索引知识库
+
+    增删改先写入本地 JSON 存储（与 LocalKnowledgeBase 相同），再同步到 Whoosh 索引；
+    检索由索引完成，只解析命中的记录。启动时索引与数据文件的签名对不上（索引写入失败、
+    其他程序改写了 JSON）或记录数不一致时自动重建。
+    """
+
+    def __init__(self, knowledge_path: str, semantic_cache_model: Optional[str] = None):
+        if not WHOOSH_AVAILABLE:
+            raise ImportError("whoosh 未安装，无法使用 WhooshKnowledgeBase")
+        super().__init__(knowledge_path, semantic_cache_model)
+
+        index_dir = os.path.join(knowledge_path, "whoosh_index")
+        self._materials_index = _WhooshIndex(
+            index_dir, "materials", self._materials_store, _material_schema, _material_document,
+            _MATERIAL_SEARCH_FIELDS
+        )
+        self._essays_index = _WhooshIndex(
+            index_dir, "essays", self._essays_store, _essay_schema, _essay_document, _ESSAY_SEARCH_FIELDS
+        )
+        self._sync_index(self._materials_index, "素材")
+        self._sync_index(self._essays_index, "范文")
+
+    @staticmethod
+    def _sync_index(search_index: _WhooshIndex, label: str):
+        with search_index.store.lock:
+            records = search_index.store.load()
+            if search_index.is_synced() and search_index.doc_count() == len(records):
+                return
+            logger.info(f"重建{label}索引: {len(records)} 条")
+            search_index.rebuild(records)
+
+    def compact(self) -> bool:
+        """合并日志后更新索引记录的文件签名：内容不变，已同步的索引下次启动时不必重建"""
+        success = True
+        for search_index in (self._materials_index, self._essays_index):
+            with search_index.store.lock:
+                synced = search_index.is_synced()
+                if not search_index.store.compact():
+                    success = False
+                elif synced:
+                    search_index.mark_synced()
+        return success
+
+    def add_material(self, material: WritingMaterial) -> bool:
+        """添加写作素材"""
+        if not super().add_material(material):
+            return False
+        return self._index_safely(
+            self._cached_rank_materials, self._materials_index.upsert, [self._materials_store.get(material.id)]
+        )
+
+    def add_materials_bulk(self, materials: List[WritingMaterial]) -> int:
+        """批量添加写作素材，索引一次提交"""
+        added = super().add_materials_bulk(materials)
+        if added:
+            records = [self._materials_store.get(m.id) for m in materials]
+            self._index_safely(
+                self._cached_rank_materials, self._materials_index.upsert, [r for r in records if r is not None]
+            )
+        return added
+
+    def add_essay(self, essay: SampleEssay) -> bool:
+        """添加范文"""
+        if not super().add_essay(essay):
+            return False
+        return self._index_safely(
+            self._cached_rank_essays, self._essays_index.upsert, [self._essays_store.get(essay.id)]
+        )
+
+    def add_essays_bulk(self, essays: List[SampleEssay]) -> int:
+        """批量添加范文，索引一次提交"""
+        added = super().add_essays_bulk(essays)
+        if added:
+            records = [self._essays_store.get(e.id) for e in essays]
+            self._index_safely(
+                self._cached_rank_essays, self._essays_index.upsert, [r for r in records if r is not None]
+            )
+        return added
+
+    def update_material(self, material: WritingMaterial) -> bool:
+        """更新素材"""
+        if not super().update_material(material):
+            return False
+        return self._index_safely(
+            self._cached_rank_materials, self._materials_index.upsert, [self._materials_store.get(material.id)]
+        )
+
+    def update_essay(self, essay: SampleEssay) -> bool:
+        """更新范文"""
+        if not super().update_essay(essay):
+            return False
+        return self._index_safely(
+            self._cached_rank_essays, self._essays_index.upsert, [self._essays_store.get(essay.id)]
+        )
+
+    def delete_material(self, material_id: str) -> bool:
+        """删除素材"""
+        if not super().delete_material(material_id):
+            return False
+        return self._index_safely(self._cached_rank_materials, self._materials_index.delete, material_id)
+
+    def delete_essay(self, essay_id: str) -> bool:
+        """删除范文"""
+        if not super().delete_essay(essay_id):
+            return False
+        return self._index_safely(self._cached_rank_essays, self._essays_index.delete, essay_id)
+
+    def _rank_materials(self, query: str, top_k: int, version: int) -> Tuple[str, ...]:
+        """按 BM25F 返回最相关的素材ID"""
+        return tuple(self._materials_index.search(query, top_k))
+
+    def _rank_essays(self, query: str, top_k: int, version: int) -> Tuple[str, ...]:
+        """按 BM25F 返回最相关的范文ID"""
+        return tuple(self._essays_index.search(query, top_k))
+
+    @staticmethod
+    def _index_safely(search_cache, operation, argument) -> bool:
+        """数据已写入 JSON 后同步索引；索引失败只记录日志，索引已标记为过期，下次启动时重建"""
+        try:
+            operation(argument)
+        except Exception as e:
+            logger.error(f"更新检索索引失败: {e}")
+        # 索引更新前的并发检索可能按新版本号缓存了旧结果
+        search_cache.cache_clear()
+        return True
@@ -2,23 +2,34 @@
 RAG 系统主类
 整合检索和生成功能
 """
-from typing import Dict, Any, Optional
+import asyncio
+from typing import Dict, Any, Optional, Iterator
 from loguru import logger
 
-from src.core.models import EssayPrompt, RAGRequest, RAGResponse, WritingGuidance
+from src.core.models import (
+    EssayPrompt, RAGRequest, RAGResponse, WritingGuidance,
+    WritingMaterial, SampleEssay, EssayType, DifficultyLevel
+)
 from src.core.config import settings
-from src.knowledge import LocalKnowledgeBase, KnowledgeLoader
+from src.core.utils import log_enabled
+from src.knowledge import LocalKnowledgeBase, WhooshKnowledgeBase, WHOOSH_AVAILABLE, KnowledgeLoader
 from src.retrieval import VectorStore, HybridRetriever
 from src.generation import LLMGenerator
 
+# 置信度各项特征的权重，与 _calculate_confidence_score 中的特征一一对应
+_CONFIDENCE_WEIGHTS = (0.2, 0.2, 0.15, 0.15, 0.15, 0.15)
+
 
 class RAGSystem:
     """RAG 系统主类"""
 
     def __init__(self):
         # 初始化组件
-        self.knowledge_base = LocalKnowledgeBase(settings.knowledge_base_path)
-        self.vector_store = VectorStore(settings.vector_db_path)
+        self.knowledge_base = self._create_knowledge_base()
+        self.vector_store = VectorStore(
+            settings.vector_db_path, settings.vector_quantization, settings.vector_index,
+            embedding_cache=settings.embedding_cache
+        )
         self.retriever = HybridRetriever(self.knowledge_base, self.vector_store)
         self.generator = LLMGenerator()
 
@@ -27,6 +38,16 @@ class RAGSystem:
 
         logger.info("RAG 系统初始化完成")
 
+    @staticmethod
+    def _create_knowledge_base() -> LocalKnowledgeBase:
+        """按配置选择知识库检索后端"""
+        semantic_cache_model = settings.embedding_model if settings.knowledge_semantic_cache else None
+        if settings.knowledge_base_backend == "whoosh":
+            if WHOOSH_AVAILABLE:
+                return WhooshKnowledgeBase(settings.knowledge_base_path, semantic_cache_model)
+            logger.warning("whoosh 未安装，知识库使用本地检索")
+        return LocalKnowledgeBase(settings.knowledge_base_path, semantic_cache_model)
+
     def initialize(self, load_sample_data: bool = True) -> bool:
         """初始化系统"""
         try:
@@ -50,17 +71,8 @@ class RAGSystem:
     def process_request(self, request: RAGRequest) -> RAGResponse:
         """处理 RAG 请求"""
         try:
-            logger.info("=" * 80)
-            logger.info("🎯 开始处理RAG请求")
-
-            # 记录请求信息
             prompt = request.prompt
-            logger.info(f"📝 处理作文题目: {prompt.title}")
-            logger.info(f"📖 题目描述: {prompt.description or '无'}")
-            logger.info(f"🎯 作文类型: {prompt.essay_type}")
-            logger.info(f"📊 难度等级: {prompt.difficulty_level}")
-            logger.info(f"🔑 关键词: {prompt.keywords}")
-            logger.info(f"👤 用户额外要求: {request.user_requirements or '无'}")
+            self._log_request(request)
 
             if not self.is_initialized:
                 logger.warning("⚠️ 系统未初始化，尝试自动初始化")
@@ -72,65 +84,18 @@ class RAGSystem:
                 prompt,
                 top_k=settings.retrieval_top_k
             )
-
-            materials = retrieval_results.get("materials", [])
-            essays = retrieval_results.get("essays", [])
-
-            # 记录检索结果
-            logger.info("📚 检索结果统计:")
-            logger.info(f"  - 相关素材: {len(materials)} 个")
-            logger.info(f"  - 相关范文: {len(essays)} 篇")
-            logger.info(f"  - 总检索结果: {retrieval_results.get('total_results', 0)} 项")
-            logger.info(f"  - 检索查询: {retrieval_results.get('query_text', '')}")
-
-            if materials:
-                logger.info("📄 检索到的素材详情:")
-                for i, material in enumerate(materials[:3], 1):
-                    logger.info(f"  {i}. 【{material.category}】{material.title}")
-                    if hasattr(material, 'score'):
-                        logger.info(f"     相似度得分: {material.score:.3f}")
-
-            if essays:
-                logger.info("📝 检索到的范文详情:")
-                for i, essay in enumerate(essays[:3], 1):
-                    logger.info(f"  {i}. 【{essay.essay_type}】{essay.title}")
-                    if hasattr(essay, 'score'):
-                        logger.info(f"     相似度得分: {essay.score:.3f}")
+            self._log_retrieval_results(retrieval_results)
 
             # 生成写作指导
             logger.info("🤖 开始生成写作指导...")
-            context = f"用户要求: {request.user_requirements}" if request.user_requirements else ""
-
             guidance = self.generator.generate_guidance(
                 prompt=prompt,
-                materials=materials,
-                essays=essays,
-                context=context
+                materials=retrieval_results.get("materials", []),
+                essays=retrieval_results.get("essays", []),
+                context=self._request_context(request)
             )
 
-            # 计算置信度分数
-            logger.info("📊 计算置信度分数...")
-            confidence_score = self._calculate_confidence_score(
-                retrieval_results, guidance
-            )
-            logger.info(f"📊 最终置信度得分: {confidence_score:.3f}")
-
-            # 构建响应
-            response = RAGResponse(
-                guidance=guidance,
-                confidence_score=confidence_score,
-                retrieval_info={
-                    "materials_count": len(materials),
-                    "essays_count": len(essays),
-                    "total_results": retrieval_results.get("total_results", 0),
-                    "query_text": retrieval_results.get("query_text", "")
-                },
-                generation_info={
-                    "generator_type": "LLM" if self._is_generator_available() else "Mock",
-                    "provider": self.generator.provider,
-                    "model_name": self._get_current_model_name()
-                }
-            )
+            response = self._build_response(retrieval_results, guidance)
 
             logger.info("✅ RAG请求处理完成")
             logger.info("=" * 80)
@@ -138,68 +103,198 @@ class RAGSystem:
             return response
 
         except Exception as e:
-            logger.error(f"❌ 处理RAG请求失败: {e}")
-            logger.error("=" * 80)
-
-            # 返回错误响应
-            fallback_guidance = WritingGuidance(
-                theme_analysis="系统暂时无法分析题目，请稍后重试。",
-                structure_suggestion=["请根据题目要求规划文章结构"],
-                writing_tips=["注意语言表达的准确性"],
-                key_points=["紧扣题目要求"],
-                reference_materials=[],
-                sample_essays=[]
-            )
+            return self._error_response(e)
 
-            return RAGResponse(
-                guidance=fallback_guidance,
-                confidence_score=0.0,
-                retrieval_info={"error": str(e)},
-                generation_info={"error": str(e)}
-            )
+    async def aprocess_request(self, request: RAGRequest) -> RAGResponse:
+        """异步处理 RAG 请求
 
-    def _calculate_confidence_score(
-        self,
-        retrieval_results: Dict[str, Any],
-        guidance: WritingGuidance
-    ) -> float:
-        """计算置信度分数"""
+        检索的两路在线程池中并发执行，生成使用异步 HTTP 客户端，
+        等待期间事件循环可以处理其他请求。
+        """
         try:
-            score = 0.0
-
-            # 检索结果质量 (40%)
-            materials_count = len(retrieval_results.get("materials", []))
-            essays_count = len(retrieval_results.get("essays", []))
+            prompt = request.prompt
+            self._log_request(request)
 
-            if materials_count > 0:
-                score += 0.2 * min(materials_count / 3, 1.0)  # 最多3个素材
+            if not self.is_initialized:
+                logger.warning("⚠️ 系统未初始化，尝试自动初始化")
+                await asyncio.to_thread(self.initialize)
 
-            if essays_count > 0:
-                score += 0.2 * min(essays_count / 2, 1.0)    # 最多2个范文
+            logger.info("🔍 开始检索相关内容...")
+            retrieval_results = await self.retriever.aretrieve_for_prompt(
+                prompt,
+                top_k=settings.retrieval_top_k
+            )
+            self._log_retrieval_results(retrieval_results)
 
-            # 生成内容质量 (60%)
-            if guidance.theme_analysis and len(guidance.theme_analysis) > 10:
-                score += 0.15
+            logger.info("🤖 开始生成写作指导...")
+            guidance = await self.generator.agenerate_guidance(
+                prompt=prompt,
+                materials=retrieval_results.get("materials", []),
+                essays=retrieval_results.get("essays", []),
+                context=self._request_context(request)
+            )
 
-            if guidance.structure_suggestion and len(guidance.structure_suggestion) >= 3:
-                score += 0.15
+            response = self._build_response(retrieval_results, guidance)
 
-            if guidance.writing_tips and len(guidance.writing_tips) >= 3:
-                score += 0.15
+            logger.info("✅ RAG请求处理完成")
+            logger.info("=" * 80)
 
-            if guidance.key_points and len(guidance.key_points) >= 3:
-                score += 0.15
+            return response
 
-            return min(score, 1.0)
         except Exception as e:
-            logger.error(f"计算置信度失败: {e}")
-            return 0.5
+            return self._error_response(e)
+
+    @staticmethod
+    def _log_request(request: RAGRequest):
+        """记录请求信息"""
+        logger.info("=" * 80)
+        logger.info("🎯 开始处理RAG请求")
+
+        prompt = request.prompt
+        # 参数交给 loguru，日志级别被过滤时不做格式化
+        logger.info("📝 处理作文题目: {}", prompt.title)
+        logger.info("📖 题目描述: {}", prompt.description or '无')
+        logger.info("🎯 作文类型: {}", prompt.essay_type)
+        logger.info("📊 难度等级: {}", prompt.difficulty_level)
+        logger.info("🔑 关键词: {}", prompt.keywords)
+        logger.info("👤 用户额外要求: {}", request.user_requirements or '无')
+
+    @staticmethod
+    def _log_retrieval_results(retrieval_results: Dict[str, Any]):
+        """记录检索结果"""
+        materials = retrieval_results.get("materials", [])
+        essays = retrieval_results.get("essays", [])
+
+        logger.info("📚 检索结果统计:")
+        logger.info("  - 相关素材: {} 个", len(materials))
+        logger.info("  - 相关范文: {} 篇", len(essays))
+        logger.info("  - 总检索结果: {} 项", retrieval_results.get('total_results', 0))
+        logger.info("  - 检索查询: {}", retrieval_results.get('query_text', ''))
+
+        # 逐条详情只在 DEBUG 级别输出，未开启时整个循环跳过
+        if not log_enabled("DEBUG"):
+            return
+
+        if materials:
+            logger.debug("📄 检索到的素材详情:")
+            for i, material in enumerate(materials[:3], 1):
+                logger.debug("  {}. 【{}】{}", i, material.category, material.title)
+                if hasattr(material, 'score'):
+                    logger.debug("     相似度得分: {:.3f}", material.score)
+
+        if essays:
+            logger.debug("📝 检索到的范文详情:")
+            for i, essay in enumerate(essays[:3], 1):
+                logger.debug("  {}. 【{}】{}", i, essay.essay_type, essay.title)
+                if hasattr(essay, 'score'):
+                    logger.debug("     相似度得分: {:.3f}", essay.score)
+
+    @staticmethod
+    def _request_context(request: RAGRequest) -> str:
+        return f"用户要求: {request.user_requirements}" if request.user_requirements else ""
+
+    @staticmethod
+    def _error_response(error: Exception) -> RAGResponse:
+        """处理失败时返回的兜底响应"""
+        logger.error(f"❌ 处理RAG请求失败: {error}")
+        logger.error("=" * 80)
+
+        fallback_guidance = WritingGuidance(
+            theme_analysis="系统暂时无法分析题目，请稍后重试。",
+            structure_suggestion=["请根据题目要求规划文章结构"],
+            writing_tips=["注意语言表达的准确性"],
+            key_points=["紧扣题目要求"],
+            reference_materials=[],
+            sample_essays=[]
+        )
+
+        return RAGResponse(
+            guidance=fallback_guidance,
+            confidence_score=0.0,
+            retrieval_info={"error": str(error)},
+            generation_info={"error": str(error)}
+        )
+
+    def process_request_stream(self, request: RAGRequest) -> Iterator[Dict[str, Any]]:
+        """流式处理 RAG 请求
+
+        先完成检索，再逐段产出 {"type": "token", "content": ...}，
+        最后产出 {"type": "response", "response": RAGResponse}。
+        """
+        if not self.is_initialized:
+            logger.warning("⚠️ 系统未初始化，尝试自动初始化")
+            self.initialize()
+
+        prompt = request.prompt
+        retrieval_results = self.retriever.retrieve_for_prompt(
+            prompt,
+            top_k=settings.retrieval_top_k
+        )
+        context = self._request_context(request)
+
+        for event in self.generator.generate_guidance_stream(
+            prompt=prompt,
+            materials=retrieval_results.get("materials", []),
+            essays=retrieval_results.get("essays", []),
+            context=context
+        ):
+            if event["type"] == "guidance":
+                yield {
+                    "type": "response",
+                    "response": self._build_response(retrieval_results, event["guidance"])
+                }
+            else:
+                yield event
+
+    def _build_response(self, retrieval_results: Dict[str, Any], guidance: WritingGuidance) -> RAGResponse:
+        """根据检索结果和生成的指导构建响应"""
+        materials = retrieval_results.get("materials", [])
+        essays = retrieval_results.get("essays", [])
+
+        # 计算置信度分数
+        logger.info("📊 计算置信度分数...")
+        confidence_score = self._calculate_confidence_score(
+            retrieval_results, guidance
+        )
+        logger.info("📊 最终置信度得分: {:.3f}", confidence_score)
+
+        return RAGResponse(
+            guidance=guidance,
+            confidence_score=confidence_score,
+            retrieval_info={
+                "materials_count": len(materials),
+                "essays_count": len(essays),
+                "total_results": retrieval_results.get("total_results", 0),
+                "query_text": retrieval_results.get("query_text", "")
+            },
+            generation_info={
+                "generator_type": "LLM" if self._is_generator_available() else "Mock",
+                "provider": self.generator.provider,
+                "model_name": self._get_current_model_name()
+            }
+        )
+
+    def _calculate_confidence_score(
+        self,
+        retrieval_results: Dict[str, Any],
+        guidance: WritingGuidance
+    ) -> float:
+        """计算置信度分数：各项特征（0~1）与 _CONFIDENCE_WEIGHTS 的加权和"""
+        features = (
+            # 检索结果质量 (40%)
+            min(len(retrieval_results.get("materials", [])) / 3, 1.0),  # 最多3个素材
+            min(len(retrieval_results.get("essays", [])) / 2, 1.0),     # 最多2个范文
+            # 生成内容质量 (60%)
+            len(guidance.theme_analysis) > 10,
+            len(guidance.structure_suggestion) >= 3,
+            len(guidance.writing_tips) >= 3,
+            len(guidance.key_points) >= 3
+        )
+        return min(sum(weight * feature for weight, feature in zip(_CONFIDENCE_WEIGHTS, features)), 1.0)
 
     def add_material(self, title: str, content: str, category: str = "用户添加") -> bool:
         """添加写作素材"""
         try:
-            from ..core.models import WritingMaterial, DifficultyLevel
-
             material = WritingMaterial(
                 title=title,
                 content=content,
@@ -210,8 +305,8 @@ class RAGSystem:
             success = self.knowledge_base.add_material(material)
 
             if success:
-                # 重建索引
-                self.retriever.index_knowledge_base()
+                # 只索引新增的素材
+                self.retriever.add_chunks([self.retriever.material_chunk(material)])
                 logger.info(f"成功添加素材: {title}")
 
             return success
@@ -222,8 +317,6 @@ class RAGSystem:
     def add_essay(self, title: str, content: str, essay_type: str = "narrative") -> bool:
         """添加范文"""
         try:
-            from ..core.models import SampleEssay, EssayType, DifficultyLevel
-
             essay = SampleEssay(
                 title=title,
                 content=content,
@@ -234,8 +327,8 @@ class RAGSystem:
             success = self.knowledge_base.add_essay(essay)
 
             if success:
-                # 重建索引
-                self.retriever.index_knowledge_base()
+                # 只索引新增的范文
+                self.retriever.add_chunks([self.retriever.essay_chunk(essay)])
                 logger.info(f"成功添加范文: {title}")
 
             return success
@@ -256,7 +349,7 @@ class RAGSystem:
         if self.generator.provider == "doubao":
             return getattr(settings, 'doubao_model', 'unknown')
         elif self.generator.provider == "openai":
-            return "gpt-3.5-turbo"
+            return getattr(settings, 'openai_model', 'unknown')
         return "unknown"
 
     def get_system_status(self) -> Dict[str, Any]:
@@ -301,3 +394,20 @@ class RAGSystem:
         except Exception as e:
             logger.error(f"搜索范文失败: {e}")
             return []
+
+    async def aclose(self):
+        """服务关闭时调用：释放当前事件循环上的异步连接，保存增量索引的向量，并把知识库日志合并回JSON快照"""
+        try:
+            await self.generator.aclose()
+        except Exception as e:
+            logger.error(f"关闭异步连接失败: {e}")
+
+        try:
+            self.retriever.flush()
+        except Exception as e:
+            logger.error(f"保存向量存储失败: {e}")
+
+        try:
+            self.knowledge_base.compact()
+        except Exception as e:
+            logger.error(f"合并知识库日志失败: {e}")
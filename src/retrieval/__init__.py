@@ -2,11 +2,13 @@
 检索模块
 """
 from .embedding import EmbeddingModel
+from .embedding_cache import EmbeddingCache
 from .vector_store import VectorStore
 from .hybrid_retriever import HybridRetriever
 
 __all__ = [
     'EmbeddingModel',
+    'EmbeddingCache',
     'VectorStore',
     'HybridRetriever'
 ]
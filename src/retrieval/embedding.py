@@ -2,10 +2,17 @@
 嵌入模型管理
 处理文本向量化
 """
-from typing import List, Optional
+import functools
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 from loguru import logger
 
+from ..core.utils import cut_words
+from .embedding_cache import EmbeddingCache
+from .encode_batcher import EncodeBatcher
 
 # 是一个来自 sentence-transformers 库的 Python 类，专门用于将句子或文本转换为向量（embedding）。这些向量可以用于文本相似度计算、聚类、检索等自然语言处理任务。SentenceTransformer 封装了预训练的 Transformer 模型（如 BERT、RoBERTa 等），让你可以方便地将一段文本编码为固定长度的高维向量。
 try:
@@ -15,20 +22,137 @@ except ImportError:
     SENTENCE_TRANSFORMERS_AVAILABLE = False
     logger.warning("sentence-transformers 未安装，将使用简单的向量化方法")
 
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+# 批量编码时模型每批处理的文本数
+ENCODE_BATCH_SIZE = 64
+# 查询向量内存缓存（LRU）的最大条数
+QUERY_CACHE_SIZE = 1024
+# 异步编码查询时合并并发查询的时间窗口（秒）和每批最多的不同查询数
+QUERY_BATCH_WAIT = 0.005
+QUERY_BATCH_MAX_SIZE = 32
+# 简单向量化方法（TF-IDF）的最大词表大小，即向量维度上限
+TFIDF_MAX_FEATURES = 4096
+
+
+def _to_dense(matrix) -> np.ndarray:
+    """TfidfVectorizer 返回稀疏矩阵，_NumpyTfidf 返回稠密矩阵"""
+    return matrix.toarray() if hasattr(matrix, "toarray") else matrix
+
+
+@functools.lru_cache(maxsize=4)
+def _load_sentence_transformer(model_name: str) -> "SentenceTransformer":
+    """按模型名只加载一次，同一进程内的所有 EmbeddingModel 共用（向量库、语义缓存等）
+
+    只共享推理用的模型对象；词表、查询缓存、磁盘缓存等状态仍属于各自的 EmbeddingModel。
+    """
+    return SentenceTransformer(model_name)
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> float:
+    """单对向量的余弦相似度，零向量与任何向量的相似度为 0"""
+    num = float(np.dot(a, b))
+    den = math.sqrt(float(np.vdot(a, a)) * float(np.vdot(b, b)))
+    return num / den if den else 0.0
+
+
+class _NumpyTfidf:
+    """TfidfVectorizer 的 NumPy 实现（scikit-learn 未安装时使用）
+
+    与 TfidfVectorizer(max_features=..., norm='l2') 的默认行为一致：词频取原始计数，
+    平滑 IDF = ln((1+n)/(1+df)) + 1，词表保留语料中总词频最高的 max_features 个词。
+    分词之后的计数、IDF 和归一化都是整批的 NumPy 运算（np.bincount），不在 Python 中逐词累加。
+    """
+
+    def __init__(self, max_features: int):
+        self.max_features = max_features
+        self.vocabulary_: Optional[Dict[str, int]] = None
+        self.idf_: Optional[np.ndarray] = None
+
+    def fit_transform(self, texts: List[str]) -> np.ndarray:
+        docs = [cut_words(text) for text in texts]
+        terms = sorted({word for words in docs for word in words})
+        if not terms:
+            raise ValueError("词表为空")
+
+        rows, ids = self._flatten(docs, {term: i for i, term in enumerate(terms)})
+        n_terms = len(terms)
+        term_counts = np.bincount(ids, minlength=n_terms)
+        # (文档, 词) 去重后按词计数即为文档频率
+        doc_freq = np.bincount(np.unique(rows * n_terms + ids) % n_terms, minlength=n_terms)
+
+        # 保留总词频最高的词，新的列号仍按词的字典序排列
+        keep = np.sort(np.argsort(-term_counts, kind="stable")[:self.max_features])
+        remap = np.full(n_terms, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        self.vocabulary_ = {terms[i]: col for col, i in enumerate(keep)}
+        self.idf_ = (np.log((1 + len(docs)) / (1 + doc_freq[keep])) + 1).astype(np.float32)
+
+        ids = remap[ids]
+        in_vocab = ids >= 0
+        return self._weight(rows[in_vocab], ids[in_vocab], len(docs))
+
+    def transform(self, texts: List[str]) -> np.ndarray:
+        rows, ids = self._flatten([cut_words(text) for text in texts], self.vocabulary_)
+        return self._weight(rows, ids, len(texts))
+
+    def _weight(self, rows: np.ndarray, ids: np.ndarray, n_docs: int) -> np.ndarray:
+        """按 (行, 列) 计数得到词频矩阵，乘以 IDF 后按行 L2 归一化"""
+        dim = len(self.idf_)
+        counts = np.bincount(rows * dim + ids, minlength=n_docs * dim).reshape(n_docs, dim)
+        return EmbeddingModel._normalize_rows(counts.astype(np.float32) * self.idf_)
+
+    @staticmethod
+    def _flatten(docs: List[Tuple[str, ...]], vocabulary: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """把各文档的词映射为列号并展平，返回每个词所在的行号和列号（词表外的词丢弃）"""
+        ids: List[int] = []
+        lengths: List[int] = []
+        for words in docs:
+            doc_ids = [vocabulary[word] for word in words if word in vocabulary]
+            ids.extend(doc_ids)
+            lengths.append(len(doc_ids))
+        rows = np.repeat(np.arange(len(docs), dtype=np.int64), lengths)
+        return rows, np.asarray(ids, dtype=np.int64)
+
 
 class EmbeddingModel:
     """嵌入模型类"""
 
-    def __init__(self, model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"):
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+        cache_path: Optional[str] = None
+    ):
+        """
+        Args:
+            model_name: sentence-transformers 模型名称
+            cache_path: 嵌入向量磁盘缓存（SQLite）路径；为空时不缓存。
+                只缓存模型编码的结果，简单向量化方法的向量依赖当次拟合的词表，不缓存
+        """
         self.model_name = model_name
         self.model = None
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        # 简单向量化方法使用的 TF-IDF 模型：首次编码时拟合，之后的文本映射到同一向量空间
+        self._tfidf = None
+        self._tfidf_lock = threading.Lock()
+        # 查询文本 -> 向量；重试、热门题目等重复查询不再经过模型
+        self._query_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self._query_cache_hits = 0
+        self._query_cache_misses = 0
+        # 并发的异步查询编码按时间窗口合并为一次批量编码
+        self._query_batcher = EncodeBatcher(self.encode, max_batch=QUERY_BATCH_MAX_SIZE, max_wait=QUERY_BATCH_WAIT)
         self._initialize_model()
 
     def _initialize_model(self):
         """初始化模型"""
         try:
             if SENTENCE_TRANSFORMERS_AVAILABLE:
-                self.model = SentenceTransformer(self.model_name)
+                self.model = _load_sentence_transformer(self.model_name)
                 logger.info(f"成功加载嵌入模型: {self.model_name}")
             else:
                 logger.warning("使用简单向量化方法")
@@ -36,13 +160,18 @@ class EmbeddingModel:
             logger.error(f"加载嵌入模型失败: {e}")
             self.model = None
 
-    def encode(self, texts: List[str]) -> List[List[float]]:
-        """编码文本为向量"""
+    def encode(self, texts: List[str], batch_size: int = ENCODE_BATCH_SIZE) -> List[List[float]]:
+        """编码文本为向量（L2 归一化，余弦相似度即为点积）
+
+        Args:
+            texts: 待编码的文本列表，整批交给模型，按 batch_size 分批前向计算
+            batch_size: 模型每批编码的文本数
+        """
         try:
             if self.model is not None and SENTENCE_TRANSFORMERS_AVAILABLE:
-                # 使用 sentence-transformers
-                embeddings = self.model.encode(texts)
-                return embeddings.tolist()
+                if self.cache is not None:
+                    return self._encode_cached(texts, batch_size)
+                return self._model_encode(texts, batch_size).tolist()
             else:
                 # 使用简单的向量化方法
                 return self._simple_encode(texts)
@@ -50,82 +179,191 @@ class EmbeddingModel:
             logger.error(f"文本编码失败: {e}")
             return self._simple_encode(texts)
 
+    def _model_encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """使用 sentence-transformers 编码"""
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+
+    def _encode_cached(self, texts: List[str], batch_size: int) -> List[List[float]]:
+        """先查磁盘缓存，只把未命中的文本交给模型编码，再写回缓存"""
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+
+        # 未命中的文本去重后一次编码
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self._model_encode(list(missing.values()), batch_size)
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed.items())
+            cached.update(computed)
+
+        return [cached[key].tolist() for key in keys]
+
     def _simple_encode(self, texts: List[str]) -> List[List[float]]:
-        """简单的文本向量化方法（基于字符统计）"""
+        """简单的文本向量化方法（TF-IDF）"""
+        if not texts:
+            return []
         try:
-            import jieba
-            from collections import Counter
-            import math
-
-            # 分词并统计词频
-            all_words = set()
-            text_words = []
-
-            for text in texts:
-                words = list(jieba.cut(text))
-                text_words.append(words)
-                all_words.update(words)
-
-            all_words = list(all_words)
-            vocab_size = len(all_words)
-
-            if vocab_size == 0:
-                return [[0.0] * 100 for _ in texts]
-
-            # 创建词汇到索引的映射
-            word_to_idx = {word: idx for idx, word in enumerate(all_words)}
-
-            # 计算 TF-IDF 向量
-            embeddings = []
-            for words in text_words:
-                word_count = Counter(words)
-                tf_idf_vector = [0.0] * min(vocab_size, 100)  # 限制向量维度
-
-                for word, count in word_count.items():
-                    if word in word_to_idx:
-                        idx = word_to_idx[word]
-                        if idx < 100:  # 只取前100维
-                            # 简单的 TF-IDF 计算
-                            tf = count / len(words) if words else 0
-                            # 简化的 IDF 计算
-                            idf = math.log(len(texts) + 1)
-                            tf_idf_vector[idx] = tf * idf
-
-                # 归一化
-                norm = sum(x*x for x in tf_idf_vector) ** 0.5
-                if norm > 0:
-                    tf_idf_vector = [x/norm for x in tf_idf_vector]
-
-                embeddings.append(tf_idf_vector)
-
-            return embeddings
+            return self._tfidf_encode(texts).tolist()
         except Exception as e:
             logger.error(f"简单编码失败: {e}")
-            # 返回随机向量作为后备
-            return [[0.1] * 100 for _ in texts]
+            # 零向量与任何文本的相似度都为 0
+            return [[0.0] * 100 for _ in texts]
+
+    def _tfidf_encode(self, texts: List[str]) -> np.ndarray:
+        """TF-IDF 编码，返回 L2 归一化的稠密矩阵
+
+        第一次调用时在这批文本上拟合词表和 IDF（通常是索引知识库时的全部文档），
+        之后的查询都按同一词表编码，维度固定，向量之间可以直接比较。
+        安装了 scikit-learn 时使用 TfidfVectorizer，否则使用等价的 NumPy 实现。
+        """
+        with self._tfidf_lock:
+            if self._tfidf is None:
+                if SKLEARN_AVAILABLE:
+                    vectorizer = TfidfVectorizer(
+                        tokenizer=cut_words,
+                        token_pattern=None,
+                        lowercase=False,
+                        max_features=TFIDF_MAX_FEATURES,
+                        norm='l2'
+                    )
+                else:
+                    vectorizer = _NumpyTfidf(max_features=TFIDF_MAX_FEATURES)
+                matrix = vectorizer.fit_transform(texts)
+                self._tfidf = vectorizer
+                return _to_dense(matrix)
+        return _to_dense(self._tfidf.transform(texts))
 
     def encode_single(self, text: str) -> List[float]:
-        """编码单个文本"""
+        """编码单个文本（查询），命中查询缓存时不再编码"""
+        cached = self._get_cached_query(text)
+        if cached is not None:
+            return cached
+        cacheable = self.encoding_is_stable()
         embeddings = self.encode([text])
-        return embeddings[0] if embeddings else [0.0] * 100
+        if not embeddings:
+            return [0.0] * 100
+        if cacheable:
+            self._cache_query(text, embeddings[0])
+        return embeddings[0]
 
-    def similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """计算两个向量的余弦相似度"""
-        try:
-            # 转换为 numpy 数组
-            v1 = np.array(vec1)
-            v2 = np.array(vec2)
+    async def aencode_single(self, text: str) -> List[float]:
+        """异步编码单个文本：与同一时间窗口内的其他查询合并编码，不阻塞事件循环"""
+        cached = self._get_cached_query(text)
+        if cached is not None:
+            return cached
+        cacheable = self.encoding_is_stable()
+        vector = await self._query_batcher.encode(text)
+        if cacheable:
+            self._cache_query(text, vector)
+        return vector
+
+    def encoding_is_stable(self) -> bool:
+        """文本的编码结果是否与同批的其他文本无关
+
+        简单向量化方法在拟合词表之前，第一次编码的结果依赖当次的全部文本，此时不缓存、也不应拆批编码。
+        """
+        return self.model is not None or self._tfidf is not None
+
+    def encoder_state(self) -> Optional[Dict[str, Any]]:
+        """当前编码方式的状态，随持久化的向量一同保存；尚不能稳定编码时返回 None
 
-            # 计算余弦相似度
-            dot_product = np.dot(v1, v2)
-            norm_v1 = np.linalg.norm(v1)
-            norm_v2 = np.linalg.norm(v2)
+        使用模型时只记录模型名；简单向量化方法记录拟合得到的词表和 IDF，重新启动后据此恢复，
+        新编码的文本与已保存的向量处在同一向量空间。
+        """
+        if self.model is not None:
+            return {"model_name": self.model_name}
+        with self._tfidf_lock:
+            tfidf = self._tfidf
+        if tfidf is None:
+            return None
+        return {
+            "tfidf": {
+                "vocabulary": {term: int(col) for term, col in tfidf.vocabulary_.items()},
+                "idf": np.asarray(tfidf.idf_, dtype=np.float32).tolist()
+            }
+        }
 
-            if norm_v1 == 0 or norm_v2 == 0:
-                return 0.0
+    def restore_encoder_state(self, state: Dict[str, Any]) -> bool:
+        """按 encoder_state() 保存的状态恢复编码方式
 
-            similarity = dot_product / (norm_v1 * norm_v2)
-            return float(similarity)
+        与当前编码方式不一致（模型不同、模型与简单向量化方法混用、词表已按其他语料拟合）时返回 False，
+        调用方应丢弃按该状态编码的向量。
+        """
+        if self.model is not None:
+            return state.get("model_name") == self.model_name
+
+        tfidf = state.get("tfidf")
+        if not tfidf:
+            return False
+        with self._tfidf_lock:
+            if self._tfidf is not None:
+                return {term: int(col) for term, col in self._tfidf.vocabulary_.items()} == tfidf["vocabulary"]
+            # 恢复为等价的 NumPy 实现，按保存的词表和 IDF 编码，不再重新拟合
+            restored = _NumpyTfidf(max_features=TFIDF_MAX_FEATURES)
+            restored.vocabulary_ = dict(tfidf["vocabulary"])
+            restored.idf_ = np.asarray(tfidf["idf"], dtype=np.float32)
+            self._tfidf = restored
+        return True
+
+    def _get_cached_query(self, text: str) -> Optional[List[float]]:
+        with self._query_cache_lock:
+            vector = self._query_cache.get(text)
+            if vector is None:
+                self._query_cache_misses += 1
+                return None
+            self._query_cache.move_to_end(text)
+            self._query_cache_hits += 1
+        return list(vector)
+
+    def _cache_query(self, text: str, vector: List[float]):
+        with self._query_cache_lock:
+            self._query_cache[text] = tuple(vector)
+            self._query_cache.move_to_end(text)
+            while len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+
+    def query_cache_info(self) -> Dict[str, int]:
+        """查询缓存的命中次数、未命中次数和当前条数"""
+        with self._query_cache_lock:
+            return {
+                "hits": self._query_cache_hits,
+                "misses": self._query_cache_misses,
+                "size": len(self._query_cache)
+            }
+
+    def similarity(self, vec1: List[float], vec2: List[float]) -> float:
+        """计算两个向量的余弦相似度"""
+        try:
+            # 单对向量不走矩阵路径，省去归一化和临时矩阵的开销
+            return _cosine(np.asarray(vec1, dtype=np.float32), np.asarray(vec2, dtype=np.float32))
         except Exception as e:
             logger.error(f"计算相似度失败: {e}")
             return 0.0
+
+    @staticmethod
+    def similarity_matrix(vecs1, vecs2) -> np.ndarray:
+        """批量计算余弦相似度：返回 len(vecs1) x len(vecs2) 的矩阵
+
+        两组向量各自按行 L2 归一化一次，再用一次 float32 矩阵乘法算出全部两两相似度；
+        零向量与任何向量的相似度为 0。
+        """
+        a = EmbeddingModel._normalize_rows(vecs1)
+        b = EmbeddingModel._normalize_rows(vecs2)
+        return a @ b.T
+
+    @staticmethod
+    def _normalize_rows(vecs) -> np.ndarray:
+        matrix = np.ascontiguousarray(vecs, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
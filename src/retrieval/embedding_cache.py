@@ -0,0 +1,80 @@
+"""
+嵌入向量磁盘缓存
+按 (模型名, 文本) 的内容哈希缓存向量，重启后重新索引时未变化的文档无需再次编码
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from loguru import logger
+
+
+class EmbeddingCache:
+    """基于 SQLite 的嵌入向量缓存
+
+    键为 blake2b(模型名 + '|' + 文本)，值为 float32 向量的原始字节。
+    数据库文件在第一次读写时才创建；读写失败只记录日志，调用方按未命中处理。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.blake2b(f"{model_name}|{text}".encode("utf-8"), digest_size=20).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """批量查询，只返回命中的键"""
+        if not keys:
+            return {}
+        found: Dict[str, np.ndarray] = {}
+        try:
+            with self._lock:
+                conn = self._connection()
+                # SQLite 单条语句的参数个数有限，分批查询
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                    )
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float32)
+        except Exception as e:
+            logger.error(f"读取嵌入缓存失败: {e}")
+        return found
+
+    def put_many(self, items: Iterable[tuple]):
+        """批量写入 (键, 向量)"""
+        try:
+            rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+            if not rows:
+                return
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+        except Exception as e:
+            logger.error(f"写入嵌入缓存失败: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
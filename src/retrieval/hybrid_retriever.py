@@ -2,13 +2,24 @@
 混合检索器
 结合关键词检索和向量检索
 """
-from typing import List, Dict, Any, Tuple, Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import AbstractSet, List, Dict, Any, Tuple, Optional
+
+import numpy as np
 from loguru import logger
 
 from ..core.models import EssayPrompt, WritingMaterial, SampleEssay, DocumentChunk
-from ..core.utils import extract_keywords, calculate_similarity
+from ..core.utils import extract_keywords, jaccard_similarity, cut_words
 from ..knowledge.base import BaseKnowledgeBase
-from .vector_store import VectorStore
+from .embedding import ENCODE_BATCH_SIZE, EmbeddingModel
+from .vector_store import VectorStore, top_k_indices
+
+# 索引大批文档块时按此大小分段流水处理：编码下一段的同时写入上一段
+INDEX_PIPELINE_BATCH_SIZE = 512
+# 增量写入累计到该数量的文档块时保存一次内存向量存储，其余的由 flush()（服务关闭时）保存
+INCREMENTAL_PERSIST_INTERVAL = 32
 
 
 class HybridRetriever:
@@ -24,6 +35,11 @@ class HybridRetriever:
         self.material_weight = 0.6
         self.essay_weight = 0.4
 
+        # bulk_indexing() 期间缓存的待索引文档块
+        self._pending_chunks: Optional[List[DocumentChunk]] = None
+        # 增量写入后尚未保存的文档块数
+        self._unpersisted_chunks = 0
+
     def retrieve_for_prompt(self, prompt: EssayPrompt, top_k: int = 10) -> Dict[str, Any]:
         """为作文题目检索相关内容"""
         try:
@@ -31,70 +47,109 @@ class HybridRetriever:
 
             # 构建查询文本
             query_text = self._build_query_text(prompt)
-            logger.info(f"🔎 构建的查询文本: {query_text}")
+            logger.info("🔎 构建的查询文本: {}", query_text)
+
+            # 查询只编码一次，关键词候选打分和向量检索共用
+            query_vec = self.vector_store.embedding_model.encode_single(query_text)
 
             # 关键词检索
             logger.info("📝 执行关键词检索...")
-            keyword_results = self._keyword_retrieval(query_text, prompt)
-            logger.info(f"📝 关键词检索结果: {len(keyword_results)} 项")
+            keyword_results = self._keyword_retrieval(query_text, prompt, query_vec)
+            logger.info("📝 关键词检索结果: {} 项", len(keyword_results))
 
             # 向量检索
             logger.info("🧠 执行语义检索...")
-            semantic_results = self._semantic_retrieval(query_text, top_k)
-            logger.info(f"🧠 语义检索结果: {len(semantic_results)} 项")
+            semantic_results = self._semantic_retrieval(query_text, top_k, query_vec)
+            logger.info("🧠 语义检索结果: {} 项", len(semantic_results))
+
+            return self._merge_retrieval_results(query_text, keyword_results, semantic_results, top_k)
+        except Exception as e:
+            logger.error(f"❌ 检索失败: {e}")
+            return self._empty_results()
+
+    async def aretrieve_for_prompt(self, prompt: EssayPrompt, top_k: int = 10) -> Dict[str, Any]:
+        """异步检索：关键词检索和语义检索互不依赖，在线程池中并发执行，不阻塞事件循环"""
+        try:
+            logger.info("🔍 开始混合检索 (关键词 + 语义检索并发)")
+
+            query_text = self._build_query_text(prompt)
+            logger.info("🔎 构建的查询文本: {}", query_text)
 
-            # 合并和重排序结果
-            logger.info("🔄 合并和重排序检索结果...")
-            combined_results = self._combine_results(
-                keyword_results, semantic_results, top_k
+            query_vec = await self.vector_store.embedding_model.aencode_single(query_text)
+
+            keyword_results, semantic_results = await asyncio.gather(
+                asyncio.to_thread(self._keyword_retrieval, query_text, prompt, query_vec),
+                asyncio.to_thread(self._semantic_retrieval, query_text, top_k, query_vec)
             )
-            logger.info(f"🔄 合并后结果: {len(combined_results)} 项")
-
-            # 分离素材和范文
-            materials, essays = self._separate_content_types(combined_results)
-
-            # 截取结果并添加分数
-            final_materials = materials[:max(1, int(top_k * self.material_weight))]
-            final_essays = essays[:max(1, int(top_k * self.essay_weight))]
-
-            # 记录详细的检索结果
-            logger.info("📊 最终检索结果详情:")
-            logger.info(f"  - 素材: {len(final_materials)} 个")
-            if final_materials:
-                for i, (material, score) in enumerate(final_materials[:min(len(final_materials), 3)], 1):
-                    logger.info(f"    {i}. 【{material.category}】{material.title} (得分: {score:.3f})")
-                    # 为素材添加分数属性以便后续使用
-                    material.score = score
-
-            logger.info(f"  - 范文: {len(final_essays)} 篇")
-            if final_essays:
-                for i, (essay, score) in enumerate(final_essays[:min(len(final_essays), 3)], 1):
-                    logger.info(f"    {i}. 【{essay.essay_type}】{essay.title} (得分: {score:.3f})")
-                    # 为范文添加分数属性以便后续使用
-                    essay.score = score
-
-            # 提取内容对象（不包含分数）
-            materials_only = [item[0] for item in final_materials]
-            essays_only = [item[0] for item in final_essays]
-
-            return {
-                "materials": materials_only,
-                "essays": essays_only,
-                "query_text": query_text,
-                "keyword_results_count": len(keyword_results),
-                "semantic_results_count": len(semantic_results),
-                "total_results": len(combined_results)
-            }
+            logger.info("📝 关键词检索结果: {} 项", len(keyword_results))
+            logger.info("🧠 语义检索结果: {} 项", len(semantic_results))
+
+            return self._merge_retrieval_results(query_text, keyword_results, semantic_results, top_k)
         except Exception as e:
             logger.error(f"❌ 检索失败: {e}")
-            return {
-                "materials": [],
-                "essays": [],
-                "query_text": "",
-                "keyword_results_count": 0,
-                "semantic_results_count": 0,
-                "total_results": 0
-            }
+            return self._empty_results()
+
+    def _merge_retrieval_results(
+        self,
+        query_text: str,
+        keyword_results: List[Tuple[Any, float, str]],
+        semantic_results: List[Tuple[DocumentChunk, float, str]],
+        top_k: int
+    ) -> Dict[str, Any]:
+        """合并两路检索结果，按类型截取后组装返回值"""
+        # 合并和重排序结果
+        logger.info("🔄 合并和重排序检索结果...")
+        combined_results = self._combine_results(
+            keyword_results, semantic_results, top_k
+        )
+        logger.info("🔄 合并后结果: {} 项", len(combined_results))
+
+        # 分离素材和范文
+        materials, essays = self._separate_content_types(combined_results)
+
+        # 截取结果并添加分数
+        final_materials = materials[:max(1, int(top_k * self.material_weight))]
+        final_essays = essays[:max(1, int(top_k * self.essay_weight))]
+
+        # 记录详细的检索结果
+        logger.info("📊 最终检索结果详情:")
+        logger.info("  - 素材: {} 个", len(final_materials))
+        if final_materials:
+            for i, (material, score) in enumerate(final_materials[:min(len(final_materials), 3)], 1):
+                logger.debug("    {}. 【{}】{} (得分: {:.3f})", i, material.category, material.title, score)
+                # 为素材添加分数属性以便后续使用
+                material.score = score
+
+        logger.info("  - 范文: {} 篇", len(final_essays))
+        if final_essays:
+            for i, (essay, score) in enumerate(final_essays[:min(len(final_essays), 3)], 1):
+                logger.debug("    {}. 【{}】{} (得分: {:.3f})", i, essay.essay_type, essay.title, score)
+                # 为范文添加分数属性以便后续使用
+                essay.score = score
+
+        # 提取内容对象（不包含分数）
+        materials_only = [item[0] for item in final_materials]
+        essays_only = [item[0] for item in final_essays]
+
+        return {
+            "materials": materials_only,
+            "essays": essays_only,
+            "query_text": query_text,
+            "keyword_results_count": len(keyword_results),
+            "semantic_results_count": len(semantic_results),
+            "total_results": len(combined_results)
+        }
+
+    @staticmethod
+    def _empty_results() -> Dict[str, Any]:
+        return {
+            "materials": [],
+            "essays": [],
+            "query_text": "",
+            "keyword_results_count": 0,
+            "semantic_results_count": 0,
+            "total_results": 0
+        }
 
     def _build_query_text(self, prompt: EssayPrompt) -> str:
         """构建查询文本"""
@@ -111,23 +166,42 @@ class HybridRetriever:
 
         return " ".join(query_parts)
 
-    def _keyword_retrieval(self, query: str, prompt: EssayPrompt) -> List[Tuple[Any, float, str]]:
-        """关键词检索"""
+    def _keyword_retrieval(
+        self,
+        query: str,
+        prompt: EssayPrompt,
+        query_vec: Optional[List[float]] = None
+    ) -> List[Tuple[Any, float, str]]:
+        """关键词检索
+
+        候选由知识库的关键词检索召回；提供 query_vec 时，候选的基础分数改用与查询向量的余弦相似度
+        （已索引的候选直接取库中存储的向量，未索引的整批编码一次），不再对每个候选的标题和正文分词。
+        同一次检索内所有候选使用同一种基础分数，见 _candidate_similarities
+        """
         try:
             results = []
+            # 查询只分词一次，供所有候选计算匹配度
+            query_words = frozenset(cut_words(query))
 
-            # 搜索素材
             materials = self.knowledge_base.search_materials(query, top_k=10)
+            essays = self.knowledge_base.search_essays(query, top_k=5)
+
+            content_similarities = self._candidate_similarities(materials, essays, query_vec)
+
+            # 素材
             for material in materials:
                 # 计算匹配度
-                score = self._calculate_keyword_score(query, material, prompt)
+                score = self._calculate_keyword_score(
+                    query_words, material, prompt, content_similarities.get(f"material_{material.id}")
+                )
                 results.append((material, score, "material"))
 
-            # 搜索范文
-            essays = self.knowledge_base.search_essays(query, top_k=5)
+            # 范文
             for essay in essays:
                 # 计算匹配度
-                score = self._calculate_keyword_score(query, essay, prompt)
+                score = self._calculate_keyword_score(
+                    query_words, essay, prompt, content_similarities.get(f"essay_{essay.id}")
+                )
                 results.append((essay, score, "essay"))
 
             return results
@@ -135,11 +209,50 @@ class HybridRetriever:
             logger.error(f"关键词检索失败: {e}")
             return []
 
-    def _semantic_retrieval(self, query: str, top_k: int) -> List[Tuple[DocumentChunk, float, str]]:
-        """向量检索"""
+    def _candidate_similarities(
+        self,
+        materials: List[WritingMaterial],
+        essays: List[SampleEssay],
+        query_vec: Optional[List[float]]
+    ) -> Dict[str, float]:
+        """关键词检索候选（按向量文档块ID）与查询向量的余弦相似度
+
+        要么每个候选都有向量相似度，要么返回空字典（全部按分词 Jaccard 打分）：
+        余弦相似度和 Jaccard 的取值范围不同，混在同一排序里会让未索引的候选整体排到后面。
+        """
+        if query_vec is None or not (materials or essays):
+            return {}
+        chunks = [self.material_chunk(m) for m in materials] + [self.essay_chunk(e) for e in essays]
+        texts = {chunk.id: chunk.content for chunk in chunks}
+
+        similarities = self.vector_store.document_similarities(list(texts), query_vec)
+        missing = [chunk_id for chunk_id in texts if chunk_id not in similarities]
+        if not missing:
+            return similarities
+
+        embedding_model = self.vector_store.embedding_model
+        if not embedding_model.encoding_is_stable():
+            # 简单向量化方法尚未拟合词表，此时编码的向量与查询向量不可比
+            return {}
+        try:
+            vectors = embedding_model.encode([texts[chunk_id] for chunk_id in missing], batch_size=ENCODE_BATCH_SIZE)
+            scores = EmbeddingModel.similarity_matrix([query_vec], vectors)[0]
+        except Exception as e:
+            logger.debug("未索引候选编码失败，关键词检索改用分词打分: {}", e)
+            return {}
+        similarities.update(zip(missing, scores.tolist()))
+        return similarities
+
+    def _semantic_retrieval(
+        self,
+        query: str,
+        top_k: int,
+        query_vec: Optional[List[float]] = None
+    ) -> List[Tuple[DocumentChunk, float, str]]:
+        """向量检索（query_vec 为已编码的查询向量，不提供时由向量库编码）"""
         try:
             # 执行向量搜索
-            results = self.vector_store.search(query, top_k=top_k)
+            results = self.vector_store.search(query, top_k=top_k, query_embedding=query_vec)
 
             # 转换结果格式
             semantic_results = []
@@ -152,13 +265,28 @@ class HybridRetriever:
             logger.error(f"语义检索失败: {e}")
             return []
 
-    def _calculate_keyword_score(self, query: str, content: Any, prompt: EssayPrompt) -> float:
-        """计算关键词匹配分数"""
+    def _calculate_keyword_score(
+        self,
+        query_words: AbstractSet[str],
+        content: Any,
+        prompt: EssayPrompt,
+        content_similarity: Optional[float] = None
+    ) -> float:
+        """计算关键词匹配分数
+
+        Args:
+            query_words: 查询的分词集合
+            content_similarity: 文档块与查询的向量相似度。文档块按"标题 + 正文"整体编码，
+                提供时直接作为基础分数；不提供时按分词计算标题和正文的 Jaccard 相似度加权。
+                同一次检索的候选要么都提供、要么都不提供，分数尺度一致
+        """
         try:
             # 基础文本相似度
-            if hasattr(content, 'title') and hasattr(content, 'content'):
-                title_score = calculate_similarity(query, content.title)
-                content_score = calculate_similarity(query, content.content)
+            if content_similarity is not None:
+                base_score = max(0.0, content_similarity)
+            elif hasattr(content, 'title') and hasattr(content, 'content'):
+                title_score = self._text_similarity(query_words, content.title)
+                content_score = self._text_similarity(query_words, content.content)
                 base_score = title_score * 0.4 + content_score * 0.6
             else:
                 base_score = 0.0
@@ -178,144 +306,254 @@ class HybridRetriever:
             logger.error(f"计算关键词分数失败: {e}")
             return 0.0
 
+    @staticmethod
+    def _text_similarity(query_words: AbstractSet[str], text: str) -> float:
+        """与 calculate_similarity(query, text) 相同，查询一侧使用预先分好的词"""
+        if not text:
+            return 0.0
+        return jaccard_similarity(query_words, frozenset(cut_words(text)))
+
     def _combine_results(self, keyword_results: List[Tuple], semantic_results: List[Tuple], top_k: int) -> List[Tuple[Any, float, str]]:
-        """合并和重排序结果"""
+        """合并和重排序结果
+
+        两路结果按内容ID去重后存成平行数组（内容、类型、关键词分、语义分），
+        综合分数一次向量运算得出，只对前 top_k 个候选排序
+        """
         try:
-            combined = {}
+            positions: Dict[Any, int] = {}
+            contents: List[Any] = []
+            content_types: List[str] = []
+            keyword_scores: List[float] = []
+            semantic_scores: List[float] = []
 
             # 处理关键词结果
             for content, score, content_type in keyword_results:
                 content_id = getattr(content, 'id', id(content))
-                if content_id not in combined:
-                    combined[content_id] = {
-                        'content': content,
-                        'content_type': content_type,
-                        'keyword_score': score,
-                        'semantic_score': 0.0
-                    }
+                pos = positions.get(content_id)
+                if pos is None:
+                    positions[content_id] = len(contents)
+                    contents.append(content)
+                    content_types.append(content_type)
+                    keyword_scores.append(score)
+                    semantic_scores.append(0.0)
                 else:
-                    combined[content_id]['keyword_score'] = max(
-                        combined[content_id]['keyword_score'], score
-                    )
+                    keyword_scores[pos] = max(keyword_scores[pos], score)
 
             # 处理语义结果
             for chunk, score, content_type in semantic_results:
                 # 对于向量检索结果，我们需要重建原始内容
                 # 这里简化处理，直接使用chunk作为内容
-                content_id = chunk.id
-                if content_id not in combined:
-                    combined[content_id] = {
-                        'content': chunk,
-                        'content_type': content_type,
-                        'keyword_score': 0.0,
-                        'semantic_score': score
-                    }
+                pos = positions.get(chunk.id)
+                if pos is None:
+                    positions[chunk.id] = len(contents)
+                    contents.append(chunk)
+                    content_types.append(content_type)
+                    keyword_scores.append(0.0)
+                    semantic_scores.append(score)
                 else:
-                    combined[content_id]['semantic_score'] = max(
-                        combined[content_id]['semantic_score'], score
-                    )
-
-            # 计算综合分数并排序
-            final_results = []
-            for content_id, data in combined.items():
-                final_score = (
-                    data['keyword_score'] * self.keyword_weight +
-                    data['semantic_score'] * self.semantic_weight
-                )
-                final_results.append((data['content'], final_score, data['content_type']))
+                    semantic_scores[pos] = max(semantic_scores[pos], score)
+
+            if not contents or top_k <= 0:
+                return []
+
+            # 计算综合分数
+            final_scores = (
+                np.asarray(keyword_scores, dtype=np.float64) * self.keyword_weight +
+                np.asarray(semantic_scores, dtype=np.float64) * self.semantic_weight
+            )
 
-            # 按分数排序
-            final_results.sort(key=lambda x: x[1], reverse=True)
+            # 先选出前 top_k 个，再按分数降序排序（同分保持原顺序）
+            top = top_k_indices(final_scores, top_k)
 
-            return final_results[:top_k]
+            return [(contents[i], float(final_scores[i]), content_types[i]) for i in top]
         except Exception as e:
             logger.error(f"合并结果失败: {e}")
             return []
 
     def _separate_content_types(self, results: List[Tuple[Any, float, str]]) -> Tuple[List[Any], List[Any]]:
-        """分离不同类型的内容"""
+        """分离不同类型的内容（按内容的类型查表分派，不逐个 isinstance 判断）"""
         materials = []
         essays = []
 
         for content, score, content_type in results:
-            if isinstance(content, WritingMaterial):
-                materials.append(content)
-            elif isinstance(content, SampleEssay):
-                essays.append(content)
-            elif isinstance(content, DocumentChunk):
-                # 根据元数据判断类型
-                chunk_type = content.metadata.get("content_type", "material")
-                if chunk_type == "essay":
-                    # 重建 SampleEssay 对象（简化处理）
-                    essay = SampleEssay(
-                        id=content.id,
-                        title=content.metadata.get("title", "未知标题"),
-                        content=content.content,
-                        essay_type=content.metadata.get("essay_type", "narrative"),
-                        difficulty_level=content.metadata.get("difficulty_level", "middle")
-                    )
-                    essays.append(essay)
-                else:
-                    # 重建 WritingMaterial 对象（简化处理）
-                    material = WritingMaterial(
-                        id=content.id,
-                        title=content.metadata.get("title", "未知标题"),
-                        content=content.content,
-                        category=content.metadata.get("category", "未知分类"),
-                        difficulty_level=content.metadata.get("difficulty_level", "middle")
-                    )
-                    materials.append(material)
+            handler = _CONTENT_HANDLERS.get(type(content))
+            if handler is None:
+                handler = _resolve_content_handler(type(content))
+            if handler is not None:
+                handler(content, materials, essays)
 
         return materials, essays
 
-    def index_knowledge_base(self) -> bool:
-        """将知识库内容索引到向量数据库"""
-        try:
-            chunks = []
+    @contextmanager
+    def bulk_indexing(self):
+        """批量导入时使用：期间 add_chunks 只缓存文档块，退出时整批编码、写入并保存一次
 
-            # 索引素材
-            materials = self.knowledge_base.list_materials()
+        with retriever.bulk_indexing():
             for material in materials:
-                chunk = DocumentChunk(
-                    id=f"material_{material.id}",
-                    content=f"{material.title}\n\n{material.content}",
-                    metadata={
-                        "content_type": "material",
-                        "title": material.title,
-                        "category": material.category,
-                        "difficulty_level": material.difficulty_level.value,
-                        "keywords": material.keywords
-                    },
-                    source=f"material_{material.id}",
-                    chunk_index=0
-                )
-                chunks.append(chunk)
-
-            # 索引范文
-            essays = self.knowledge_base.list_essays()
-            for essay in essays:
-                chunk = DocumentChunk(
-                    id=f"essay_{essay.id}",
-                    content=f"{essay.title}\n\n{essay.content}",
-                    metadata={
-                        "content_type": "essay",
-                        "title": essay.title,
-                        "essay_type": essay.essay_type.value,
-                        "difficulty_level": essay.difficulty_level.value,
-                        "score": essay.score
-                    },
-                    source=f"essay_{essay.id}",
-                    chunk_index=0
-                )
-                chunks.append(chunk)
+                retriever.add_chunks([HybridRetriever.material_chunk(material)])
+        """
+        if self._pending_chunks is not None:
+            # 嵌套使用时由最外层统一写入
+            yield
+            return
+
+        self._pending_chunks = []
+        try:
+            yield
+        finally:
+            chunks, self._pending_chunks = self._pending_chunks, None
+            if chunks and self._index_chunks(chunks):
+                self._persist()
+
+    def add_chunks(self, chunks: List[DocumentChunk]) -> bool:
+        """增量索引：只编码并写入给定的文档块，不重建整个知识库的索引
+
+        写入后不立即保存，累计 INCREMENTAL_PERSIST_INTERVAL 个文档块保存一次，剩余的由 flush() 保存
+        """
+        if self._pending_chunks is not None:
+            self._pending_chunks.extend(chunks)
+            return True
+        if not self._index_chunks(chunks):
+            return False
+        self._unpersisted_chunks += len(chunks)
+        if self._unpersisted_chunks >= INCREMENTAL_PERSIST_INTERVAL:
+            self._persist()
+        return True
+
+    def flush(self) -> bool:
+        """保存增量写入后尚未保存的向量（服务关闭时调用）"""
+        if not self._unpersisted_chunks:
+            return True
+        return self._persist()
+
+    def _persist(self) -> bool:
+        success = self.vector_store.persist()
+        if success:
+            self._unpersisted_chunks = 0
+        return success
+
+    def _index_chunks(self, chunks: List[DocumentChunk]) -> bool:
+        """编码后连同向量一起写入向量数据库
+
+        文档块较多且编码结果与分批方式无关时，按 INDEX_PIPELINE_BATCH_SIZE 分段，
+        在后台线程编码下一段的同时写入当前段；返回前全部写入完成。
+        """
+        if not chunks:
+            return True
+        embedding_model = self.vector_store.embedding_model
+
+        def encode(part: List[DocumentChunk]) -> List[List[float]]:
+            return embedding_model.encode([chunk.content for chunk in part], batch_size=ENCODE_BATCH_SIZE)
+
+        if len(chunks) <= INDEX_PIPELINE_BATCH_SIZE or not embedding_model.encoding_is_stable():
+            # 简单向量化方法首次编码时在整批文本上拟合词表，不能拆段
+            return self.vector_store.add_documents(chunks, embeddings=encode(chunks))
+
+        parts = [chunks[start:start + INDEX_PIPELINE_BATCH_SIZE]
+                 for start in range(0, len(chunks), INDEX_PIPELINE_BATCH_SIZE)]
+        success = True
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(encode, parts[0])
+            for i, part in enumerate(parts):
+                embeddings = pending.result()
+                if i + 1 < len(parts):
+                    pending = pool.submit(encode, parts[i + 1])
+                success = self.vector_store.add_documents(part, embeddings=embeddings) and success
+        return success
+
+    @staticmethod
+    def material_chunk(material: WritingMaterial) -> DocumentChunk:
+        """素材对应的向量文档块"""
+        return DocumentChunk(
+            id=f"material_{material.id}",
+            content=f"{material.title}\n\n{material.content}",
+            metadata={
+                "content_type": "material",
+                "title": material.title,
+                "category": material.category,
+                "difficulty_level": material.difficulty_level.value,
+                "keywords": material.keywords
+            },
+            source=f"material_{material.id}",
+            chunk_index=0
+        )
+
+    @staticmethod
+    def essay_chunk(essay: SampleEssay) -> DocumentChunk:
+        """范文对应的向量文档块"""
+        return DocumentChunk(
+            id=f"essay_{essay.id}",
+            content=f"{essay.title}\n\n{essay.content}",
+            metadata={
+                "content_type": "essay",
+                "title": essay.title,
+                "essay_type": essay.essay_type.value,
+                "difficulty_level": essay.difficulty_level.value,
+                "score": essay.score
+            },
+            source=f"essay_{essay.id}",
+            chunk_index=0
+        )
 
-            # 添加到向量数据库
-            success = self.vector_store.add_documents(chunks)
+    def index_knowledge_base(self) -> bool:
+        """将知识库内容索引到向量数据库"""
+        try:
+            # 索引素材和范文
+            chunks = [self.material_chunk(material) for material in self.knowledge_base.list_materials()]
+            chunks.extend(self.essay_chunk(essay) for essay in self.knowledge_base.list_essays())
 
+            # 所有文档整批编码一次，再连同向量一起写入向量数据库
+            success = self._index_chunks(chunks)
             if success:
-                logger.info(f"成功索引 {len(chunks)} 个文档到向量数据库")
+                self._persist()
+                logger.info("成功索引 {} 个文档到向量数据库", len(chunks))
 
             return success
         except Exception as e:
             logger.error(f"索引知识库失败: {e}")
             return False
+
+
+def _add_material(content: WritingMaterial, materials: List[Any], essays: List[Any]):
+    materials.append(content)
+
+
+def _add_essay(content: SampleEssay, materials: List[Any], essays: List[Any]):
+    essays.append(content)
+
+
+def _add_chunk(content: DocumentChunk, materials: List[Any], essays: List[Any]):
+    """根据元数据判断文档块的类型，重建素材或范文对象（简化处理）"""
+    if content.metadata.get("content_type", "material") == "essay":
+        essays.append(SampleEssay(
+            id=content.id,
+            title=content.metadata.get("title", "未知标题"),
+            content=content.content,
+            essay_type=content.metadata.get("essay_type", "narrative"),
+            difficulty_level=content.metadata.get("difficulty_level", "middle")
+        ))
+    else:
+        materials.append(WritingMaterial(
+            id=content.id,
+            title=content.metadata.get("title", "未知标题"),
+            content=content.content,
+            category=content.metadata.get("category", "未知分类"),
+            difficulty_level=content.metadata.get("difficulty_level", "middle")
+        ))
+
+
+# 内容类型 -> 处理函数，_separate_content_types 按 type(content) 查表
+_CONTENT_HANDLERS = {
+    WritingMaterial: _add_material,
+    SampleEssay: _add_essay,
+    DocumentChunk: _add_chunk
+}
+
+
+def _resolve_content_handler(content_class: type):
+    """子类等不在表中的类型按继承关系查找一次，结果记入表中；无法处理的类型返回 None"""
+    for base, handler in list(_CONTENT_HANDLERS.items()):
+        if issubclass(content_class, base):
+            _CONTENT_HANDLERS[content_class] = handler
+            return handler
+    return None
@@ -2,11 +2,17 @@
 向量数据库管理
 使用 ChromaDB 作为向量数据库
 """
+import bisect
 import os
+from functools import reduce
 from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+import orjson
 from loguru import logger
 
 from ..core.models import DocumentChunk
+from ..core.utils import prefetch_file
 from .embedding import EmbeddingModel
 
 try:
@@ -17,19 +23,115 @@ except ImportError:
     CHROMADB_AVAILABLE = False
     logger.warning("chromadb 未安装，将使用内存向量存储")
 
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# 内存存储 HNSW 索引的默认参数：每个节点的邻居数、建图和检索时的候选队列长度
+HNSW_M = 24
+HNSW_EF_CONSTRUCTION = 128
+HNSW_EF_SEARCH = 100
+# index_type="auto" 时，文档块数达到该值才使用 HNSW，更小的库全量打分更快且结果精确
+HNSW_AUTO_MIN_ROWS = 1000
+
+# 内存存储中已删除（打了删除标记）的行超过该比例时整理存储，真正移除这些行
+MEMORY_COMPACT_DELETED_RATIO = 0.2
+
+# 写入 ChromaDB 时每次 collection.add 的最大文档块数：整库索引拆成多次提交，
+# 单次写入的 SQLite 事务和内存占用有上限（也不会超过服务端的 max_batch_size）
+CHROMA_ADD_BATCH_SIZE = 512
+
+# 嵌入向量缓存的文件名（位于 db_path 下）
+_EMBEDDING_CACHE_FILE = "embedding_cache.sqlite3"
+
+# 内存存储持久化的目录名和文件名（位于 db_path 下）
+_MEMORY_STORE_DIR = "memory"
+_MEMORY_VECTORS_FILE = "vectors.npy"
+_MEMORY_SCALES_FILE = "scales.npy"
+_MEMORY_DOCUMENTS_FILE = "documents.jsonl"
+_MEMORY_HNSW_FILE = "hnsw.index"
+# 编码方式的状态（模型名或简单向量化方法的词表），载入时据此判断已保存的向量能否继续使用
+_MEMORY_ENCODER_FILE = "encoder.json"
+
+# int8 量化存储的内存检索按块反量化，每块的行数（控制临时 float32 块的大小）
+_INT8_SEARCH_BLOCK_ROWS = 8192
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """按分数降序返回前 k 个下标，同分时下标小的在前（与稳定排序后取前 k 个结果相同）
+
+    先用 np.partition 在 O(N) 内找到第 k 大的分数，只对入选的 k 个候选排序，
+    不对全部 N 个分数做完整排序。
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        top = np.concatenate((above, ties))
+    else:
+        top = np.arange(n)
+    return top[np.lexsort((top, -scores[top]))]
+
 
 class VectorStore:
     """向量数据库类"""
 
-    def __init__(self, db_path: str = "./data/vectordb"):
+    def __init__(
+        self,
+        db_path: str = "./data/vectordb",
+        quantization: str = "none",
+        index_type: str = "flat",
+        embedding_cache: bool = False,
+        hnsw_m: int = HNSW_M,
+        hnsw_ef_construction: int = HNSW_EF_CONSTRUCTION,
+        hnsw_ef_search: int = HNSW_EF_SEARCH
+    ):
+        """
+        Args:
+            db_path: 向量数据库目录
+            quantization: 内存存储的向量格式：none（float32）或 int8（每个向量一个缩放系数的对称量化，
+                占用约为 float32 的 1/4）
+            index_type: 内存存储的检索方式：flat（精确的全量打分）、hnsw（faiss HNSW 近似最近邻，
+                需安装 faiss，未安装时退回 flat）或 auto（文档块数达到 HNSW_AUTO_MIN_ROWS 时使用 hnsw）
+            embedding_cache: 是否在 db_path 下按文本内容缓存嵌入向量，重新索引时跳过未变化的文档
+            hnsw_m: HNSW 每个节点的邻居数，越大召回越高，建图越慢、占用越大
+            hnsw_ef_construction: HNSW 建图时的候选队列长度
+            hnsw_ef_search: HNSW 检索时的候选队列长度（不小于 top_k），越大召回越高、检索越慢
+        """
         self.db_path = db_path
-        self.embedding_model = EmbeddingModel()
+        self.quantization = quantization
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.embedding_model = EmbeddingModel(
+            cache_path=os.path.join(db_path, _EMBEDDING_CACHE_FILE) if embedding_cache else None
+        )
         self.client = None
         self.collection = None
         self._documents = []  # 内存存储后备方案
-        self._embeddings = []  # 内存存储嵌入向量
+        self._ids = []        # 内存存储的文档块ID
+        self._id_to_row = {}  # 文档块ID -> 行号，重复添加同一文档块时覆盖原行
+        # 内存存储嵌入向量（写入时已 L2 归一化，int8 量化时为量化后的向量）；
+        # 矩阵构建后每行是矩阵上的视图，向量数据只保存一份
+        self._embeddings = []
+        self._scales = []     # int8 量化时每个向量的缩放系数
         self._metadata = []   # 内存存储元数据
+        self._field_index: Dict[str, Dict[Any, List[int]]] = {}  # 元数据字段 -> 取值 -> 行号（升序），用于过滤
+        self._unindexed_fields = set()  # 出现过不可哈希取值的字段，按这些字段过滤时逐行比较
+        self._deleted_rows = set()  # 已删除但尚未整理掉的行号，检索时跳过
+        self._embedding_matrix: Optional[np.ndarray] = None  # _embeddings 堆叠成的矩阵，按需构建
+        self._scale_vector: Optional[np.ndarray] = None  # _scales 对应的数组，与矩阵一同构建
+        self._matrix_buffer: Optional[np.ndarray] = None  # 预留了追加空间的矩阵存储，_embedding_matrix 是它的前 N 行
+        self._hnsw_index = None  # 内存存储的 HNSW 索引，检索时把新增的向量补进索引
         self._initialize_db()
+        if self.collection is None:
+            self._load_memory_store()
 
     def _initialize_db(self):
         """初始化数据库"""
@@ -48,8 +150,13 @@ class VectorStore:
             logger.error(f"向量数据库初始化失败: {e}")
             logger.info("将使用内存向量存储")
 
-    def add_documents(self, chunks: List[DocumentChunk]) -> bool:
-        """添加文档块到向量数据库"""
+    def add_documents(self, chunks: List[DocumentChunk], embeddings: Optional[List[List[float]]] = None) -> bool:
+        """添加文档块到向量数据库
+
+        Args:
+            chunks: 文档块列表
+            embeddings: 与 chunks 一一对应的预先计算的嵌入向量；不提供时整批编码
+        """
         try:
             if not chunks:
                 return True
@@ -58,27 +165,72 @@ class VectorStore:
             texts = [chunk.content for chunk in chunks]
 
             # 生成嵌入向量
-            embeddings = self.embedding_model.encode(texts)
+            if embeddings is None:
+                embeddings = self.embedding_model.encode(texts)
+            elif len(embeddings) != len(chunks):
+                raise ValueError(f"嵌入向量数量 {len(embeddings)} 与文档块数量 {len(chunks)} 不一致")
 
             if CHROMADB_AVAILABLE and self.collection is not None:
                 # 使用 ChromaDB
-                ids = [chunk.id or f"doc_{i}" for i, chunk in enumerate(chunks)]
+                ids = [chunk.id for chunk in chunks]
                 metadatas = [chunk.metadata for chunk in chunks]
                 documents = texts
 
-                self.collection.add(
-                    embeddings=embeddings,
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
+                batch_size = CHROMA_ADD_BATCH_SIZE
+                max_batch_size = getattr(self.client, "get_max_batch_size", None)
+                if max_batch_size is not None:
+                    batch_size = min(batch_size, max_batch_size())
+                for start in range(0, len(ids), batch_size):
+                    end = start + batch_size
+                    self.collection.add(
+                        embeddings=embeddings[start:end],
+                        documents=documents[start:end],
+                        metadatas=metadatas[start:end],
+                        ids=ids[start:end]
+                    )
                 logger.info(f"成功添加 {len(chunks)} 个文档块到 ChromaDB")
             else:
-                # 使用内存存储
+                # 使用内存存储，向量写入时归一化一次，检索时余弦相似度即为点积
+                changed = False
+                overwritten = []
+                appended_from = len(self._embeddings)
                 for i, chunk in enumerate(chunks):
+                    row = self._id_to_row.get(chunk.id) if chunk.id else None
+                    if (row is not None and self._documents[row] == chunk.content
+                            and self._metadata[row] == chunk.metadata):
+                        # 内容未变的文档块（如重启后重新索引）保持原样，已有的矩阵和索引继续可用
+                        continue
+
+                    changed = True
+                    vector = self._normalize(embeddings[i])
+                    scale = None
+                    if self.quantization == "int8":
+                        vector, scale = self._quantize_int8(vector)
+
+                    if row is not None:
+                        # 同一文档块再次添加时覆盖原行；HNSW 图不支持删除，之后重新建图
+                        self._documents[row] = chunk.content
+                        self._embeddings[row] = vector
+                        self._unindex_metadata(row, self._metadata[row])
+                        self._metadata[row] = chunk.metadata
+                        self._index_metadata(row, chunk.metadata)
+                        if scale is not None:
+                            self._scales[row] = scale
+                        overwritten.append(row)
+                        self._hnsw_index = None
+                        continue
+
+                    if chunk.id:
+                        self._id_to_row[chunk.id] = len(self._ids)
+                    self._ids.append(chunk.id)
                     self._documents.append(chunk.content)
-                    self._embeddings.append(embeddings[i])
+                    self._embeddings.append(vector)
                     self._metadata.append(chunk.metadata)
+                    self._index_metadata(len(self._metadata) - 1, chunk.metadata)
+                    if scale is not None:
+                        self._scales.append(scale)
+                if changed:
+                    self._update_matrix(overwritten, appended_from)
                 logger.info(f"成功添加 {len(chunks)} 个文档块到内存存储")
 
             return True
@@ -86,22 +238,41 @@ class VectorStore:
             logger.error(f"添加文档失败: {e}")
             return False
 
-    def search(self, query: str, top_k: int = 5, filter_dict: Optional[Dict[str, Any]] = None) -> List[Tuple[DocumentChunk, float]]:
-        """搜索相关文档"""
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Tuple[DocumentChunk, float]]:
+        """搜索相关文档
+
+        Args:
+            query_embedding: 调用方已编码好的查询向量；提供时不再对 query 编码
+        """
         try:
+            if query_embedding is None:
+                query_embedding = self.embedding_model.encode_single(query)
             if CHROMADB_AVAILABLE and self.collection is not None:
-                return self._search_chromadb(query, top_k, filter_dict)
+                return self._search_chromadb(query_embedding, top_k, filter_dict)
             else:
-                return self._search_memory(query, top_k, filter_dict)
+                return self._search_memory(query_embedding, top_k, filter_dict)
         except Exception as e:
             logger.error(f"向量搜索失败: {e}")
             return []
 
-    def _search_chromadb(self, query: str, top_k: int, filter_dict: Optional[Dict[str, Any]]) -> List[Tuple[DocumentChunk, float]]:
+    def _search_chromadb(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]]
+    ) -> List[Tuple[DocumentChunk, float]]:
         """使用 ChromaDB 搜索"""
         try:
-            # 生成查询向量
-            query_embedding = self.embedding_model.encode_single(query)
+            if filter_dict:
+                selected = self._search_chromadb_selective(query_embedding, top_k, filter_dict)
+                if selected is not None:
+                    return selected
 
             # 执行搜索
             results = self.collection.query(
@@ -113,62 +284,107 @@ class VectorStore:
             # 处理结果
             search_results = []
             if results['documents'] and results['documents'][0]:
-                for i, (doc, metadata, distance) in enumerate(zip(
-                    results['documents'][0],
-                    results['metadatas'][0],
-                    results['distances'][0]
-                )):
-                    chunk = DocumentChunk(
-                        id=results['ids'][0][i],
-                        content=doc,
-                        metadata=metadata,
-                        source=metadata.get('source', 'unknown'),
-                        chunk_index=metadata.get('chunk_index', 0)
+                # ChromaDB 返回的是距离，需要转换为相似度
+                search_results = [
+                    (
+                        DocumentChunk(
+                            id=doc_id,
+                            content=doc,
+                            metadata=metadata,
+                            source=metadata.get('source', 'unknown'),
+                            chunk_index=metadata.get('chunk_index', 0)
+                        ),
+                        1.0 / (1.0 + distance)
+                    )
+                    for doc_id, doc, metadata, distance in zip(
+                        results['ids'][0],
+                        results['documents'][0],
+                        results['metadatas'][0],
+                        results['distances'][0]
                     )
-                    # ChromaDB 返回的是距离，需要转换为相似度
-                    similarity = 1.0 / (1.0 + distance)
-                    search_results.append((chunk, similarity))
+                ]
 
             return search_results
         except Exception as e:
             logger.error(f"ChromaDB 搜索失败: {e}")
             return []
 
-    def _search_memory(self, query: str, top_k: int, filter_dict: Optional[Dict[str, Any]]) -> List[Tuple[DocumentChunk, float]]:
+    def _search_chromadb_selective(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filter_dict: Dict[str, Any]
+    ) -> Optional[List[Tuple[DocumentChunk, float]]]:
+        """过滤条件只命中少量文档块时，直接按条件取出并在本地打分，不走向量检索
+
+        最多取 2 * top_k + 1 条；超过 2 * top_k 条说明条件不够精确，返回 None 交给 query。
+        打分与 query 一致：平方 L2 距离，相似度为 1 / (1 + 距离)。
+        """
+        limit = 2 * top_k
+        found = self.collection.get(
+            where=filter_dict, limit=limit + 1, include=["documents", "metadatas", "embeddings"]
+        )
+        if len(found['ids']) > limit:
+            return None
+        if not len(found['ids']):
+            return []
+
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        stored = np.asarray(found['embeddings'], dtype=np.float32)
+        distances = ((stored - query_vec) ** 2).sum(axis=1)
+        order = top_k_indices(-distances, top_k)
+        return [
+            (
+                DocumentChunk(
+                    id=found['ids'][i],
+                    content=found['documents'][i],
+                    metadata=found['metadatas'][i],
+                    source=found['metadatas'][i].get('source', 'unknown'),
+                    chunk_index=found['metadatas'][i].get('chunk_index', 0)
+                ),
+                1.0 / (1.0 + float(distances[i]))
+            )
+            for i in order
+        ]
+
+    def _search_memory(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]]
+    ) -> List[Tuple[DocumentChunk, float]]:
         """使用内存存储搜索"""
         try:
             if not self._documents:
                 return []
 
-            # 生成查询向量
-            query_embedding = self.embedding_model.encode_single(query)
+            query_vec = self._normalize(query_embedding)
 
-            # 计算相似度
-            similarities = []
-            for i, embedding in enumerate(self._embeddings):
-                similarity = self.embedding_model.similarity(query_embedding, embedding)
+            # 应用过滤器
+            indices = self._filter_rows(filter_dict) if filter_dict else np.arange(len(self._documents))
+            if self._deleted_rows:
+                live = np.ones(len(self._documents), dtype=bool)
+                live[np.fromiter(self._deleted_rows, dtype=np.int64, count=len(self._deleted_rows))] = False
+                indices = indices[live[indices]]
 
-                # 应用过滤器
-                if filter_dict:
-                    metadata = self._metadata[i]
-                    match = all(
-                        metadata.get(key) == value
-                        for key, value in filter_dict.items()
-                    )
-                    if not match:
-                        continue
+            top_results = None
+            if self._use_hnsw():
+                restricted = bool(filter_dict or self._deleted_rows)
+                top_results = self._search_hnsw(query_vec, top_k, indices if restricted else None)
 
-                similarities.append((i, similarity))
+            if top_results is None:
+                # 一次矩阵-向量乘法算出所有文档的余弦相似度
+                similarities = self._memory_similarities(query_vec)
 
-            # 排序并取 top_k
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            top_results = similarities[:top_k]
+                # 取 top_k（同分保持原顺序）
+                order = top_k_indices(similarities[indices], top_k)
+                top_results = [(int(indices[i]), float(similarities[indices[i]])) for i in order]
 
             # 构建结果
             search_results = []
             for idx, similarity in top_results:
                 chunk = DocumentChunk(
-                    id=f"mem_doc_{idx}",
+                    id=self._ids[idx] or f"mem_doc_{idx}",
                     content=self._documents[idx],
                     metadata=self._metadata[idx],
                     source=self._metadata[idx].get('source', 'memory'),
@@ -181,6 +397,414 @@ class VectorStore:
             logger.error(f"内存搜索失败: {e}")
             return []
 
+    def _filter_rows(self, filter_dict: Dict[str, Any]) -> np.ndarray:
+        """满足 filter_dict 全部条件的行号（升序）
+
+        可哈希的取值直接查元数据倒排索引并求交集；取值为 None（同时匹配缺少该字段的文档）、
+        不可哈希或字段出现过不可哈希取值时，只在交集内逐行比较。
+        """
+        indexed, residual = [], []
+        for key, value in filter_dict.items():
+            try:
+                hash(value)
+            except TypeError:
+                residual.append((key, value))
+                continue
+            if value is None or key in self._unindexed_fields:
+                residual.append((key, value))
+            else:
+                rows = self._field_index.get(key, {}).get(value, [])
+                indexed.append(np.fromiter(rows, dtype=np.int64, count=len(rows)))
+
+        if indexed:
+            indices = reduce(np.intersect1d, indexed)
+        else:
+            indices = np.arange(len(self._documents))
+        if residual and len(indices):
+            mask = np.fromiter(
+                (all(self._metadata[row].get(key) == value for key, value in residual) for row in indices),
+                dtype=bool,
+                count=len(indices)
+            )
+            indices = indices[mask]
+        return indices
+
+    def _index_metadata(self, row: int, metadata: Dict[str, Any]):
+        """把一行的元数据写入倒排索引"""
+        for key, value in metadata.items():
+            try:
+                rows = self._field_index.setdefault(key, {}).setdefault(value, [])
+            except TypeError:
+                self._unindexed_fields.add(key)
+                continue
+            if rows and rows[-1] > row:
+                bisect.insort(rows, row)
+            else:
+                rows.append(row)
+
+    def _unindex_metadata(self, row: int, metadata: Dict[str, Any]):
+        """从倒排索引中移除一行（覆盖该行之前调用）"""
+        for key, value in metadata.items():
+            try:
+                values = self._field_index.get(key, {})
+                rows = values.get(value)
+            except TypeError:
+                continue
+            if not rows:
+                continue
+            pos = bisect.bisect_left(rows, row)
+            if pos < len(rows) and rows[pos] == row:
+                del rows[pos]
+                if not rows:
+                    del values[value]
+
+    def document_similarities(self, ids: List[str], query_embedding: List[float]) -> Dict[str, float]:
+        """已索引文档块与查询向量的余弦相似度，直接使用库中存储的向量，不重新编码
+
+        未索引或维度不一致的文档块不出现在结果中。
+        """
+        try:
+            if not ids:
+                return {}
+            if CHROMADB_AVAILABLE and self.collection is not None:
+                stored = self.collection.get(ids=ids, include=["embeddings"])
+                if stored['embeddings'] is None or not len(stored['embeddings']):
+                    return {}
+                scores = EmbeddingModel.similarity_matrix([query_embedding], stored['embeddings'])[0]
+                return {doc_id: float(score) for doc_id, score in zip(stored['ids'], scores)}
+
+            query_vec = self._normalize(query_embedding)
+            found = [(doc_id, self._id_to_row[doc_id]) for doc_id in ids if doc_id in self._id_to_row]
+            if not found:
+                return {}
+
+            matrix = self._stacked_embeddings()
+            if matrix is not None and matrix.shape[1] == len(query_vec):
+                # 取出候选行后一次矩阵-向量乘法
+                rows = np.fromiter((row for _, row in found), dtype=np.int64, count=len(found))
+                scores = matrix[rows].astype(np.float32) @ query_vec
+                if self._scale_vector is not None:
+                    scores *= self._scale_vector[rows]
+                return {doc_id: float(score) for (doc_id, _), score in zip(found, scores)}
+
+            similarities = {}
+            for doc_id, row in found:
+                if len(self._embeddings[row]) != len(query_vec):
+                    continue
+                score = float(np.asarray(self._embeddings[row], dtype=np.float32) @ query_vec)
+                similarities[doc_id] = score * self._scales[row] if self._scales else score
+            return similarities
+        except Exception as e:
+            logger.error(f"计算文档相似度失败: {e}")
+            return {}
+
+    def _use_hnsw(self) -> bool:
+        """当前是否用 HNSW 索引检索（auto 模式按文档块数决定）"""
+        if self.index_type == "auto":
+            return len(self._embeddings) >= HNSW_AUTO_MIN_ROWS
+        return self.index_type == "hnsw"
+
+    def _search_hnsw(
+        self,
+        query_vec: np.ndarray,
+        top_k: int,
+        allowed: Optional[np.ndarray]
+    ) -> Optional[List[Tuple[int, float]]]:
+        """用 HNSW 索引检索，返回 (行号, 相似度)；索引不可用时返回 None，由调用方全量打分"""
+        index = self._sync_hnsw_index()
+        if index is None or index.d != len(query_vec):
+            return None
+        if allowed is not None and not len(allowed):
+            return []
+
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = max(self.hnsw_ef_search, top_k)
+        if allowed is not None:
+            # 过滤条件在图遍历时生效，不会因为先取 top_k 再过滤而漏掉结果
+            selector = faiss.IDSelectorBatch(allowed.astype(np.int64))
+            params.sel = selector
+
+        k = min(top_k, index.ntotal)
+        if k <= 0:
+            return []
+        distances, rows = index.search(query_vec.reshape(1, -1).astype(np.float32), k, params=params)
+        return [(int(row), float(score)) for row, score in zip(rows[0], distances[0]) if row >= 0]
+
+    def _sync_hnsw_index(self):
+        """返回包含全部内存向量的 HNSW 索引，首次调用时建图，之后只追加新向量"""
+        if not FAISS_AVAILABLE or not self._embeddings:
+            return None
+
+        if self._hnsw_index is None:
+            dim = len(self._embeddings[0])
+            index = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.hnsw_ef_construction
+            self._hnsw_index = index
+
+        index = self._hnsw_index
+        pending = self._embeddings[index.ntotal:]
+        if pending:
+            # 维度不一致（简单向量化方法）时无法加入索引，退回全量打分
+            if any(len(v) != index.d for v in pending):
+                return None
+            rows = np.vstack(pending).astype(np.float32)
+            if self._scales:
+                rows *= np.asarray(self._scales[index.ntotal:], dtype=np.float32)[:, np.newaxis]
+            index.add(rows)
+        return index
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        """L2 归一化（零向量保持为零）"""
+        vec = np.asarray(vector, dtype=np.float32)
+        return vec / (np.sqrt(np.vdot(vec, vec)) + 1e-12)
+
+    @staticmethod
+    def _quantize_int8(vector: np.ndarray) -> Tuple[np.ndarray, float]:
+        """对称 int8 量化：vector ≈ 量化值 * scale"""
+        max_abs = float(np.abs(vector).max()) if len(vector) else 0.0
+        scale = max_abs / 127 if max_abs > 0 else 1.0
+        return np.round(vector / scale).astype(np.int8), scale
+
+    def _stacked_embeddings(self) -> Optional[np.ndarray]:
+        """把内存向量堆叠成矩阵（按需构建并缓存），维度不一致时返回 None"""
+        if self._embedding_matrix is None:
+            # 简单向量化方法每次编码的维度可能不同，只有维度一致时才能堆叠成矩阵
+            if len({len(v) for v in self._embeddings}) == 1:
+                self._embedding_matrix = np.vstack(self._embeddings)
+                self._embeddings = list(self._embedding_matrix)
+                if self._scales:
+                    self._scale_vector = np.asarray(self._scales, dtype=np.float32)
+        return self._embedding_matrix
+
+    def _update_matrix(self, overwritten: List[int], appended_from: int):
+        """把覆盖和新增的行写进已构建的矩阵，不整体重新堆叠
+
+        矩阵存放在按容量倍增预留空间的缓冲区中，逐条追加的均摊代价为 O(D)；
+        维度不一致或矩阵只读（从 mmap 载入）且有行被覆盖时，丢弃矩阵，下次检索时重建。
+        """
+        matrix = self._embedding_matrix
+        # 同一批内先新增又被覆盖的行随新增部分一起写入
+        overwritten = [row for row in overwritten if row < appended_from]
+        if matrix is not None:
+            dim = matrix.shape[1]
+            new_rows = self._embeddings[appended_from:]
+            if (any(len(v) != dim for v in new_rows)
+                    or any(len(self._embeddings[row]) != dim for row in overwritten)
+                    or (overwritten and not matrix.flags.writeable)):
+                matrix = None
+
+        if matrix is None:
+            self._embedding_matrix = None
+            self._scale_vector = None
+            self._matrix_buffer = None
+            return
+
+        for row in overwritten:
+            matrix[row] = self._embeddings[row]
+            self._embeddings[row] = matrix[row]
+
+        if new_rows:
+            total = len(self._embeddings)
+            buffer = self._matrix_buffer
+            if buffer is None or matrix.base is not buffer or len(buffer) < total:
+                buffer = np.empty((max(total, 2 * len(matrix), 1024), dim), dtype=matrix.dtype)
+                buffer[:appended_from] = matrix
+                self._matrix_buffer = buffer
+                # 已有的行也改为新缓冲区上的视图，旧矩阵（或 mmap）随之释放
+                appended_from = 0
+            buffer[len(matrix):total] = np.vstack(self._embeddings[len(matrix):])
+            matrix = buffer[:total]
+            self._embeddings[appended_from:] = list(matrix[appended_from:])
+
+        self._embedding_matrix = matrix
+        self._scale_vector = np.asarray(self._scales, dtype=np.float32) if self._scales else None
+
+    def _memory_similarities(self, query_vec: np.ndarray) -> np.ndarray:
+        """内存存储中每个文档与查询向量的余弦相似度"""
+        self._stacked_embeddings()
+
+        if self._embedding_matrix is not None and self._embedding_matrix.shape[1] == len(query_vec):
+            if self._scale_vector is None:
+                return self._embedding_matrix @ query_vec
+            return self._int8_similarities(query_vec)
+
+        # 维度不一致的向量无法比较，相似度记为 0
+        scales = self._scales or [1.0] * len(self._embeddings)
+        return np.array(
+            [float(v.astype(np.float32) @ query_vec) * scale if len(v) == len(query_vec) else 0.0
+             for v, scale in zip(self._embeddings, scales)],
+            dtype=np.float32
+        )
+
+    def _int8_similarities(self, query_vec: np.ndarray) -> np.ndarray:
+        """int8 矩阵与 float32 查询向量的点积：按块反量化后做矩阵-向量乘法，临时内存只有一块的大小"""
+        matrix = self._embedding_matrix
+        similarities = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), _INT8_SEARCH_BLOCK_ROWS):
+            block = matrix[start:start + _INT8_SEARCH_BLOCK_ROWS]
+            np.matmul(block.astype(np.float32), query_vec, out=similarities[start:start + len(block)])
+        similarities *= self._scale_vector
+        return similarities
+
+    def persist(self) -> bool:
+        """把内存存储写入 db_path 下的 memory 目录（ChromaDB 自行持久化，无需调用）
+
+        向量矩阵保存为 .npy，下次启动时以 mmap 方式只读打开，按需从磁盘分页载入；
+        已建好的 HNSW 索引一并保存。保存后当前进程也改为 mmap 访问刚写入的文件，释放内存中的矩阵。
+        """
+        if self.collection is not None:
+            return True
+        if self._deleted_rows:
+            self._compact_memory()
+        if not self._documents:
+            # 文档已全部删除时清掉已保存的文件，避免下次启动时重新载入
+            return self._remove_persisted_store()
+        if len({len(v) for v in self._embeddings}) != 1:
+            # 简单向量化方法产生的维度不一致的向量无法保存为矩阵
+            logger.warning("内存向量维度不一致，跳过持久化")
+            return False
+        # 向量全部由调用方提供、嵌入模型从未编码过时为 None，载入时不做检查
+        encoder_state = self.embedding_model.encoder_state()
+
+        store_dir = os.path.join(self.db_path, _MEMORY_STORE_DIR)
+        try:
+            os.makedirs(store_dir, exist_ok=True)
+            if self._embedding_matrix is None:
+                self._embedding_matrix = np.vstack(self._embeddings)
+            self._write_atomic(store_dir, _MEMORY_VECTORS_FILE, lambda f: np.save(f, self._embedding_matrix))
+
+            scales_path = os.path.join(store_dir, _MEMORY_SCALES_FILE)
+            if self._scales:
+                scales = np.asarray(self._scales, dtype=np.float32)
+                self._write_atomic(store_dir, _MEMORY_SCALES_FILE, lambda f: np.save(f, scales))
+            elif os.path.exists(scales_path):
+                os.remove(scales_path)
+
+            lines = b"".join(
+                orjson.dumps({"id": doc_id, "content": content, "metadata": metadata}) + b"\n"
+                for doc_id, content, metadata in zip(self._ids, self._documents, self._metadata)
+            )
+            self._write_atomic(store_dir, _MEMORY_DOCUMENTS_FILE, lambda f: f.write(lines))
+            self._write_atomic(store_dir, _MEMORY_ENCODER_FILE, lambda f: f.write(orjson.dumps(encoder_state)))
+
+            hnsw_path = os.path.join(store_dir, _MEMORY_HNSW_FILE)
+            index = self._sync_hnsw_index() if self._use_hnsw() else None
+            if index is not None:
+                faiss.write_index(index, hnsw_path + ".tmp")
+                os.replace(hnsw_path + ".tmp", hnsw_path)
+            elif os.path.exists(hnsw_path):
+                os.remove(hnsw_path)
+
+            self._map_persisted_vectors(os.path.join(store_dir, _MEMORY_VECTORS_FILE))
+
+            logger.info(f"内存向量存储已保存: {store_dir}（{len(self._documents)} 个文档块）")
+            return True
+        except Exception as e:
+            logger.error(f"保存内存向量存储失败: {e}")
+            return False
+
+    def _remove_persisted_store(self) -> bool:
+        store_dir = os.path.join(self.db_path, _MEMORY_STORE_DIR)
+        try:
+            for filename in (_MEMORY_VECTORS_FILE, _MEMORY_SCALES_FILE, _MEMORY_DOCUMENTS_FILE, _MEMORY_HNSW_FILE,
+                             _MEMORY_ENCODER_FILE):
+                path = os.path.join(store_dir, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            return True
+        except Exception as e:
+            logger.error(f"清除内存向量存储文件失败: {e}")
+            return False
+
+    def _map_persisted_vectors(self, vectors_path: str):
+        """把内存中的矩阵换成刚保存的 .npy 文件的只读 mmap，由页缓存按需载入"""
+        matrix = np.load(vectors_path, mmap_mode="r")
+        if matrix.shape != self._embedding_matrix.shape or matrix.dtype != self._embedding_matrix.dtype:
+            return
+        self._embedding_matrix = matrix
+        self._embeddings = list(matrix)
+        self._matrix_buffer = None
+
+    @staticmethod
+    def _write_atomic(directory: str, filename: str, write):
+        """先写临时文件再替换，读取方不会看到写了一半的文件"""
+        path = os.path.join(directory, filename)
+        with open(path + ".tmp", "wb") as f:
+            write(f)
+        os.replace(path + ".tmp", path)
+
+    def _load_memory_store(self):
+        """载入 persist() 保存的内存存储；向量矩阵以只读 mmap 打开，不整体读入内存"""
+        store_dir = os.path.join(self.db_path, _MEMORY_STORE_DIR)
+        vectors_path = os.path.join(store_dir, _MEMORY_VECTORS_FILE)
+        documents_path = os.path.join(store_dir, _MEMORY_DOCUMENTS_FILE)
+        if not (os.path.exists(vectors_path) and os.path.exists(documents_path)):
+            return
+
+        # 向量和索引文件之后以 mmap 按需访问，先让内核在后台预读，与解析文档记录重叠
+        hnsw_path = os.path.join(store_dir, _MEMORY_HNSW_FILE)
+        prefetch_file(vectors_path)
+        if self.index_type != "flat":
+            prefetch_file(hnsw_path)
+
+        try:
+            matrix = np.load(vectors_path, mmap_mode="r")
+            scales_path = os.path.join(store_dir, _MEMORY_SCALES_FILE)
+            quantized = os.path.exists(scales_path)
+            if quantized != (self.quantization == "int8"):
+                logger.warning("已保存的内存向量格式与当前配置不一致，忽略，等待重新索引")
+                return
+
+            with open(documents_path, "rb") as f:
+                records = [orjson.loads(line) for line in f if line.strip()]
+            if len(records) != len(matrix):
+                logger.warning("已保存的内存向量与文档数量不一致，忽略，等待重新索引")
+                return
+
+            # 简单向量化方法的词表随语料变化，恢复保存时的词表，已保存的向量和之后编码的向量才可比较；
+            # 内容未变的文档块在重新索引时不会重新编码，编码方式不一致的向量只能整体丢弃
+            encoder_path = os.path.join(store_dir, _MEMORY_ENCODER_FILE)
+            if not os.path.exists(encoder_path):
+                logger.warning("已保存的内存向量缺少编码方式信息，忽略，等待重新索引")
+                return
+            with open(encoder_path, "rb") as f:
+                encoder_state = orjson.loads(f.read())
+            if encoder_state is not None and not self.embedding_model.restore_encoder_state(encoder_state):
+                logger.warning("已保存的内存向量与当前编码方式不一致，忽略，等待重新索引")
+                return
+
+            self._ids = [record.get("id") for record in records]
+            self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._ids) if doc_id}
+            self._documents = [record["content"] for record in records]
+            self._metadata = [record.get("metadata") or {} for record in records]
+            for row, metadata in enumerate(self._metadata):
+                self._index_metadata(row, metadata)
+            # 每行是 mmap 上的视图，不复制数据
+            self._embeddings = list(matrix)
+            self._embedding_matrix = matrix
+            if quantized:
+                self._scale_vector = np.load(scales_path)
+                self._scales = self._scale_vector.tolist()
+
+            if FAISS_AVAILABLE and self._use_hnsw() and os.path.exists(hnsw_path):
+                try:
+                    index = faiss.read_index(hnsw_path, faiss.IO_FLAG_MMAP)
+                except Exception:
+                    index = faiss.read_index(hnsw_path)
+                if index.ntotal == len(matrix):
+                    self._hnsw_index = index
+
+            logger.info(f"载入内存向量存储: {len(self._documents)} 个文档块")
+        except Exception as e:
+            logger.error(f"载入内存向量存储失败: {e}")
+            self._ids, self._id_to_row = [], {}
+            self._documents, self._embeddings, self._scales, self._metadata = [], [], [], []
+            self._field_index, self._unindexed_fields = {}, set()
+            self._embedding_matrix = None
+            self._scale_vector = None
+            self._hnsw_index = None
+
     def delete_documents(self, ids: List[str]) -> bool:
         """删除文档"""
         try:
@@ -188,13 +812,48 @@ class VectorStore:
                 self.collection.delete(ids=ids)
                 logger.info(f"从 ChromaDB 删除 {len(ids)} 个文档")
             else:
-                # 内存存储的删除逻辑比较复杂，这里简化处理
-                logger.info(f"内存存储暂不支持按ID删除")
+                # 只打删除标记，矩阵保持连续；删除的行较多时再整理
+                deleted = 0
+                for doc_id in ids:
+                    row = self._id_to_row.pop(doc_id, None)
+                    if row is None:
+                        continue
+                    self._deleted_rows.add(row)
+                    self._unindex_metadata(row, self._metadata[row])
+                    deleted += 1
+                if len(self._deleted_rows) > MEMORY_COMPACT_DELETED_RATIO * len(self._documents):
+                    self._compact_memory()
+                logger.info(f"从内存存储删除 {deleted} 个文档")
             return True
         except Exception as e:
             logger.error(f"删除文档失败: {e}")
             return False
 
+    def _compact_memory(self):
+        """移除打了删除标记的行，重建矩阵、ID 索引和元数据索引（行号随之变化，HNSW 索引之后重新建图）"""
+        live = [row for row in range(len(self._documents)) if row not in self._deleted_rows]
+        self._ids = [self._ids[row] for row in live]
+        self._documents = [self._documents[row] for row in live]
+        self._metadata = [self._metadata[row] for row in live]
+        if self._scales:
+            self._scales = [self._scales[row] for row in live]
+
+        if self._embedding_matrix is not None:
+            matrix = self._embedding_matrix[np.asarray(live, dtype=np.int64)]
+            self._embedding_matrix = matrix
+            self._embeddings = list(matrix)
+            self._scale_vector = np.asarray(self._scales, dtype=np.float32) if self._scales else None
+        else:
+            self._embeddings = [self._embeddings[row] for row in live]
+        self._matrix_buffer = None
+
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._ids) if doc_id}
+        self._field_index, self._unindexed_fields = {}, set()
+        for row, metadata in enumerate(self._metadata):
+            self._index_metadata(row, metadata)
+        self._hnsw_index = None
+        self._deleted_rows = set()
+
     def get_collection_info(self) -> Dict[str, Any]:
         """获取集合信息"""
         try:
@@ -203,13 +862,15 @@ class VectorStore:
                 return {
                     "type": "ChromaDB",
                     "document_count": count,
-                    "collection_name": self.collection.name
+                    "collection_name": self.collection.name,
+                    "query_cache": self.embedding_model.query_cache_info()
                 }
             else:
                 return {
                     "type": "Memory",
-                    "document_count": len(self._documents),
-                    "collection_name": "memory_store"
+                    "document_count": len(self._documents) - len(self._deleted_rows),
+                    "collection_name": "memory_store",
+                    "query_cache": self.embedding_model.query_cache_info()
                 }
         except Exception as e:
             logger.error(f"获取集合信息失败: {e}")
@@ -199,6 +199,8 @@ def create_sample_knowledge():
         # 保存素材数据
         with open(data_dir / "materials.json", "w", encoding="utf-8") as f:
             json.dump(materials, f, ensure_ascii=False, indent=2)
+        # 知识库的追加日志会回放到快照之上，重写快照时一并清除
+        (data_dir / "materials.jsonl").unlink(missing_ok=True)
 
         # 创建范文数据
         examples = [
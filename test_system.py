@@ -190,6 +190,8 @@ def create_sample_data():
     import json
     with open(data_dir / "materials.json", "w", encoding="utf-8") as f:
         json.dump(sample_materials, f, ensure_ascii=False, indent=2)
+    # 知识库的追加日志会回放到快照之上，重写快照时一并清除
+    (data_dir / "materials.jsonl").unlink(missing_ok=True)
 
     print("✅ 示例素材数据已创建")
 
@@ -105,6 +105,569 @@ class TestKnowledgeBase:
         results = self.kb.search_materials("坚持")
         assert len(results) > 0
 
+    def test_indexes_follow_update_and_delete(self, tmp_path):
+        """测试更新、删除后ID索引与倒排索引同步"""
+        kb = LocalKnowledgeBase(str(tmp_path))
+        material = WritingMaterial(
+            title="索引测试",
+            content="勤奋与坚持",
+            category="测试",
+            difficulty_level=DifficultyLevel.MIDDLE
+        )
+        assert kb.add_material(material)
+        assert kb.get_material_by_id(material.id).title == "索引测试"
+
+        material.content = "毅力与坚持"
+        assert kb.update_material(material)
+        assert kb.search_materials("勤奋") == []
+        assert [m.id for m in kb.search_materials("毅力")] == [material.id]
+
+        assert kb.delete_material(material.id)
+        assert kb.get_material_by_id(material.id) is None
+        assert kb.search_materials("毅力") == []
+
+    def test_log_replay_and_compact(self, tmp_path):
+        """测试追加日志在重新打开后回放，压缩后合并回快照"""
+        kb = LocalKnowledgeBase(str(tmp_path))
+        first = WritingMaterial(title="素材一", content="内容一", category="测试",
+                                difficulty_level=DifficultyLevel.MIDDLE)
+        second = WritingMaterial(title="素材二", content="内容二", category="测试",
+                                 difficulty_level=DifficultyLevel.MIDDLE)
+        assert kb.add_material(first)
+        assert kb.add_material(second)
+        first.title = "素材一（修订）"
+        assert kb.update_material(first)
+        assert kb.delete_material(second.id)
+        assert (tmp_path / "materials.jsonl").exists()
+        # 更新只记录变化的字段
+        assert '"_patch":{"title":"素材一（修订）"}' in (tmp_path / "materials.jsonl").read_text(encoding="utf-8")
+
+        reopened = LocalKnowledgeBase(str(tmp_path))
+        assert [m.title for m in reopened.list_materials()] == ["素材一（修订）"]
+
+        assert reopened.compact()
+        assert not (tmp_path / "materials.jsonl").exists()
+        assert [m.title for m in LocalKnowledgeBase(str(tmp_path)).list_materials()] == ["素材一（修订）"]
+
+        # 导入数据后日志合并回快照，直接读取快照的脚本也能看到全部记录
+        import json
+        from src.knowledge.loader import KnowledgeLoader
+        assert KnowledgeLoader(reopened).load_sample_data()
+        assert not (tmp_path / "materials.jsonl").exists()
+        snapshot = json.loads((tmp_path / "materials.json").read_text(encoding="utf-8"))
+        assert len(snapshot["materials"]) == len(reopened.list_materials()) > 1
+
+    def test_whoosh_backend(self, tmp_path):
+        """测试 Whoosh 索引随增删改同步"""
+        pytest.importorskip("whoosh")
+        from src.knowledge.whoosh_kb import WhooshKnowledgeBase
+
+        kb = WhooshKnowledgeBase(str(tmp_path))
+        material = WritingMaterial(title="毅力测试", content="毅力是成功的基石", category="测试",
+                                   difficulty_level=DifficultyLevel.MIDDLE)
+        assert kb.add_material(material)
+        assert [m.id for m in kb.search_materials("毅力")] == [material.id]
+
+        material.content = "恒心"
+        assert kb.update_material(material)
+        assert kb.search_materials("基石") == []
+
+        assert kb.delete_material(material.id)
+        assert kb.search_materials("毅力") == []
+
+    def test_whoosh_index_rebuilt_when_stale(self, tmp_path, monkeypatch):
+        """测试记录数不变但索引过期时（索引写入失败、外部改写ID），重新打开后重建索引"""
+        pytest.importorskip("whoosh")
+        import json
+        from src.knowledge.whoosh_kb import WhooshKnowledgeBase
+
+        kb = WhooshKnowledgeBase(str(tmp_path))
+        material = WritingMaterial(title="毅力测试", content="毅力是成功的基石", category="测试",
+                                   difficulty_level=DifficultyLevel.MIDDLE)
+        assert kb.add_material(material)
+
+        def fail(record):
+            raise RuntimeError("索引写入失败")
+
+        monkeypatch.setattr(kb._materials_index, "to_document", fail)
+        material.content = "恒心"
+        assert kb.update_material(material)
+        assert [m.id for m in WhooshKnowledgeBase(str(tmp_path)).search_materials("恒心")] == [material.id]
+
+        # 外部脚本直接改写快照中的ID（如 fix_duplicate_ids.py），记录数不变
+        assert LocalKnowledgeBase(str(tmp_path)).compact()
+        path = tmp_path / "materials.json"
+        data = json.loads(path.read_text(encoding="utf-8"))
+        data["materials"][0]["id"] = "renamed"
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        assert [m.id for m in WhooshKnowledgeBase(str(tmp_path)).search_materials("恒心")] == ["renamed"]
+
+
+class TestSemanticCache:
+    """语义缓存测试"""
+
+    def test_canonical_key_ignores_trivial_differences(self):
+        """测试规范化键忽略标点、大小写和关键词顺序"""
+        from src.generation.semantic_cache import SemanticCache
+
+        prompt1 = EssayPrompt(
+            title="我的老师！",
+            essay_type=EssayType.NARRATIVE,
+            difficulty_level=DifficultyLevel.MIDDLE,
+            keywords=["老师", "感恩"]
+        )
+        prompt2 = EssayPrompt(
+            title="  我的老师 ",
+            essay_type=EssayType.NARRATIVE,
+            difficulty_level=DifficultyLevel.MIDDLE,
+            keywords=["感恩", "老师"]
+        )
+
+        assert SemanticCache.build_key(prompt1) == SemanticCache.build_key(prompt2)
+
+    def test_get_put_and_eviction(self):
+        """测试精确匹配、过期和LRU淘汰"""
+        from src.generation.semantic_cache import SemanticCache
+
+        cache = SemanticCache(model=None, ttl=3600, max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+
+        # "b" 最久未使用，应被淘汰
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert len(cache) == 2
+
+        expired = SemanticCache(model=None, ttl=0)
+        expired.put("a", 1)
+        assert expired.get("a") is None
+
+    def test_get_consumes_prefetch(self):
+        """测试索引为空时 get 也会取走 prefetch 的编码任务（生成失败不调用 put 时不残留）"""
+        from src.generation.semantic_cache import SemanticCache
+
+        cache = SemanticCache(model="unavailable-model")
+        cache.prefetch("a")
+        assert cache.get("a") is None
+        assert not cache._pending
+
+
+class TestRequestBatcher:
+    """LLM 请求合并测试"""
+
+    def test_identical_requests_share_one_call(self):
+        """测试窗口内相同的请求只调用一次"""
+        import asyncio
+        from src.generation.request_batcher import RequestBatcher
+
+        calls = []
+
+        async def call(text):
+            calls.append(text)
+            return text * 2
+
+        async def main():
+            batcher = RequestBatcher(call, max_batch=8, max_wait=0.01)
+            return await asyncio.gather(
+                batcher.submit("a", "a"), batcher.submit("a", "a"), batcher.submit("b", "b")
+            )
+
+        assert asyncio.run(main()) == ["aa", "aa", "bb"]
+        assert calls == ["a", "b"]
+
+
+class TestBatchProcessor:
+    """批量生成测试"""
+
+    @staticmethod
+    def _guidance(theme):
+        from src.core.models import WritingGuidance
+        return WritingGuidance(theme_analysis=theme, structure_suggestion=[], writing_tips=[], key_points=[])
+
+    def test_pool_keeps_order_and_reports_progress(self, monkeypatch):
+        """测试并发池（令牌桶限流）完成顺序打乱时结果仍按输入顺序返回，并逐个报告进度"""
+        import asyncio
+        from src.generation import batch
+
+        monkeypatch.setattr(batch, "AIOLIMITER_AVAILABLE", False)
+        prompts = [EssayPrompt(title=f"题目{i}", essay_type=EssayType.NARRATIVE,
+                               difficulty_level=DifficultyLevel.MIDDLE) for i in range(5)]
+
+        class StubGenerator:
+            async def agenerate_guidance(self, prompt):
+                # 越靠前的题目完成得越晚
+                await asyncio.sleep(0.01 * (5 - int(prompt.title[2:])))
+                return TestBatchProcessor._guidance(prompt.title)
+
+        progress = []
+        processor = batch.BatchProcessor(StubGenerator(), max_concurrency=5, rate_limit=600,
+                                         on_progress=lambda done, total: progress.append((done, total)))
+        results = asyncio.run(processor.run_batch(prompts))
+
+        assert [g.theme_analysis for g in results] == [p.title for p in prompts]
+        assert progress == [(i, 5) for i in range(1, 6)]
+
+    def test_openai_batch_maps_results_by_custom_id(self, monkeypatch):
+        """测试批处理接口结果按 custom_id 对应回题目，缺失的结果使用模拟生成"""
+        import asyncio
+        import json
+        from types import SimpleNamespace
+        from src.generation import batch
+
+        prompts = [EssayPrompt(title=f"题目{i}", essay_type=EssayType.NARRATIVE,
+                               difficulty_level=DifficultyLevel.MIDDLE) for i in range(3)]
+
+        class StubGenerator:
+            provider = "openai"
+            llm = SimpleNamespace(model_name="test-model")
+            temperature = 0.0
+            max_tokens = 100
+
+            def _build_system_prompt(self):
+                return "system"
+
+            def _build_user_prompt(self, prompt, materials, essays, context):
+                return prompt.title
+
+            def _build_chat_messages(self, system_prompt, user_prompt):
+                return [{"role": "user", "content": user_prompt}]
+
+            def _prompt_cache_key(self, prompt, materials, essays):
+                return None
+
+            def _parse_llm_response(self, response_text, materials, essays):
+                return TestBatchProcessor._guidance(response_text)
+
+            def _generate_mock_guidance(self, prompt, materials, essays):
+                return TestBatchProcessor._guidance("模拟")
+
+        submitted = {}
+        # 输出文件中结果的顺序与提交顺序不同，且缺少 prompt-1
+        output = "\n".join(json.dumps({
+            "custom_id": custom_id,
+            "response": {"body": {"choices": [{"message": {"content": content}}]}}
+        }, ensure_ascii=False) for custom_id, content in [("prompt-2", "回答2"), ("prompt-0", "回答0")])
+
+        def create_file(file, purpose):
+            submitted["lines"] = [json.loads(line) for line in file[1].splitlines()]
+            return SimpleNamespace(id="file-in")
+
+        completed = SimpleNamespace(id="batch-1", status="completed", output_file_id="file-out",
+                                    request_counts=SimpleNamespace(completed=2))
+        client = SimpleNamespace(
+            files=SimpleNamespace(create=create_file, content=lambda file_id: SimpleNamespace(text=output)),
+            batches=SimpleNamespace(
+                create=lambda **kwargs: SimpleNamespace(id="batch-1", status="in_progress"),
+                retrieve=lambda batch_id: completed
+            )
+        )
+        monkeypatch.setattr(batch, "OPENAI_SDK_AVAILABLE", True)
+        monkeypatch.setattr(batch, "openai", SimpleNamespace(OpenAI=lambda **kwargs: client), raising=False)
+
+        progress = []
+        processor = batch.BatchProcessor(StubGenerator(), use_batch_api=True, poll_interval=0,
+                                         on_progress=lambda done, total: progress.append((done, total)))
+        results = asyncio.run(processor.run_batch(prompts))
+
+        assert [line["custom_id"] for line in submitted["lines"]] == ["prompt-0", "prompt-1", "prompt-2"]
+        assert [g.theme_analysis for g in results] == ["回答0", "模拟", "回答2"]
+        assert progress == [(2, 3), (3, 3)]
+
+
+class TestCircuitBreaker:
+    """熔断器测试"""
+
+    def test_state_transitions(self):
+        """测试 关闭 -> 熔断 -> 半开 -> 关闭，以及半开试探失败后重新熔断"""
+        import time
+        from src.generation.llm_generator import CircuitBreaker
+
+        breaker = CircuitBreaker(fail_max=2, reset_timeout=0.05)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+        time.sleep(0.06)
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        # 试探调用进行中，其余调用被拒绝
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        time.sleep(0.06)
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow()
+
+    def test_unsettled_trial_does_not_stick(self):
+        """测试试探调用一直没有结论时，超过 reset_timeout 后重新放行试探"""
+        import time
+        from src.generation.llm_generator import CircuitBreaker
+
+        breaker = CircuitBreaker(fail_max=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        assert breaker.allow()
+        assert not breaker.allow()
+        time.sleep(0.06)
+        assert breaker.allow()
+
+    def test_cancelled_trial_releases_breaker(self, monkeypatch):
+        """测试半开状态下的试探调用被取消后，下一次调用可以重新试探"""
+        import asyncio
+        import time
+        httpx = pytest.importorskip("httpx")
+        from src.generation.llm_generator import CircuitBreaker, DoubaoClient
+
+        async def slow_handler(request):
+            await asyncio.sleep(1)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        client = DoubaoClient(api_key="test", endpoint="http://doubao.test", model="test")
+        client.breaker = CircuitBreaker(fail_max=1, reset_timeout=0.05)
+        client.breaker.record_failure()
+        time.sleep(0.06)
+
+        async def main():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(slow_handler)) as slow_client:
+                monkeypatch.setattr(client, "_get_async_client", lambda: slow_client)
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(client.achat_completion([{"role": "user", "content": "hi"}]), 0.05)
+
+        asyncio.run(main())
+        assert client.breaker.state != CircuitBreaker.HALF_OPEN
+        assert client.breaker.allow()
+
+
+class TestLLMCache:
+    """LLM 精确缓存测试"""
+
+    def test_deterministic_calls_hit_cache(self, monkeypatch):
+        """测试只有确定性调用走缓存，且 max_tokens / stop 不同的调用不共用缓存"""
+        from src.generation.llm_cache import LLMCache
+        from src.generation.llm_generator import DoubaoClient
+
+        messages = [{"role": "user", "content": "hi"}]
+        key = LLMCache.make_key("test", messages, 0.0, 100, ["\n\n"])
+        assert key != LLMCache.make_key("test", messages, 0.0, 200, ["\n\n"])
+        assert key != LLMCache.make_key("test", messages, 0.0, 100, None)
+
+        calls = []
+
+        class FakeResponse:
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return {"choices": [{"message": {"content": f"回答{len(calls)}"}}]}
+
+        client = DoubaoClient(api_key="test", endpoint="http://doubao.test", model="test", cache=LLMCache())
+        monkeypatch.setattr(client.session, "post", lambda *args, **kwargs: calls.append(kwargs) or FakeResponse())
+
+        first = client.chat_completion(messages, temperature=0.0, max_tokens=100)
+        assert client.chat_completion(messages, temperature=0.0, max_tokens=100) == first
+        assert len(calls) == 1
+
+        client.chat_completion(messages, temperature=0.0, max_tokens=200)
+        client.chat_completion(messages, temperature=0.0, max_tokens=100, stop=["\n\n"])
+        assert len(calls) == 3
+
+        # 非确定性调用不读也不写缓存
+        client.chat_completion(messages, temperature=0.7, max_tokens=100)
+        client.chat_completion(messages, temperature=0.7, max_tokens=100)
+        assert len(calls) == 5
+
+
+class TestEmbeddingCache:
+    """嵌入向量缓存测试"""
+
+    def test_round_trip_by_content_key(self, tmp_path):
+        """测试按 (模型名, 文本) 写入后重新打开仍能命中"""
+        import numpy as np
+        from src.retrieval.embedding_cache import EmbeddingCache
+
+        path = str(tmp_path / "cache.sqlite3")
+        key = EmbeddingCache.make_key("model", "文本")
+        assert key != EmbeddingCache.make_key("other-model", "文本")
+
+        cache = EmbeddingCache(path)
+        cache.put_many([(key, np.array([0.6, 0.8]))])
+        cache.close()
+
+        found = EmbeddingCache(path).get_many([key, EmbeddingCache.make_key("model", "未缓存")])
+        assert list(found) == [key]
+        assert np.allclose(found[key], [0.6, 0.8])
+
+
+class TestVectorStore:
+    """向量存储测试"""
+
+    def test_memory_delete_hides_and_persists(self, tmp_path):
+        """测试内存存储按ID删除后检索不再返回，保存并重新载入后仍不存在"""
+        from src.core.models import DocumentChunk
+        from src.retrieval.vector_store import VectorStore
+
+        store = VectorStore(str(tmp_path), index_type="flat")
+        if store.collection is not None:
+            pytest.skip("已安装 chromadb，使用 ChromaDB 存储")
+        chunks = [
+            DocumentChunk(id=f"doc_{i}", content=f"文档{i}", metadata={"n": i}, source="test", chunk_index=i)
+            for i in range(6)
+        ]
+        embeddings = [[1.0, i / 10, 0.0] for i in range(6)]
+        assert store.add_documents(chunks, embeddings=embeddings)
+
+        assert store.delete_documents(["doc_0"])
+        ids = [chunk.id for chunk, _ in store.search("", top_k=6, query_embedding=[1.0, 0.0, 0.0])]
+        assert ids and "doc_0" not in ids
+        assert store.search("", filter_dict={"n": 0}, query_embedding=[1.0, 0.0, 0.0]) == []
+
+        assert store.persist()
+        reopened = VectorStore(str(tmp_path), index_type="flat")
+        assert reopened.get_collection_info()["document_count"] == 5
+        assert reopened.document_similarities(["doc_0", "doc_1"], [1.0, 0.0, 0.0]).keys() == {"doc_1"}
+
+    def test_restart_keeps_tfidf_vocabulary(self, tmp_path):
+        """测试重新启动后重新索引时沿用已保存的词表，新旧向量可以直接比较；增量写入的文档块 flush 后保存"""
+        from src.knowledge.loader import KnowledgeLoader
+        from src.retrieval.hybrid_retriever import HybridRetriever
+        from src.retrieval.vector_store import VectorStore
+
+        kb = LocalKnowledgeBase(str(tmp_path / "knowledge"))
+        assert KnowledgeLoader(kb).load_sample_data()
+        store = VectorStore(str(tmp_path / "vectordb"), index_type="flat")
+        if store.collection is not None or store.embedding_model.model is not None:
+            pytest.skip("使用 ChromaDB 或嵌入模型，不经过简单向量化方法")
+        assert HybridRetriever(kb, store).index_knowledge_base()
+
+        assert kb.add_material(WritingMaterial(title="航天梦", content="火箭升空，探索浩瀚太空", category="科技",
+                                               difficulty_level=DifficultyLevel.MIDDLE))
+        reopened = VectorStore(str(tmp_path / "vectordb"), index_type="flat")
+        assert HybridRetriever(kb, reopened).index_knowledge_base()
+
+        assert len({len(vector) for vector in reopened._embeddings}) == 1
+        persisted = HybridRetriever.material_chunk(kb.list_materials()[0])
+        results = reopened.search(persisted.content, top_k=1)
+        assert results[0][0].id == persisted.id and results[0][1] > 0.9
+
+        # 增量写入的文档块在 flush() 后保存，重新打开时不用重新索引
+        retriever = HybridRetriever(kb, reopened)
+        chunk = HybridRetriever.material_chunk(WritingMaterial(
+            title="深海探索", content="潜水器下潜万米深海", category="科技", difficulty_level=DifficultyLevel.MIDDLE
+        ))
+        assert retriever.add_chunks([chunk])
+        assert retriever.flush()
+        assert chunk.id in VectorStore(str(tmp_path / "vectordb"), index_type="flat")._id_to_row
+
+    @pytest.mark.parametrize("quantization", ["none", "int8"])
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw", "auto"])
+    def test_memory_search_matches_brute_force(self, tmp_path, index_type, quantization):
+        """测试各检索方式与量化组合在增删改、过滤、保存和重新载入后与暴力检索结果一致"""
+        import numpy as np
+        from src.core.models import DocumentChunk
+        from src.retrieval import vector_store as vs
+
+        if index_type != "flat":
+            pytest.importorskip("faiss")
+        store = vs.VectorStore(str(tmp_path), quantization=quantization, index_type=index_type)
+        if store.collection is not None:
+            pytest.skip("已安装 chromadb，使用 ChromaDB 存储")
+
+        rng = np.random.default_rng(0)
+        reference = {}  # 文档块ID -> (归一化向量, 元数据)
+
+        def add(start, stop, version=0):
+            chunks, embeddings = [], []
+            for i in range(start, stop):
+                vector = rng.normal(size=32).astype(np.float32)
+                metadata = {"group": i % 7, "tags": [i % 2]}
+                chunks.append(DocumentChunk(id=f"doc_{i}", content=f"文档{i}-{version}", metadata=metadata,
+                                            source="test", chunk_index=i))
+                embeddings.append(vector.tolist())
+                reference[f"doc_{i}"] = (vector / np.linalg.norm(vector), metadata)
+            assert store.add_documents(chunks, embeddings=embeddings)
+
+        def check(target, queries):
+            # 近似检索和 int8 量化只要求召回率和分数接近，精确组合要求完全一致
+            exact = index_type == "flat" and quantization == "none"
+            for query in queries:
+                for filter_dict in (None, {"group": 3}, {"group": 3, "tags": [1]}):
+                    expected = sorted(
+                        ((float(vec @ query), doc_id) for doc_id, (vec, metadata) in reference.items()
+                         if not filter_dict or all(metadata[k] == v for k, v in filter_dict.items())),
+                        reverse=True
+                    )[:10]
+                    results = target.search("", top_k=10, filter_dict=filter_dict, query_embedding=query.tolist())
+                    ids = [chunk.id for chunk, _ in results]
+                    assert set(ids) <= reference.keys()
+                    if filter_dict:
+                        assert all(chunk.metadata["group"] == 3 for chunk, _ in results)
+                    expected_ids = [doc_id for _, doc_id in expected]
+                    if exact:
+                        assert ids == expected_ids
+                    else:
+                        assert len(set(ids) & set(expected_ids)) >= 0.9 * len(expected_ids)
+                    for chunk, score in results:
+                        assert score == pytest.approx(float(reference[chunk.id][0] @ query), abs=0.02)
+
+        queries = [rng.normal(size=32).astype(np.float32) for _ in range(3)]
+        queries = [q / np.linalg.norm(q) for q in queries]
+
+        add(0, vs.HNSW_AUTO_MIN_ROWS - 100)
+        # auto 模式在文档块数达到 HNSW_AUTO_MIN_ROWS 之前精确打分
+        assert store._use_hnsw() == (index_type == "hnsw")
+        check(store, queries)
+        add(vs.HNSW_AUTO_MIN_ROWS - 100, vs.HNSW_AUTO_MIN_ROWS + 200)
+        # 覆盖已有文档块
+        add(0, 50, version=1)
+        assert store._use_hnsw() == (index_type != "flat")
+        check(store, queries)
+        if index_type != "flat":
+            assert store._hnsw_index is not None
+        if quantization == "int8":
+            assert all(vector.dtype == np.int8 for vector in store._embeddings)
+            assert len(store._scales) == len(store._embeddings)
+
+        deleted = [f"doc_{i}" for i in range(0, 300, 3)]
+        assert store.delete_documents(deleted)
+        for doc_id in deleted:
+            del reference[doc_id]
+        check(store, queries)
+
+        assert store.persist()
+        reopened = vs.VectorStore(str(tmp_path), quantization=quantization, index_type=index_type)
+        assert reopened.get_collection_info()["document_count"] == len(reference)
+        check(reopened, queries)
+
+
+class TestEncodeBatcher:
+    """查询编码合并测试"""
+
+    def test_concurrent_queries_encoded_once(self):
+        """测试窗口内的并发查询整批编码一次，相同文本只编码一次"""
+        import asyncio
+        from src.retrieval.encode_batcher import EncodeBatcher
+
+        batches = []
+
+        def encode(texts):
+            batches.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+        async def main():
+            batcher = EncodeBatcher(encode, max_batch=8, max_wait=0.01)
+            return await asyncio.gather(batcher.encode("a"), batcher.encode("bb"), batcher.encode("a"))
+
+        assert asyncio.run(main()) == [[1.0], [2.0], [1.0]]
+        assert batches == [["a", "bb"]]
+
 
 class TestRAGSystem:
     """RAG系统测试"""
@@ -142,6 +705,23 @@ class TestRAGSystem:
         assert response.guidance is not None
         assert response.confidence_score >= 0.0
 
+    def test_process_request_async(self):
+        """测试异步处理请求"""
+        import asyncio
+        from src.core.models import RAGRequest
+
+        self.rag_system.initialize()
+        prompt = EssayPrompt(
+            title="测试题目",
+            essay_type=EssayType.NARRATIVE,
+            difficulty_level=DifficultyLevel.MIDDLE
+        )
+
+        response = asyncio.run(self.rag_system.aprocess_request(RAGRequest(prompt=prompt)))
+
+        assert response.guidance is not None
+        assert response.confidence_score >= 0.0
+
     def test_add_material(self):
         """测试添加素材"""
         self.rag_system.initialize()